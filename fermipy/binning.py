@@ -0,0 +1,263 @@
+import copy
+import numpy as np
+import astropy.io.fits as pyfits
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+
+
+def get_event_files(evfile):
+    """Return the list of FT1 files for an evfile parameter.  The
+    parameter can be a single FT1 file, a list of files, or a text
+    file (optionally prefixed with @) with one FT1 file per line."""
+
+    if isinstance(evfile, list):
+        return evfile
+
+    if evfile.startswith('@'):
+        evfile = evfile[1:]
+    elif evfile.endswith('.fits') or evfile.endswith('.fit') or \
+            evfile.endswith('.fits.gz'):
+        return [evfile]
+
+    try:
+        pyfits.getheader(evfile)
+        return [evfile]
+    except IOError:
+        return [line.strip() for line in open(evfile, 'r')
+                if line.strip()]
+
+
+def read_events(evfiles, columns=None, chunk_size=1000000):
+    """Generator over chunks of the EVENTS table of a list of FT1
+    files.  The files are opened with memory mapping such that only
+    the rows of the current chunk are read from disk.
+
+    Parameters
+    ----------
+
+    evfiles : list
+        List of FT1 files.
+
+    columns : list
+        Names of the columns to read.
+
+    chunk_size : int
+        Maximum number of events in each chunk.
+
+    Returns
+    -------
+
+    A dictionary of column arrays for each chunk.
+    """
+
+    if columns is None:
+        columns = ['RA', 'DEC', 'ENERGY']
+
+    for evfile in evfiles:
+
+        hdulist = pyfits.open(evfile, memmap=True)
+        try:
+            events = hdulist['EVENTS'].data
+            nevt = len(events) if events is not None else 0
+            for i in range(0, nevt, chunk_size):
+                yield dict([(c, np.array(events.field(c)[i:i + chunk_size]))
+                            for c in columns])
+        finally:
+            hdulist.close()
+
+
+class CountsCube(object):
+    """Counts cube with the same binning as the output of gtbin with
+    algorithm=ccube.  The spatial binning is defined by a 2D WCS with
+    npix x npix pixels and the energy binning by the edges of the
+    energy bins in log10(E/MeV).  The counts array has dimension
+    (nebins,npix,npix)."""
+
+    def __init__(self, wcs, npix, energies):
+        self._wcs = wcs
+        self._npix = npix
+        self._energies = np.array(energies)
+        self._counts = np.zeros((len(energies) - 1, npix, npix))
+
+        if 'GLON' in wcs.wcs.ctype[0]:
+            self._coordsys = 'GAL'
+        else:
+            self._coordsys = 'CEL'
+
+    @property
+    def counts(self):
+        return self._counts
+
+    @property
+    def wcs(self):
+        return self._wcs
+
+    @property
+    def energies(self):
+        return self._energies
+
+    def fill(self, ra, dec, energy):
+        """Add events to the counts cube.
+
+        Parameters
+        ----------
+
+        ra, dec : `~numpy.ndarray`
+            Celestial coordinates of the events in deg.
+
+        energy : `~numpy.ndarray`
+            Energies of the events in MeV.
+        """
+
+        # FT1 columns are single precision and are converted to
+        # double precision before projecting
+        ra = np.array(ra, dtype=float)
+        dec = np.array(dec, dtype=float)
+        energy = np.array(energy, dtype=float)
+
+        # FT1 coordinates are FK5 (J2000) as assumed by gtbin
+        if self._coordsys == 'GAL':
+            c = SkyCoord(ra, dec, unit=u.deg, frame='fk5').galactic
+            lon, lat = c.l.deg, c.b.deg
+        else:
+            lon, lat = ra, dec
+
+        xpix, ypix = self._wcs.wcs_world2pix(lon, lat, 0)
+
+        # Pixel i spans the interval [i-0.5,i+0.5) of the 0-based
+        # pixel coordinates
+        ix = np.floor(xpix + 0.5)
+        iy = np.floor(ypix + 0.5)
+        ie = np.digitize(np.log10(energy), self._energies) - 1
+
+        nebins = len(self._energies) - 1
+        m = ((ix >= 0) & (ix < self._npix) & (iy >= 0) & (iy < self._npix) &
+             (ie >= 0) & (ie < nebins) & np.isfinite(xpix) &
+             np.isfinite(ypix))
+
+        idx = (ie[m] * self._npix + iy[m].astype(int)) * self._npix + \
+            ix[m].astype(int)
+        self._counts += np.bincount(idx, minlength=self._counts.size).reshape(
+            self._counts.shape)
+
+
+def bin_events(evfiles, cubes, chunk_size=1000000):
+    """Fill a list of counts cubes with the events of a list of FT1
+    files.  The events are read once and binned into every cube.
+
+    Parameters
+    ----------
+
+    evfiles : list
+        List of FT1 files.
+
+    cubes : list
+        List of `~fermipy.binning.CountsCube` objects.
+
+    chunk_size : int
+        Number of events read at a time.
+    """
+
+    for evts in read_events(evfiles, ['RA', 'DEC', 'ENERGY'], chunk_size):
+        for c in cubes:
+            c.fill(evts['RA'], evts['DEC'], evts['ENERGY'])
+
+
+def read_gti(evfiles):
+    """Return the GTI table HDU of a list of FT1 files.  The GTIs of
+    multiple files are concatenated."""
+
+    tables = []
+    for evfile in evfiles:
+        hdulist = pyfits.open(evfile, memmap=True)
+        tables += [(copy.deepcopy(hdulist['GTI'].header),
+                    np.array(hdulist['GTI'].data))]
+        hdulist.close()
+
+    header = tables[0][0]
+    data = np.concatenate([t[1] for t in tables])
+    hdu = pyfits.BinTableHDU(data, header=header, name='GTI')
+    hdu.header['EXTNAME'] = 'GTI'
+    return hdu
+
+
+def copy_dss_keywords(src_header, dst_header):
+    """Copy the data subspace keywords (NDSKEYS, DSTYPn, DSUNIn,
+    DSVALn, DSREFn) describing the event selection from one header to
+    another."""
+
+    if 'NDSKEYS' not in src_header:
+        return
+
+    ndskeys = int(src_header['NDSKEYS'])
+    dst_header['NDSKEYS'] = ndskeys
+    for i in range(1, ndskeys + 1):
+        for k in ['DSTYP', 'DSUNI', 'DSVAL', 'DSREF']:
+            key = '%s%i' % (k, i)
+            if key in src_header:
+                dst_header[key] = src_header[key]
+
+
+def write_ccube(outfile, cube, evfiles):
+    """Write a counts cube with the layout of a gtbin ccube file:
+    primary image HDU with a 3D WCS, EBOUNDS table with energies in
+    keV, and the GTI table of the input FT1 files.  The data subspace
+    keywords of the EVENTS header are copied to every HDU.
+
+    Parameters
+    ----------
+
+    outfile : str
+        Path to the output file.
+
+    cube : `~fermipy.binning.CountsCube`
+        Counts cube.
+
+    evfiles : list
+        List of FT1 files from which the cube was filled.  Header
+        keywords describing the observation and the GTIs are copied
+        from these files.
+    """
+
+    energies = 10 ** cube.energies
+    nebins = len(energies) - 1
+
+    header = cube.wcs.to_header()
+    header['WCSAXES'] = 3
+    header['CTYPE3'] = 'Energy'
+    header['CRPIX3'] = 1.0
+    header['CRVAL3'] = energies[0]
+    header['CDELT3'] = energies[1] - energies[0]
+    header['CUNIT3'] = 'MeV'
+
+    evhdr = pyfits.getheader(evfiles[0], 'EVENTS')
+    for k in ['TELESCOP', 'INSTRUME', 'EQUINOX', 'RADECSYS', 'TIMESYS',
+              'MJDREFI', 'MJDREFF', 'TIMEUNIT', 'TIMEREF', 'DATE-OBS',
+              'DATE-END', 'TSTART', 'TSTOP']:
+        if k in evhdr:
+            header[k] = evhdr[k]
+
+    hdu_image = pyfits.PrimaryHDU(cube.counts.astype(np.float32),
+                                  header=header)
+
+    cols = [pyfits.Column(name='CHANNEL', format='I',
+                          array=np.arange(1, nebins + 1)),
+            pyfits.Column(name='E_MIN', format='1E', unit='keV',
+                          array=1E3 * energies[:-1]),
+            pyfits.Column(name='E_MAX', format='1E', unit='keV',
+                          array=1E3 * energies[1:])]
+    hdu_ebounds = pyfits.BinTableHDU.from_columns(cols, name='EBOUNDS')
+    for k in ['TELESCOP', 'INSTRUME']:
+        if k in evhdr:
+            hdu_ebounds.header[k] = evhdr[k]
+    hdu_ebounds.header['HDUCLASS'] = 'OGIP'
+    hdu_ebounds.header['HDUCLAS1'] = 'RESPONSE'
+    hdu_ebounds.header['HDUCLAS2'] = 'EBOUNDS'
+    hdu_ebounds.header['DETCHANS'] = nebins
+
+    hdu_gti = read_gti(evfiles)
+    for hdu in [hdu_image, hdu_ebounds, hdu_gti]:
+        copy_dss_keywords(evhdr, hdu.header)
+
+    hdulist = pyfits.HDUList([hdu_image, hdu_ebounds, hdu_gti])
+    hdulist.writeto(outfile, clobber=True)
@@ -0,0 +1,216 @@
+import numpy as np
+import scipy.optimize
+
+from fermipy.spectrum import create_spectrum
+
+
+def make_castro_cube(sed, npts=101):
+    """Build a likelihood cube (castro) from the normalization
+    profiles of an SED.  The profile in each energy bin is resampled
+    onto a grid of npts values of dfde consisting of zero followed by
+    logarithmically spaced values spanning the range of the profile.
+    If the profile was not evaluated at zero the likelihood at zero is
+    linearly extrapolated from the two lowest points of the profile.
+
+    Parameters
+    ----------
+
+    sed : dict
+        SED dictionary generated by GTAnalysis.sed with profile=True.
+
+    Returns
+    -------
+
+    castro : dict
+        Dictionary with the energy bin edges (emin, emax) in
+        log10(E/MeV), the power-law index used in each bin (index),
+        and 2D arrays of dfde and dlogLike with dimension (nbin,npts).
+    """
+
+    nbin = len(sed['lnlprofile'])
+    dfde = np.zeros((nbin, npts))
+    dlogLike = np.zeros((nbin, npts))
+
+    for i, lnlp in enumerate(sed['lnlprofile']):
+
+        x = np.array(lnlp['dfde'])
+        y = np.array(lnlp['dlogLike'])
+        isort = np.argsort(x)
+        x, y = x[isort], y[isort]
+
+        xpos = x[x > 0]
+        dfde[i, 1:] = np.logspace(np.log10(xpos[0]), np.log10(xpos[-1]),
+                                  npts - 1)
+        dlogLike[i] = np.interp(dfde[i], x, y)
+
+        if x[0] > 0 and len(x) > 1:
+            dlogLike[i, 0] = y[0] - x[0] * (y[1] - y[0]) / (x[1] - x[0])
+
+    return {'emin': np.array(sed['emin']),
+            'emax': np.array(sed['emax']),
+            'index': np.array(sed['index']),
+            'dfde': dfde,
+            'dlogLike': dlogLike}
+
+
+class CastroData(object):
+    """Likelihood cube of a source as a function of the normalization
+    in each energy bin.  This can be used to evaluate the likelihood
+    of an arbitrary spectral model and to fit spectral models to the
+    SED without rerunning the likelihood analysis."""
+
+    def __init__(self, emin, emax, index, dfde, dlogLike):
+        self._emin = np.array(emin)
+        self._emax = np.array(emax)
+        self._index = np.array(index)
+        self._dfde = np.array(dfde)
+        self._dlogLike = np.array(dlogLike)
+        self._ecenter = 0.5 * (self._emin + self._emax)
+
+        # Energy grid used to integrate the model flux in each bin
+        # and integral of the power-law with unit prefactor that
+        # defines the normalization in each bin
+        self._x = 10 ** np.linspace(self._emin, self._emax, 16).T
+        self._lnx = np.log(self._x)
+        y = self._x * (self._x / 10 ** self._ecenter[:, np.newaxis]) ** \
+            self._index[:, np.newaxis]
+        self._bin_norm = np.trapz(y, self._lnx, axis=1)
+
+    @staticmethod
+    def create_from_sed(sed):
+        """Create a CastroData object from an SED dictionary."""
+
+        castro = sed.get('castro', None)
+        if castro is None:
+            castro = make_castro_cube(sed)
+
+        return CastroData(castro['emin'], castro['emax'], castro['index'],
+                          castro['dfde'], castro['dlogLike'])
+
+    @property
+    def nbins(self):
+        return len(self._emin)
+
+    def __call__(self, dfde):
+        return self.lnl(dfde)
+
+    def lnl(self, dfde):
+        """Evaluate the summed log-likelihood for a vector of dfde
+        values (one per energy bin).  The profile in each bin is
+        interpolated linearly and extrapolated from its end points."""
+
+        dfde = np.array(dfde, ndmin=1)[:, np.newaxis]
+        x = self._dfde
+        y = self._dlogLike
+
+        # Index of the grid segment used for interpolation.  Values
+        # outside the grid are extrapolated from the end segments.
+        npts = x.shape[1]
+        i0 = np.clip(np.sum(x <= dfde, axis=1) - 1, 0, npts - 2)
+        i1 = i0 + 1
+        ib = np.arange(self.nbins)
+
+        x0, x1 = x[ib, i0], x[ib, i1]
+        y0, y1 = y[ib, i0], y[ib, i1]
+        v = y0 + (dfde[:, 0] - x0) * (y1 - y0) / (x1 - x0)
+        return np.sum(v)
+
+    def model_dfde(self, spectrum):
+        """Compute the dfde in each bin that would give the same
+        integral flux as the given spectral model."""
+
+        flux = np.trapz(spectrum.dfde(self._x) * self._x, self._lnx, axis=1)
+        return flux / self._bin_norm
+
+    def fit_spectrum(self, spectrum_type, p0=None, scale=1000.):
+        """Fit a spectral model to the likelihood cube.
+
+        Parameters
+        ----------
+
+        spectrum_type : str
+            Name of the spectral model (PowerLaw, LogParabola,
+            PLSuperExpCutoff).
+
+        p0 : list
+            Initial parameter values.  If None the normalization is
+            initialized from the peak of the likelihood profile in the
+            bin closest to scale.
+
+        scale : float
+            Reference energy in MeV.
+
+        Returns
+        -------
+
+        fit : dict
+            Dictionary with the spectrum type, best-fit parameters
+            and log-likelihood.
+        """
+
+        spec = create_spectrum(spectrum_type, p0, scale)
+        log_params = spec.log_params
+        p0 = np.array(spec.params)
+
+        if p0[0] == spec.defaults[0]:
+            ibin = np.argmin(np.abs(self._ecenter - np.log10(scale)))
+            imax = np.argmax(self._dlogLike[ibin])
+            p0[0] = max(self._dfde[ibin][imax], self._dfde[ibin][1])
+
+        x0 = np.array(p0)
+        x0[log_params] = np.log10(x0[log_params])
+
+        def fn(x):
+            p = np.array(x)
+            p[log_params] = 10 ** p[log_params]
+            s = create_spectrum(spectrum_type, p, scale)
+            return -self.lnl(self.model_dfde(s))
+
+        r = scipy.optimize.minimize(fn, x0, method='Powell',
+                                    options={'xtol': 1E-4, 'ftol': 1E-6})
+
+        params = np.array(r.x)
+        params[log_params] = 10 ** params[log_params]
+
+        return {'SpectrumType': spectrum_type,
+                'param_names': spec.param_names,
+                'params': params,
+                'scale': scale,
+                'logLike': -r.fun}
+
+    def fit_spectra(self, spectrum_types=None, scale=1000.):
+        """Fit a list of spectral models to the likelihood cube.
+        Returns a dictionary of fit results keyed by spectrum type.
+        The test statistic of each model relative to the PowerLaw fit
+        is stored under ts_powerlaw."""
+
+        if spectrum_types is None:
+            spectrum_types = ['PowerLaw', 'LogParabola', 'PLSuperExpCutoff']
+
+        o = {}
+        for t in spectrum_types:
+            o[t] = self.fit_spectrum(t, scale=scale)
+
+            # Refit starting from the parameters of the PowerLaw model
+            # to avoid local minima
+            if t == 'PowerLaw' or not 'PowerLaw' in o:
+                continue
+
+            norm, index = o['PowerLaw']['params']
+            if t == 'LogParabola':
+                p0 = [norm, -index, 0.0]
+            elif t == 'PLSuperExpCutoff':
+                p0 = [norm, index, 10 ** self._emax[-1], 1.0]
+            else:
+                continue
+
+            r = self.fit_spectrum(t, p0=p0, scale=scale)
+            if r['logLike'] > o[t]['logLike']:
+                o[t] = r
+
+        if 'PowerLaw' in o:
+            for t in spectrum_types:
+                o[t]['ts_powerlaw'] = 2.0 * (o[t]['logLike'] -
+                                             o['PowerLaw']['logLike'])
+
+        return o
@@ -67,6 +67,12 @@ gtlike = {
     'resample'      : (True,'',bool),
     'srcmap'        : (None,'',str),
     'bexpmap'       : (None,'',str),
+    'setup_nproc'   : (1,'Number of processes used to run the pre-processing '
+                       '(gtselect, gtltcube, gtbin, gtexpcube2, gtsrcmaps) '
+                       'of the analysis components in setup.',int),
+    'setup_nthreads': (1,'Number of threads used to run the independent steps '
+                       '(e.g. gtbin and gtexpcube2) of the setup pipeline of '
+                       'each analysis component concurrently.',int),
     }
 
 # Options for binning.
@@ -81,7 +87,11 @@ binning = {
     'binsz'      : (0.1,'Set the bin size in degrees.',float),
     'binsperdec' : (8,'Set the number of energy bins per decade.',float),
     'enumbins'   : (None,'Number of energy bins.  If none this will be inferred from energy '
-                    'range and binsperdec parameter.',int)
+                    'range and binsperdec parameter.',int),
+    'binner'     : ('gtbin','Method used to generate the counts cube.  With gtbin the '
+                    'cube is generated by running gtbin.  With numpy the events '
+                    'are read in chunks from the selected FT1 file and binned in '
+                    'python.',str),
     }
 
 # Options related to I/O and output file bookkeeping
@@ -91,7 +101,26 @@ fileio = {
     'workdir'      : (None,'Override the working directory.',str),
     'logfile'      : (None,'',str),
     'savefits'     : (True,'Save intermediate FITS data products.',bool),
+    'mapstore_size': (512.0,'Maximum size in MB of the model maps held in '
+                      'memory.  Maps in excess of this size are written to '
+                      'the working directory or to a temporary directory '
+                      'if savefits is false.',float),
     'usescratch'   : (False,'Perform analysis in a temporary working directory.',bool),
+    'product_cache': (None,'Path to a directory with a cache of ScienceTools '
+                      'data products (ltcubes, counts cubes, exposure cubes, '
+                      'source maps) that can be shared between analyses.  '
+                      'Products are keyed by the tool parameters and the '
+                      'fingerprints of the input files.  If none the cache '
+                      'is disabled.',str),
+    'product_cache_size': (None,'Maximum size in MB of the product cache.  When '
+                           'this size is exceeded the least recently used '
+                           'products are removed.  If none the size of the '
+                           'cache is unbounded.',float),
+    'product_cache_link': (None,'Create symbolic links to cached products in the '
+                           'working directory instead of copies.  If none '
+                           'products are linked only when product_cache_size '
+                           'is not set.  Linked products are never evicted '
+                           'from the cache.',bool),
     }
 
 logging = {
@@ -107,6 +136,42 @@ optimizer = {
     'tol'              : (1E-4,'Set the optimizer tolerance.',float),
     'retries'          : (3,'Set the number of times to retry the fit.',int),
     'min_fit_quality'  : (3,'Set the minimum fit quality.',int),
+    'ts_method'        :
+    ('likelihood','Method used to compute the TS of free sources after a '
+     'fit.  With likelihood the TS is computed from the change in '
+     'likelihood when the source is removed.  With approx the TS is '
+     'estimated from the normalization and its error in the covariance '
+     'matrix of the fit.',str),
+    'cascade'          :
+    (None,'List of optimizer stages used by fit.  Each element is a '
+     'dictionary with the optimizer name (optimizer) and tolerance (tol) '
+     'of the stage, e.g. [{optimizer: DRMNFB, tol: 1E-2}, '
+     '{optimizer: MINUIT}].  Stages run in sequence starting from the '
+     'result of the previous stage and only the last stage computes the '
+     'covariance matrix.  When the covariance matrix is not needed the '
+     'remaining stages are skipped once a stage converges with quality 3.  '
+     'If None a single fit with optimizer is run.',
+     list),
+    'backend'          :
+    ('pylike','Likelihood backend used by fit.  With numpy the free '
+     'spectral parameters are fit with a NumPy implementation of the binned '
+     'Poisson likelihood using the source maps of the sources.  Only '
+     'normalizations and the parameters of PowerLaw, LogParabola, and '
+     'PLSuperExpCutoff models are supported.  Fits with other free '
+     'parameters fall back to pyLikelihood.',str),
+    'nproc'            :
+    (1,'Number of worker processes used to evaluate the likelihood of the '
+     'analysis components.  Each worker holds a copy of a subset of the '
+     'components and only the parameter values and free flags are sent on '
+     'each evaluation.  This applies only to direct evaluations of the '
+     'likelihood (e.g. likelihood scans and TS evaluations).  Fits with '
+     'the pyLikelihood optimizers (MINUIT, NewMinuit) evaluate the '
+     'components serially and see no speedup.  With the numpy backend the '
+     'components are evaluated in threads.',int),
+    'fit_cache_size'   :
+    (16,'Maximum number of fit results cached by fit.  A fit is skipped '
+     'when the parameters, free parameters, and energy range of the model '
+     'match those of a cached fit.  Set to 0 to disable the cache.',int),
     'verbosity'        : (0,'',int)
     }
 
@@ -117,7 +182,13 @@ mc = { }
 roiopt = {
     'npred_threshold'          : (1.0,'',float),
     'npred_frac'               : (0.95,'',float),
-    'shape_ts_threshold'       : (100.0,'',float)
+    'shape_ts_threshold'       : (100.0,'',float),
+    'norm_method'              :
+        ('fit','Method used to refit the normalizations of sources in the '
+         'second stage of optimize.  With fit the normalization of each '
+         'source is refit in turn with pyLikelihood.  With joint the '
+         'normalizations of all sources are fit simultaneously with a '
+         'Newton solver on the model counts cubes of the sources.',str),
     }
 
 #
@@ -125,10 +196,47 @@ residmap = {
     'models'                   : (None,'',list),
     }
 
+# Options for likelihood profiles
+profile = {
+    'method'                   :
+        ('pylike','Method for computing likelihood profiles of source '
+         'normalizations when the background is fixed.  With pylike the '
+         'likelihood is evaluated with pyLikelihood at each point of the '
+         'profile.  With vector the counts and model cubes are extracted '
+         'once and the profile is computed with a vectorized Poisson '
+         'likelihood.',str),
+    'adaptive'                 :
+        (False,'Choose the points of normalization profiles adaptively.  '
+         'The likelihood is only evaluated at the points needed to locate '
+         'the maximum and the 1-sigma and 95% CL crossings.  Ignored when '
+         'method is vector and the background is fixed.',bool),
+    'tol'                      :
+        (0.01,'Tolerance for adaptive profiles.  This sets the precision '
+         'of the crossings in delta-logLikelihood and in units of the '
+         'normalization error.',float),
+    'nproc'                    :
+        (1,'Number of processes used to evaluate reoptimized profiles.  '
+         'With nproc > 1 the branches of the profile above and below the '
+         'best-fit value are evaluated in separate processes.',int),
+    'lazy'                     :
+        (True,'Defer the computation of the likelihood profiles and upper '
+         'limits of sources until they are first accessed or the ROI is '
+         'written with write_roi.  Deferred fields that have not been '
+         'computed are evaluated before sources are added to or deleted '
+         'from the model.',bool),
+    'min_ts'                   :
+        (None,'Minimum TS of sources for which deferred upper limits and '
+         'profiles are computed by write_roi.  If None these are computed '
+         'for all sources with free parameters.',float),
+    }
+
 # Options for SED analysis
 sed = {
     'bin_index'                : (2.0,'',float),
-    'use_local_index'          : (False,'',bool)
+    'use_local_index'          : (False,'',bool),
+    'nproc'                    :
+        (1,'Number of worker processes used to fit the SED energy bins.',
+         int),
     }
 
 # Options for extension analysis
@@ -140,14 +248,45 @@ extension = {
     'width_nstep'              : (21,'',int),
     'save_templates'           : (False,'',bool),
     'fix_background'           : (False,'',bool),
-    'save_model_map'           : (False,'',bool),    
+    'save_model_map'           : (False,'',bool),
+    'method'                   :
+        ('scan','Method for fitting the source extension.  With scan the '
+         'likelihood is evaluated at every width in the scan vector.  '
+         'With brent the likelihood is maximized with a bounded 1D '
+         'optimizer in log(width).',str),
+    'nproc'                    :
+        (1,'Number of worker processes used for the width scan.',int),
+    }
+
+# Options for TS map analysis
+tsmap = {
+    'index'                    :
+        ([2.0],'Spectral index of the power-law test source.  If more than '
+         'one index is given a TS cube with one plane per index is '
+         'generated in a single pass.',list),
+    'max_kernel_radius'        :
+        (3.0,'Maximum radius in degrees of the test source kernel used '
+         'when generating a TS cube.',float),
     }
 
 # Options for localization analysis
 localize = {
     'nstep'                    : (10,'',int),
     'dtheta_max'               : (0.05,'',float),
-    'update'                   : (False,'',bool)
+    'update'                   : (False,'',bool),
+    'method'                   :
+        ('grid','Localization method.  With grid the likelihood is '
+         'evaluated on an nstep x nstep grid of positions and fit with a '
+         'parabola.  With newton the likelihood is maximized directly '
+         'with quasi-Newton steps in position.',str),
+    'max_iter'                 :
+        (5,'Maximum number of iterations when method is newton.',int),
+    'tol'                      :
+        (0.002,'Convergence tolerance in degrees on the position when '
+         'method is newton.',float),
+    'nproc'                    :
+        (1,'Number of worker processes used when localizing multiple '
+         'sources with localize_sources.',int),
     }
 
 # Options for anlaysis
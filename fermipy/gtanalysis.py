@@ -3,11 +3,14 @@ import re
 import sys
 import copy
 import glob
+import hashlib
 import shutil
+import time
 import yaml
 import numpy as np
 import tempfile
 import logging
+from collections import OrderedDict
 import scipy
 import scipy.optimize
 from scipy.interpolate import UnivariateSpline
@@ -33,6 +36,16 @@ import fermipy.utils as utils
 import fermipy.plotting as plotting
 import fermipy.irfs as irfs
 from fermipy.residmap import ResidMapGenerator
+from fermipy.tsmap import TSCubeGenerator
+from fermipy.parallel import fork_map
+from fermipy.mapstore import MapStore
+from fermipy.pipeline import Pipeline
+from fermipy.binning import CountsCube, bin_events, write_ccube
+from fermipy.binning import get_event_files
+from fermipy.products import ProductCache, ProductManifest
+from fermipy.products import gti_fingerprint
+from fermipy.likelihood import poisson_lnl_norm_scan, fit_norms
+from fermipy.castro import make_castro_cube
 from fermipy.utils import mkdir, merge_dict, tolist, create_wcs
 from fermipy.utils import valToBinBounded, valToEdge, Map
 from fermipy.roi_model import ROIModel, Source
@@ -84,6 +97,16 @@ index_parameters = {
     'FileFunction': [],
 }
 
+# Spectral parameters and reference energy parameter of the spectral
+# models supported by the numpy likelihood backend (see
+# fermipy.spectrum)
+numpy_spectrum_parameters = {
+    'PowerLaw': (['Prefactor', 'Index'], 'Scale'),
+    'LogParabola': (['norm', 'alpha', 'beta'], 'Eb'),
+    'PLSuperExpCutoff': (['Prefactor', 'Index1', 'Cutoff', 'Index2'],
+                         'Scale'),
+}
+
 
 def parabola((x, y), amplitude, x0, y0, sx, sy, theta):
     cth = np.cos(theta)
@@ -97,6 +120,137 @@ def parabola((x, y), amplitude, x0, y0, sx, sy, theta):
     return np.ravel(v)
 
 
+def cov_to_ellipse(cov):
+    """Convert a 2x2 covariance matrix into the (sigmax, sigmay,
+    theta) parameterization of the error ellipse used by
+    parabola."""
+
+    w, v = np.linalg.eigh(cov)
+    theta = -np.arctan2(v[1, 0], v[0, 0])
+    return np.sqrt(w[0]), np.sqrt(w[1]), theta
+
+
+def maximize_2d_newton(fn, x0, step, max_iter=5, tol=1E-3, max_dist=None,
+                       max_halving=5):
+    """Maximize a function of two variables with a sequence of
+    quasi-Newton steps.  At each iteration the gradient and Hessian
+    are estimated from a 6-point finite-difference stencil around the
+    current position.  Steps are restricted to a trust region with a
+    radius of 4 x step and positions are constrained to be within
+    max_dist of the starting point.  A step is only accepted if it
+    does not decrease the function value.  Otherwise the step is
+    halved up to max_halving times before the iteration stops.
+
+    Parameters
+    ----------
+
+    fn : function
+        Function of two variables to be maximized.
+
+    x0 : array
+        Starting position.
+
+    step : float
+        Step size of the finite-difference stencil.
+
+    max_iter : int
+        Maximum number of iterations.
+
+    tol : float
+        Iteration stops when the length of an accepted step is less
+        than this value.
+
+    max_dist : float
+        Maximum distance of the position from x0.
+
+    max_halving : int
+        Maximum number of times a step is halved.
+
+    Returns
+    -------
+
+    o : dict
+        Dictionary with the best-fit position (x), the function
+        value at that position (fval), the Hessian at that position
+        (hessian) and the list of all evaluated points (xvals,
+        fvals).
+    """
+
+    x0 = np.array(x0, dtype=float)
+    h = step
+    xvals = []
+    fvals = []
+
+    def eval_fn(t):
+        v = fn(t[0], t[1])
+        xvals.append(np.array(t))
+        fvals.append(v)
+        return v
+
+    stencil = np.array([[h, 0.0], [-h, 0.0],
+                        [0.0, h], [0.0, -h], [h, h]])
+
+    def derivs(x, f0):
+        f = [f0] + [eval_fn(x + d) for d in stencil]
+        grad = np.array([(f[1] - f[2]) / (2 * h), (f[3] - f[4]) / (2 * h)])
+        hess = np.zeros((2, 2))
+        hess[0, 0] = (f[1] - 2 * f[0] + f[2]) / h ** 2
+        hess[1, 1] = (f[3] - 2 * f[0] + f[4]) / h ** 2
+        hess[0, 1] = hess[1, 0] = (f[5] - f[1] - f[3] + f[0]) / h ** 2
+        return grad, hess
+
+    x = x0.copy()
+    f0 = eval_fn(x)
+    grad, hess = derivs(x, f0)
+    xhess = x.copy()
+    niter = 0
+
+    for niter in range(1, max_iter + 1):
+
+        if np.all(np.linalg.eigvalsh(hess) < 0):
+            dx = -np.linalg.solve(hess, grad)
+        else:
+            # Fall back to a gradient step if the Hessian is not
+            # negative definite
+            dx = grad / max(np.sqrt(np.sum(grad ** 2)), 1E-10) * h
+
+        dx_norm = np.sqrt(np.sum(dx ** 2))
+        if dx_norm > 4 * h:
+            dx *= 4 * h / dx_norm
+
+        if max_dist is not None:
+            r = np.sqrt(np.sum((x + dx - x0) ** 2))
+            if r > max_dist:
+                dx = x0 + (x + dx - x0) * max_dist / r - x
+
+        # Halve the step until the function value does not decrease
+        xnew = x + dx
+        fnew = eval_fn(xnew)
+        nhalving = 0
+        while fnew < f0 and nhalving < max_halving:
+            dx *= 0.5
+            xnew = x + dx
+            fnew = eval_fn(xnew)
+            nhalving += 1
+
+        if fnew < f0:
+            break
+
+        x, f0 = xnew, fnew
+        if np.sqrt(np.sum(dx ** 2)) < tol:
+            break
+
+        grad, hess = derivs(x, f0)
+        xhess = x.copy()
+
+    # Evaluate the Hessian at the final position
+    if np.any(x != xhess):
+        grad, hess = derivs(x, f0)
+
+    return {'x': x, 'fval': f0, 'hessian': hess, 'niter': niter,
+            'xvals': np.array(xvals), 'fvals': np.array(fvals)}
+
+
 def interpolate_function_min(x, y):
     sp = scipy.interpolate.splrep(x, y, k=2, s=0)
     fn = lambda t: scipy.interpolate.splev(t, sp, der=1)
@@ -266,11 +420,19 @@ class GTAnalysis(fermipy.config.Configurable):
                 'sed': defaults.sed,
                 'extension': defaults.extension,
                 'localize': defaults.localize,
+                'tsmap': defaults.tsmap,
+                'profile': defaults.profile,
                 'roiopt': defaults.roiopt,
                 'run': defaults.run,
                 'plotting': defaults.plotting,
                 'components': (None, '', list)}
 
+    # Source fields derived from the likelihood profile that are
+    # deferred when profile.lazy is set
+    lazy_src_keys = ['flux_ul95', 'flux100_ul95', 'flux1000_ul95',
+                     'flux10000_ul95', 'eflux_ul95', 'eflux100_ul95',
+                     'eflux1000_ul95', 'eflux10000_ul95', 'lnlprofile']
+
     def __init__(self, config, **kwargs):
 
         #        if not isinstance(config,dict):
@@ -289,9 +451,12 @@ class GTAnalysis(fermipy.config.Configurable):
         else:
             raise Exception('Save directory not defined.')
 
-        # put pfiles into savedir
-        os.environ['PFILES'] = \
-            self._savedir + ';' + os.environ['PFILES'].split(';')[-1]
+        # put pfiles into savedir.  A PFILES without a system path is
+        # kept as the system path such that its parameter files can
+        # still be found.
+        pfiles = os.environ.get('PFILES', '').split(';')[-1]
+        os.environ['PFILES'] = self._savedir + (';' + pfiles if pfiles
+                                                else '')
 
         if self.config['fileio']['logfile'] is None:
             self._config['fileio']['logfile'] = os.path.join(self._savedir,
@@ -317,6 +482,21 @@ class GTAnalysis(fermipy.config.Configurable):
         else:
             self._config['fileio']['workdir'] = self._savedir
 
+        self._model_maps = MapStore(self.config['fileio']['workdir'],
+                                    self.config['fileio']['mapstore_size'],
+                                    logger=self.logger,
+                                    savefits=self.config['fileio']['savefits'])
+
+        # Cache of fit results keyed by the state of the model
+        self._fit_cache = OrderedDict()
+        self._fit_cache_stats = {'hits': 0, 'misses': 0}
+        self._fit_results_key = None
+        self._erange = None
+
+        # Number of fits before which the fixed source model was
+        # rebuilt
+        self._fixed_model_rebuilds = 0
+
         # Setup the ROI definition
         self._roi = ROIModel.create(self.config['selection'],
                                     self.config['model'],
@@ -398,6 +578,11 @@ class GTAnalysis(fermipy.config.Configurable):
         """Return the ROI object."""
         return self._roi
 
+    @property
+    def model_maps(self):
+        """Return the store of model maps generated by the analysis."""
+        return self._model_maps
+
     @property
     def like(self):
         """Return the global likelihood object."""
@@ -502,9 +687,14 @@ class GTAnalysis(fermipy.config.Configurable):
             src = src_dict
             self.roi.load_source(src)
 
+        self._flush_lazy_sources()
+
         for c in self.components:
             c.add_source(name, src_dict, free=free)
 
+        self._clear_fit_cache()
+        self._stop_workers()
+
         if self._like is None: return
 
         if self.config['gtlike']['edisp'] and not src.name in \
@@ -530,6 +720,9 @@ class GTAnalysis(fermipy.config.Configurable):
 
         self.logger.info('Deleting source %s' % name)
 
+        self._flush_lazy_sources(exclude=[
+            self.roi.get_source_by_name(name, True).name])
+
         # STs require a source to be freed before deletion
         normPar = self.like.normPar(name)
         if not normPar.isFree():
@@ -541,6 +734,73 @@ class GTAnalysis(fermipy.config.Configurable):
         src = self.roi.get_source_by_name(name, True)
         self.roi.delete_sources([src])
         self.like.model = self.like.components[0].model
+        self._clear_fit_cache()
+        self._stop_workers()
+
+    def move_source(self, name, skydir):
+        """Move a source to a new position.  In contrast to
+        delete_source/add_source this only replaces the direction and
+        the in-memory source map of the source in each analysis
+        component and does not regenerate any files.  This is intended
+        for scanning the position of a test source (e.g. in localize or
+        tsmap) where the model only needs to be evaluated at each
+        position.  Note that the source map file and spatial templates
+        are not updated and will be out of date until the source is
+        re-added.  The new source map is an approximation that uses
+        the PSF and exposure at the ROI center (see
+        GTBinnedAnalysis.move_source).
+
+        Parameters
+        ----------
+
+        name : str
+            Source name.
+
+        skydir : `~astropy.coordinates.SkyCoord` or list
+            New source position.  A list is interpreted as (RA,DEC)
+            in degrees.
+
+        """
+
+        src = self.roi.get_source_by_name(name, True)
+        if src.diffuse:
+            raise Exception('Cannot move diffuse source %s.' % src.name)
+
+        src.set_position(skydir)
+        for c in self.components:
+            c.move_source(src.name, src.skydir)
+        self._clear_fit_cache()
+        if self._like is not None:
+            self._like.update_source_map(src.name)
+
+    def set_spatial_model(self, name, spatial_model, spatial_width=None):
+        """Change the spatial model or width of a source in place.  As
+        with move_source only the in-memory source map is updated.
+        This is intended for scanning the extension of a test source.
+
+        Parameters
+        ----------
+
+        name : str
+            Source name.
+
+        spatial_model : str
+            Spatial model (e.g. GaussianSource, DiskSource).  The
+            spatial type of the new model must be the same as the
+            current one.
+
+        spatial_width : float
+            Width parameter of the spatial model in degrees.
+
+        """
+
+        src = self.roi.get_source_by_name(name, True)
+        src.set_spatial_model(spatial_model, spatial_width)
+        for c in self.components:
+            c.set_spatial_model(src.name, spatial_model, spatial_width)
+        self._clear_fit_cache()
+        if self._like is not None:
+            self._like.update_source_map(src.name)
 
     def _create_component_configs(self):
         configs = []
@@ -625,7 +885,7 @@ class GTAnalysis(fermipy.config.Configurable):
         else:
             self.logger.error('Working directory does not exist.')
 
-    def setup(self, xmlfile=None, init_sources=True):
+    def setup(self, xmlfile=None, init_sources=True, nproc=None):
         """Run pre-processing step for each analysis component and
         construct a joint likelihood object.  This will run everything
         except the likelihood optimization: data selection (gtselect,
@@ -641,17 +901,36 @@ class GTAnalysis(fermipy.config.Configurable):
         xmlfile : str
            Override the XML model file.
 
+        nproc : int
+           Number of processes used to run the pre-processing of the
+           analysis components (defaults to gtlike.setup_nproc).  With
+           nproc > 1 the data products of each component are generated
+           in a separate process and the log output of each component
+           is written to setup_<name>.log in the output directory.
+
         """
 
         self.logger.info('Running setup')
 
+        if nproc is None:
+            nproc = self.config['gtlike']['setup_nproc']
+
         # Run data selection step
         rm = self._roi_model
 
+        self._clear_fit_cache()
+        self._stop_workers()
+
+        if nproc > 1 and len(self._components) > 1:
+            self._run_preprocessing(xmlfile, nproc)
+
+        # The joint likelihood is assembled after the data products of
+        # all components have been generated
         self._like = SummedLikelihood()
         for i, c in enumerate(self._components):
             c.setup(xmlfile=xmlfile)
             self._like.addComponent(c.like)
+        self._like.set_nproc(self.config['optimizer']['nproc'])
 
         self._ccube_file = os.path.join(self.config['fileio']['workdir'],
                                         'ccube.fits')
@@ -677,14 +956,63 @@ class GTAnalysis(fermipy.config.Configurable):
 
         if not init_sources: return
 
+        ts = self.ts_all()
         for name in self.like.sourceNames():
-            self._init_source(name)
+            self._init_source(name, ts=ts.get(name, None))
 
         self._update_roi()
 
         self.logger.info('Finished setup')
 
-    def _init_source(self, name):
+    def _run_preprocessing(self, xmlfile, nproc):
+        """Generate the data products of all components in parallel
+        with a pool of nproc forked processes.  The log output of
+        each process is redirected to a separate file for each
+        component."""
+
+        self.logger.info('Running pre-processing of %i components with '
+                         '%i processes' % (len(self._components), nproc))
+
+        logfiles = [os.path.join(self._savedir, 'setup_%s.log' % c.name)
+                    for c in self._components]
+
+        def run_component(i):
+            c = self._components[i]
+
+            # Handlers are replaced only in the forked copy of the
+            # logger
+            fh = logging.FileHandler(logfiles[i], mode='w')
+            fh.setFormatter(logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                '%Y-%m-%d %H:%M:%S'))
+            c.logger.handlers = [fh]
+
+            # Each process uses a private copy of the parameter files
+            # since concurrent runs of the same tool would otherwise
+            # write to the same file
+            pfiles = tempfile.mkdtemp(prefix='pfiles_%s_' % c.name,
+                                      dir=self._savedir)
+            pfiles_env = os.environ.get('PFILES', '')
+            syspfiles = pfiles_env.split(';')[-1] if ';' in pfiles_env \
+                else ''
+            os.environ['PFILES'] = pfiles + (';' + syspfiles if syspfiles
+                                             else '')
+
+            t0 = time.time()
+            try:
+                c.run_preprocessing(xmlfile)
+            finally:
+                shutil.rmtree(pfiles, ignore_errors=True)
+            return time.time() - t0
+
+        times = fork_map(run_component, range(len(self._components)), nproc)
+
+        for c, t, logfile in zip(self._components, times, logfiles):
+            self.logger.info('Finished pre-processing for Analysis '
+                             'Component %s in %.1f s (log: %s)'
+                             % (c.name, t, logfile))
+
+    def _init_source(self, name, ts=None):
 
         src = self.roi.get_source_by_name(name, True)
         src.update_data({'sed': None, 'extension': None,
@@ -714,11 +1042,82 @@ class GTAnalysis(fermipy.config.Configurable):
             src['offset_glat'] = offset_gal[0, 1]
             src['offset'] = self.roi.skydir.separation(src.skydir).deg
 
-        src.update_data(self.get_src_model(name, False))
+        self._update_src_data(src, ts=ts)
         return src
 
+    def _update_src_data(self, src, ts=None):
+        """Update the fit results of a source from the current model.
+        If profile.lazy is set the upper limits and likelihood profile
+        of the source are computed on first access or when the ROI is
+        written.  These are evaluated with the parameters and
+        covariance matrix of the current model.  If ts is not None it
+        is used as the TS of the source."""
+
+        if not self.config['profile']['lazy']:
+            src.set_lazy()
+            src.update_data(self.get_src_model(src.name, ts=ts))
+            return
+
+        name = src.name
+        src_dict = self.get_src_model(name, lazy=True, ts=ts)
+        src.update_data(src_dict)
+        if not self.get_free_source_params(name):
+            src.set_lazy()
+            return
+
+        state = self._save_fit(None, None, None)
+
+        def fn():
+            self.logger.debug('Computing deferred fields for %s' % name)
+            saved_state = self._save_fit(None, None, None)
+            self._restore_fit(state)
+            try:
+                self._update_src_profile(name, src_dict)
+            finally:
+                self._restore_fit(saved_state)
+            return dict([(k, src_dict[k]) for k in self.lazy_src_keys])
+
+        src.set_lazy(self.lazy_src_keys, fn)
+
+    def _flush_lazy_sources(self, exclude=None):
+        """Compute the deferred fields of all sources before a source
+        is added to or deleted from the model, since the parameters
+        saved for the deferred evaluation no longer match the model
+        afterwards.  Deferred fields of sources that do not pass the
+        selection in the profile configuration (and of the sources in
+        exclude) are discarded."""
+
+        if exclude is None:
+            exclude = []
+
+        for s in self.roi.sources:
+            if s.lazy and s.name in exclude:
+                s.set_lazy()
+
+        self._eval_lazy_sources()
+
+        for s in self.roi.sources:
+            if not s.lazy:
+                continue
+            self.logger.debug('Discarding deferred fields for %s' % s.name)
+            s.set_lazy()
+
+    def _eval_lazy_sources(self):
+        """Compute the deferred fields of all sources passing the
+        selection in the profile configuration."""
+
+        min_ts = self.config['profile']['min_ts']
+        for s in self.roi.sources:
+            if not s.lazy:
+                continue
+            if min_ts is not None and not s.data['ts'] >= min_ts:
+                continue
+            s.eval_lazy()
+
     def cleanup(self):
 
+        self._model_maps.close()
+
         if self.config['fileio']['workdir'] == self._savedir:
             return
         elif os.path.isdir(self.config['fileio']['workdir']):
@@ -740,6 +1139,8 @@ class GTAnalysis(fermipy.config.Configurable):
 
     def setEnergyRange(self, emin, emax):
         """Set the energy range of the analysis."""
+        self._erange = (emin, emax)
+        self._stop_workers()
         for c in self.components:
             c.setEnergyRange(emin, emax)
 
@@ -873,6 +1274,11 @@ class GTAnalysis(fermipy.config.Configurable):
         rsrc, srcs = self.roi.get_sources_by_position(self.roi.skydir,
                                                       distance, square=square)
 
+        # Flag changes are applied to all selected sources before the
+        # source parameters are synced
+        free_pars = self.get_free_params()
+        names = []
+
         if cuts is None: cuts = []
         for s, r in zip(srcs, rsrc):
             if not s.check_cuts(cuts): continue
@@ -884,7 +1290,8 @@ class GTAnalysis(fermipy.config.Configurable):
             if min_npred is not None and (
                 ~np.isfinite(npred) or npred < min_npred):
                 continue
-            self.free_source(s.name, free=free, pars=pars)
+            if self._set_source_free(s.name, free, pars, free_pars):
+                names += [s.name]
 
         for s in self.roi.diffuse_sources:
             #            if not s.check_cuts(cuts): continue
@@ -896,7 +1303,10 @@ class GTAnalysis(fermipy.config.Configurable):
             if min_npred is not None and (
                 ~np.isfinite(npred) or npred < min_npred):
                 continue
-            self.free_source(s.name, free=free, pars=pars)
+            if self._set_source_free(s.name, free, pars, free_pars):
+                names += [s.name]
+
+        self._sync_free_sources(names)
 
     def free_sources_by_position(self, free=True, pars=None,
                                  distance=None, square=False):
@@ -935,11 +1345,15 @@ class GTAnalysis(fermipy.config.Configurable):
 
         for c in self.components:
             c.like[name].src.set_edisp_flag(flag)
+        self._clear_fit_cache()
+        self._stop_workers()
 
     def scale_parameter(self, name, par, scale):
 
         idx = self.like.par_index(name, par)
         self.like[idx].setScale(self.like[idx].getScale() * scale)
+        self._clear_fit_cache()
+        self._stop_workers()
 
     def set_parameter(self, name, par, value, true_value=True, scale=None,
                       bounds=None):
@@ -952,6 +1366,8 @@ class GTAnalysis(fermipy.config.Configurable):
 
         if scale is not None:
             self.like[idx].setScale(scale)
+            self._clear_fit_cache()
+            self._stop_workers()
 
         if bounds is not None:
             self.like[idx].setBounds(*bounds)
@@ -977,10 +1393,19 @@ class GTAnalysis(fermipy.config.Configurable):
             Set a list of parameters to be freed/fixed for this source.  If
             none then all source parameters will be freed/fixed with the
             exception of those defined in the skip_pars list.
-            
+
         """
 
-        free_pars = self.get_free_params()
+        src = self.roi.get_source_by_name(name, True)
+        if self._set_source_free(src.name, free, pars,
+                                 self.get_free_params()):
+            self._sync_free_sources([src.name])
+
+    def _set_source_free(self, name, free, pars, free_pars):
+        """Set the free flags of the parameters of a source without
+        syncing the source.  free_pars is the array of free flags
+        returned by get_free_params and is updated in place.  Returns
+        True if any flag was changed."""
 
         # Find the source
         src = self.roi.get_source_by_name(name, True)
@@ -1016,7 +1441,7 @@ class GTAnalysis(fermipy.config.Configurable):
             par_indices.append(idx)
             par_names.append(p)
 
-        if len(par_names) == 0: return
+        if len(par_names) == 0: return False
 
         if free:
             self.logger.debug('Freeing parameters for %-22s: %s'
@@ -1027,7 +1452,21 @@ class GTAnalysis(fermipy.config.Configurable):
 
         for (idx, par_name) in zip(par_indices, par_names):
             self.like[idx].setFree(free)
-        self.like.syncSrcParams(name)
+            free_pars[idx] = free
+
+        return True
+
+    def _sync_free_sources(self, names):
+        """Sync the parameters of sources whose free flags were
+        changed.  The fixed source model of each component is not
+        rebuilt here but on the next call to fit or
+        model_counts_map."""
+
+        if not names:
+            return
+
+        for name in names:
+            self.like.syncSrcParams(name)
 
     #        freePars = self.like.freePars(name)
     #        if not free:
@@ -1103,6 +1542,74 @@ class GTAnalysis(fermipy.config.Configurable):
             name = self.roi.get_source_by_name(name, True).name
         return name
 
+    def ts_all(self, names=None, method=None):
+        """Compute the TS of a list of sources without reoptimizing
+        the model.  The free parameters of the model are saved once
+        and restored after all sources have been processed which is
+        considerably faster than evaluating the TS of each source
+        separately.
+
+        Parameters
+        ----------
+
+        names : list
+            List of source names.  If None the TS is computed for all
+            sources with free parameters.
+
+        method : str
+            Method used to compute the TS (likelihood or approx).
+            With approx the TS of sources with a free normalization
+            is estimated from the quadratic approximation of the
+            log-likelihood around the best-fit as (N/sigma_N)^2 where
+            sigma_N is the error on the normalization from the
+            covariance matrix of the last fit.  Sources without a
+            free normalization or without a covariance estimate are
+            evaluated with the likelihood method.  If None this is
+            taken from optimizer.ts_method.
+
+        Returns
+        -------
+
+        ts : dict
+            Dictionary of TS values keyed by source name.
+        """
+
+        if method is None:
+            method = self.config['optimizer']['ts_method']
+
+        if names is None:
+            names = [name for name in self.like.sourceNames()
+                     if self.get_free_source_params(name)]
+        else:
+            names = [self.get_source_name(name) for name in names]
+
+        o = {}
+        if method == 'approx':
+            o = self._ts_approx(names)
+        elif method != 'likelihood':
+            raise Exception('Unrecognized TS method: %s' % method)
+
+        names = [name for name in names if not name in o]
+        if names:
+            o.update(dict(zip(names, self.like.Ts_all(names))))
+
+        return o
+
+    def _ts_approx(self, names):
+        """Estimate the TS of sources from the error on their
+        normalization.  Returns a dictionary with the sources for
+        which an estimate could be computed."""
+
+        o = {}
+        for name in names:
+            par = self.like.normPar(name)
+            err = par.error()
+            if not par.isFree() or not err > 0:
+                continue
+            o[name] = max(par.getValue(), 0.0) ** 2 / err ** 2
+
+        return o
+
     def get_free_source_params(self, name):
         name = self.get_source_name(name)
         spectrum = self.like[name].src.spectrum()
@@ -1158,7 +1665,10 @@ class GTAnalysis(fermipy.config.Configurable):
         return maps
 
     def optimize(self, **kwargs):
-        """Iteratively optimize the ROI model."""
+        """Iteratively optimize the ROI model.  The TS values used to
+        select the sources whose shape parameters are refit are
+        computed with the method set by the ts_method keyword
+        (defaults to optimizer.ts_method)."""
 
         self.logger.info('Running ROI Optimization')
 
@@ -1173,6 +1683,10 @@ class GTAnalysis(fermipy.config.Configurable):
         shape_ts_threshold = kwargs.get('shape_ts_threshold',
                                         self.config['roiopt'][
                                             'shape_ts_threshold'])
+        ts_method = kwargs.get('ts_method',
+                               self.config['optimizer']['ts_method'])
+        norm_method = kwargs.get('norm_method',
+                                 self.config['roiopt']['norm_method'])
 
         # preserve free parameters
         free = self.get_free_params()
@@ -1194,10 +1708,11 @@ class GTAnalysis(fermipy.config.Configurable):
 
             if npred_frac > npred_frac_threshold: break
 
-        self.fit()
+        self.fit(ts_method=ts_method)
         self.free_sources(free=False)
 
         # Step through remaining sources and re-fit normalizations
+        norm_names = []
         for s in sorted(self.roi.sources, key=lambda t: t['Npred'],
                         reverse=True):
 
@@ -1208,14 +1723,21 @@ class GTAnalysis(fermipy.config.Configurable):
                     'Skipping %s with Npred %10.3f' % (s.name, s['Npred']))
                 continue
 
+            if norm_method == 'joint':
+                norm_names += [s.name]
+                continue
+
             self.logger.debug('Fitting %s Npred: %10.3f TS: %10.3f' % (
             s.name, s['Npred'], s['ts']))
             self.free_norm(s.name)
-            self.fit()
+            self.fit(ts_method=ts_method)
             self.logger.debug('Post-fit Results Npred: %10.3f TS: %10.3f' % (
             s['Npred'], s['ts']))
             self.free_norm(s.name, free=False)
 
+        if norm_names:
+            self._fit_norms(norm_names)
+
             # Refit spectral shape parameters for sources with TS >
             # shape_ts_threshold
         for s in sorted(self.roi.sources,
@@ -1227,7 +1749,7 @@ class GTAnalysis(fermipy.config.Configurable):
 
             self.logger.debug('Fitting shape %s TS: %10.3f' % (s.name, s['ts']))
             self.free_source(s.name)
-            self.fit()
+            self.fit(ts_method=ts_method)
             self.free_source(s.name, free=False)
 
         self.set_free_params(free)
@@ -1237,6 +1759,83 @@ class GTAnalysis(fermipy.config.Configurable):
         self.logger.info(
             'LogLike: %f Delta-LogLike: %f' % (logLike1, logLike1 - logLike0))
 
+    def _fit_norms(self, names):
+        """Simultaneously fit the normalizations of a list of sources
+        keeping all other model parameters fixed.  The model counts
+        cube of each source is extracted once and the normalizations
+        are solved for with fermipy.likelihood.fit_norms using only
+        the pixels where at least one of the sources has non-zero
+        model counts.  Sources with a normalization of zero are
+        evaluated at a reference value within their bounds to obtain
+        their model counts for unit normalization.  The best-fit
+        values are written back to the likelihood object with a
+        single sync and the parameters, Npred and TS of the fitted
+        sources are updated."""
+
+        names = [self.get_source_name(name) for name in names]
+        pars = []
+        for name in names:
+            idx = self.like.par_index(name, self.like.normPar(name).getName())
+            x0 = self.like[idx].getValue()
+            bounds = self.like.model[idx].getBounds()
+            xref = x0
+            if xref <= 0:
+                xref = min(max(1.0, bounds[0]), bounds[1])
+            if xref <= 0:
+                self.logger.warning('Skipping %s with normalization %g '
+                                    'and bounds %s' % (name, x0, bounds))
+                continue
+            elif xref != x0:
+                self.logger.debug('Evaluating %s at normalization %g' %
+                                  (name, xref))
+                self.like[idx] = xref
+            pars += [(name, idx, x0, xref, bounds)]
+
+        if not pars:
+            return
+
+        self.like.syncSrcParams()
+        self.logger.debug('Fitting normalizations of %i sources' % len(pars))
+
+        counts = []
+        bkg = []
+        models = [[] for p in pars]
+        for c in self.components:
+            mtot = np.ravel(c.model_counts_map().counts)
+            msrc = [np.ravel(c.model_counts_map(p[0]).counts) for p in pars]
+            msk = np.any(np.array([m > 0 for m in msrc]), axis=0)
+            msum = np.zeros(np.sum(msk))
+            for i, (name, idx, x0, xref, bounds) in enumerate(pars):
+                models[i] += [msrc[i][msk] / xref]
+                msum += msrc[i][msk]
+
+            counts += [np.ravel(c.counts_map().counts)[msk]]
+            bkg += [mtot[msk] - msum]
+
+        x, lnl, niter = fit_norms(np.concatenate(counts),
+                                  np.concatenate(bkg),
+                                  np.array([np.concatenate(m)
+                                            for m in models]),
+                                  np.array([p[2] for p in pars]),
+                                  np.array([p[4] for p in pars]))
+
+        self.logger.debug('Normalization fit converged after %i '
+                          'iterations' % niter)
+
+        for p, xv in zip(pars, x):
+            self.like[p[1]] = xv
+        self.like.syncSrcParams()
+
+        ts = self.ts_all([p[0] for p in pars], method='likelihood')
+        for name, idx, x0, xref, bounds in pars:
+            src = self.roi.get_source_by_name(name, True)
+            src.set_lazy()
+            src.update_data(self.get_src_model(name, paramsonly=True))
+            src['ts'] = ts[name]
+
+        self._roi_model['roi']['logLike'] = -self.like()
+        self._update_roi()
+
     def run(self):
         """Run extension and sed analysis for the given sources."""
 
@@ -1279,6 +1878,22 @@ class GTAnalysis(fermipy.config.Configurable):
             Update the properties of this source with the best-fit
             location.
 
+        method : str
+            Localization method.  With grid the likelihood is
+            evaluated at nstep**2 positions and the position and error
+            ellipse are determined from a parabolic fit to the
+            likelihood surface.  With newton the likelihood is
+            maximized with a sequence of quasi-Newton steps and the
+            error ellipse is derived from the Hessian at the
+            maximum.
+
+        max_iter : int
+            Maximum number of Newton iterations.
+
+        tol : float
+            Convergence tolerance in degrees for the Newton
+            iterations.
+
         newname : str
         
             Name that will be assigned to the relocalized source model
@@ -1296,8 +1911,6 @@ class GTAnalysis(fermipy.config.Configurable):
         config.setdefault('newname',
                           name.replace(' ', '').lower() + '_reloc')
 
-        nstep = config['nstep']
-        dtheta_max = config['dtheta_max']
         update = config['update']
         newname = config['newname']
 
@@ -1305,6 +1918,103 @@ class GTAnalysis(fermipy.config.Configurable):
 
         saved_state = LikelihoodState(self.like)
 
+        o = self._localize(name, config)
+
+        saved_state.restore()
+
+        if update:
+            self._update_position(name, newname, [o['ra'], o['dec']])
+            self.fit()
+            src = self.roi.get_source_by_name(newname, True)
+        else:
+            src = self.roi.get_source_by_name(name, True)
+
+        src.update_data({'localize': copy.deepcopy(o)})
+        return o
+
+    def localize_sources(self, names, **kwargs):
+        """Localize a list of sources.  The model is fit once and all
+        parameters are then fixed such that each source is localized
+        against the same background model.  With nproc > 1 the
+        sources are localized in parallel with forked worker
+        processes.  When update=True the new positions of all sources
+        are applied at the end followed by a single fit.
+
+        Parameters
+        ----------
+
+        names : list
+            List of source names.
+
+        nproc : int
+            Number of worker processes.
+
+        Returns
+        -------
+
+        tab : dict
+            Dictionary of arrays with the name, position, and error
+            ellipse of each source.  The full localization output for
+            each source is stored in its 'localize' field.
+
+        All other keyword arguments are passed through to localize.
+        """
+
+        names = [self.roi.get_source_by_name(t, True).name for t in names]
+
+        config = copy.deepcopy(self.config['localize'])
+        config.update(kwargs)
+        config.pop('newname', None)
+
+        self.logger.info('Running localization for %i sources' % len(names))
+
+        saved_state = LikelihoodState(self.like)
+
+        # Fit the background model once and freeze all parameters
+        self.fit(update=False)
+        self.free_sources(free=False)
+        fit_state = LikelihoodState(self.like)
+
+        def localize_source(name):
+            o = self._localize(name, config)
+            fit_state.restore()
+            return o
+
+        results = fork_map(localize_source, names, config['nproc'])
+
+        saved_state.restore()
+
+        cols = ['ra', 'dec', 'deltax', 'deltay', 'sigmax', 'sigmay', 'theta']
+        tab = {'name': np.array(names)}
+        for k in cols:
+            tab[k] = np.array([o[k] for o in results])
+
+        for name, o in zip(names, results):
+            o['config']['newname'] = name.replace(' ', '').lower() + '_reloc'
+
+            if config['update']:
+                self._update_position(name, o['config']['newname'],
+                                      [o['ra'], o['dec']])
+                src = self.roi.get_source_by_name(o['config']['newname'],
+                                                  True)
+            else:
+                src = self.roi.get_source_by_name(name, True)
+
+            src.update_data({'localize': copy.deepcopy(o)})
+
+        if config['update']:
+            self.fit()
+
+        return tab
+
+    def _localize(self, name, config):
+        """Run the localization of a single source.  This fits the
+        source normalization, replaces the source with a test source
+        and scans the position of the test source.  The likelihood
+        state is not restored on return."""
+
+        dtheta_max = config['dtheta_max']
+
         src = self.roi.get_source_by_name(name, True)
         skydir = src.skydir
 
@@ -1312,12 +2022,71 @@ class GTAnalysis(fermipy.config.Configurable):
         self.free_norm(name)
         self.fit(update=False)
 
-        # Save likelihood value for baseline fit
-        logLike0 = -self.like()
-
         self.zero_source(name)
 
-        o = {'config': config}
+        o = {'config': copy.deepcopy(config)}
+
+        if not config['method'] in ['grid', 'newton']:
+            raise Exception('Unrecognized localization method: %s'
+                            % config['method'])
+
+        # Add a copy of the source that is moved to each test position
+        model_name = '%s_localize' % (name.replace(' ', '').lower())
+        s = self.copy_source(name)
+        s.set_name(model_name)
+        self.add_source(model_name, s, free=True)
+
+        if config['method'] == 'newton':
+            popt, lnlscan = self._localize_newton(model_name, skydir, config)
+        else:
+            popt, lnlscan = self._localize_grid(model_name, skydir, config)
+
+        self.delete_source(model_name)
+
+        o['lnlscan'] = lnlscan
+
+        o['deltax'] = popt[1]
+        o['deltay'] = popt[2]
+        o['sigmax'] = popt[3]
+        o['sigmay'] = popt[4]
+        o['theta'] = popt[5]
+
+        radec = utils.offset_to_sky(skydir, popt[1], popt[2])
+        o['ra'] = radec[0, 0]
+        o['dec'] = radec[0, 1]
+
+        return o
+
+    def _update_position(self, name, newname, radec):
+        """Replace a source with a copy at a new position."""
+
+        if newname == name:
+            raise Exception('Error setting name for new source model.  '
+                            'Name string must be different than current '
+                            'source name.')
+
+        self.logger.info(
+            'Updating position of %s: %.3f %.3f' % (name, radec[0], radec[1]))
+        s = self.copy_source(name)
+        self.delete_source(name)
+        s.set_position(radec)
+        s.set_name(newname, names=s.names)
+        self.add_source(newname, s, free=True)
+
+    def _localize_loglike(self, name, radec):
+        """Evaluate the log-likelihood of the model with the test
+        source name moved to the position radec.  The position of the
+        source is fixed while the normalization and all other free
+        parameters are refit."""
+
+        self.move_source(name, radec)
+        self.fit(update=False)
+        return -self.like()
+
+    def _localize_grid(self, name, skydir, config):
+
+        nstep = config['nstep']
+        dtheta_max = config['dtheta_max']
 
         deltax = np.linspace(-dtheta_max, dtheta_max, nstep)[:, np.newaxis]
         deltay = np.linspace(-dtheta_max, dtheta_max, nstep)[np.newaxis, :]
@@ -1332,21 +2101,7 @@ class GTAnalysis(fermipy.config.Configurable):
                        dlogLike=np.zeros((nstep, nstep)))
 
         for i, t in enumerate(scan_radec):
-            # make a copy
-            s = self.copy_source(name)
-
-            model_name = '%s_localize' % (name.replace(' ', '').lower())
-            s.set_name(model_name)
-            s.set_position(t)
-            #            s.set_spatial_model(spatial_model,w)
-
-            self.add_source(model_name, s, free=True)
-            self.fit(update=False)
-
-            logLike1 = -self.like()
-            lnlscan['logLike'].flat[i] = logLike1
-            #            sd = self.get_src_model(model_name)
-            self.delete_source(model_name)
+            lnlscan['logLike'].flat[i] = self._localize_loglike(name, t)
 
         lnlscan['dlogLike'] = np.max(lnlscan['logLike']) - lnlscan['logLike']
         dlogmax = np.max(lnlscan['dlogLike']) - np.min(lnlscan['dlogLike'])
@@ -1362,41 +2117,41 @@ class GTAnalysis(fermipy.config.Configurable):
             popt = p0
             self.logger.error('Localization failed.', exc_info=True)
 
-        o['lnlscan'] = lnlscan
+        return popt, lnlscan
 
-        o['deltax'] = popt[1]
-        o['deltay'] = popt[2]
-        o['sigmax'] = popt[3]
-        o['sigmay'] = popt[4]
-        o['theta'] = popt[5]
+    def _localize_newton(self, name, skydir, config):
 
-        radec = utils.offset_to_sky(skydir, popt[1], popt[2])
-        o['ra'] = radec[0, 0]
-        o['dec'] = radec[0, 1]
+        dtheta_max = config['dtheta_max']
 
-        saved_state.restore()
+        def fn(dx, dy):
+            radec = utils.offset_to_sky(skydir, dx, dy)
+            return self._localize_loglike(name, radec[0])
 
-        if update:
+        r = maximize_2d_newton(fn, [0.0, 0.0], 0.25 * dtheta_max,
+                               max_iter=config['max_iter'],
+                               tol=config['tol'], max_dist=dtheta_max)
 
-            if newname == name:
-                raise Exception('Error setting name for new source model.  '
-                                'Name string must be different than current '
-                                'source name.')
+        self.logger.info('Localization converged after %i iterations '
+                         'and %i likelihood evaluations.'
+                         % (r['niter'], len(r['fvals'])))
 
-            self.logger.info(
-                'Updating source position: %.3f %.3f' % (o['ra'], o['dec']))
-            s = self.copy_source(name)
-            self.delete_source(name)
-            s.set_position([o['ra'], o['dec']])
-            s.set_name(newname, names=s.names)
-            self.add_source(newname, s, free=True)
-            self.fit()
-            src = self.roi.get_source_by_name(newname, True)
-        else:
-            src = self.roi.get_source_by_name(name, True)
+        lnlscan = dict(deltax=r['xvals'][:, 0],
+                       deltay=r['xvals'][:, 1],
+                       logLike=r['fvals'],
+                       dlogLike=np.max(r['fvals']) - r['fvals'],
+                       nfev=len(r['fvals']))
 
-        src.update_data({'localize': copy.deepcopy(o)})
-        return o
+        popt = [0.0, r['x'][0], r['x'][1], dtheta_max, dtheta_max, 0.0]
+        try:
+            cov = np.linalg.inv(-r['hessian'])
+            if np.any(np.linalg.eigvalsh(cov) <= 0):
+                raise Exception('Hessian is not negative definite.')
+            popt[3:] = cov_to_ellipse(cov)
+        except Exception, message:
+            self.logger.error('Localization failed to determine the '
+                              'error ellipse.', exc_info=True)
+
+        return popt, lnlscan
 
     def extension(self, name, **kwargs):
         """Perform an angular extension test for this source.  This
@@ -1431,12 +2186,31 @@ class GTAnalysis(fermipy.config.Configurable):
             Explicit sequence of values in degrees for the spatial extension
             scan.  If this argument is None then the scan points will
             be determined from width_min/width_max/width_nstep.
+
+        method : str
+            Method used to find the best-fit extension.  With scan the
+            likelihood is evaluated at every width in the scan vector
+            and the profile is interpolated with a spline.  With brent
+            the likelihood is maximized in log(width) between
+            width_min and width_max with a bounded 1D optimizer and the
+            1-sigma errors and 95% CL upper limit are found by root
+            finding on the profile likelihood.  In this case the width
+            argument is ignored and the width vector of the output
+            contains every width at which the likelihood was evaluated
+            in increasing order.  If the profile does not fall by 0.5
+            between the best-fit width and width_min (width_max) the
+            lower (upper) error extends to width_min (width_max).
             
         fix_background : bool
             Fix all background sources when performing the extension fit.
 
         save_model_map : bool
             Generate model maps for all steps in the likelihood scan.
+
+        nproc : int
+            Number of worker processes used for the width scan when
+            method is scan.  Each width is fit in a process forked
+            from the current analysis state.
             
         Returns
         -------
@@ -1462,6 +2236,10 @@ class GTAnalysis(fermipy.config.Configurable):
         width = config['width']
         fix_background = config['fix_background']
         save_model_map = config['save_model_map']
+        method = config['method']
+
+        if not method in ['scan', 'brent']:
+            raise Exception('Unrecognized extension method: %s' % method)
 
         self.logger.info('Running extension analysis for %s' % name)
 
@@ -1498,6 +2276,7 @@ class GTAnalysis(fermipy.config.Configurable):
         o = {'width': width,
              'dlogLike': np.zeros(len(width)),
              'logLike': np.zeros(len(width)),
+             'nfev': 0,
              'logLike_ptsrc': 0.0,
              'logLike_base': logLike0,
              'ext': 0.0,
@@ -1522,59 +2301,43 @@ class GTAnalysis(fermipy.config.Configurable):
         o['logLike_ptsrc'] = -self.like()
         self.delete_source(model_name, save_template=False)
 
-        # Perform scan over width parameter
-        self.logger.debug('Width scan vector:\n %s' % width)
-
-        for i, w in enumerate(width):
+        # Add the extended test source.  The width of the test source
+        # is subsequently changed in place for each trial width.
+        s = self.copy_source(name)
+        s.set_name(ext_model_name)
+        s.set_spatial_model(spatial_model, width[0])
 
-            # make a copy
-            s = self.copy_source(name)
-            model_name = '%s' % (ext_model_name)
-            s.set_name(model_name)
-            s.set_spatial_model(spatial_model, w)
+        self.logger.debug('Adding extended test source.')
+        self.add_source(ext_model_name, s, free=True)
+        ext_state = LikelihoodState(self.like)
 
-            self.logger.debug('Adding test source with width: %10.3f deg' % w)
-            self.add_source(model_name, s, free=True)
+        def fit_width(w):
+            ext_state.restore()
+            self.set_spatial_model(ext_model_name, spatial_model, w)
             self.fit(update=False)
+            return -self.like()
 
-            logLike1 = -self.like()
-            o['dlogLike'][i] = logLike1 - o['logLike_ptsrc']
-            o['logLike'][i] = logLike1
-
-            if save_model_map:
-                self.generate_model_map(model_name=model_name + '%02i' % i,
-                                        name=model_name)
-
-            self.delete_source(model_name, save_template=False)
-
-        try:
-            o['ext'], o['ext_ul95'], o['ext_err_lo'], o['ext_err_hi'], dlnl0 = \
-                get_upper_limit(o['dlogLike'], o['width'], interpolate=True)
-            o['ts_ext'] = 2 * dlnl0
-            o['ext_err'] = 0.5 * (o['ext_err_lo'] + o['ext_err_hi'])
-        except Exception, message:
-            self.logger.error('Upper limit failed.', exc_info=True)
+        if method == 'scan':
+            self._extension_scan(fit_width, ext_model_name, o, save_model_map)
+        else:
+            self._extension_brent(fit_width, ext_model_name, o, save_model_map)
 
         self.logger.info('Best-fit extension: %6.4f + %6.4f - %6.4f'
                          % (o['ext'], o['ext_err_lo'], o['ext_err_hi']))
         self.logger.info('TS_ext: %.3f' % o['ts_ext'])
 
         # Fit with the best-fit extension model
-        s = self.copy_source(name)
-        model_name = '%s' % (ext_model_name)
-        s.set_name(model_name)
-        s.set_spatial_model(spatial_model, o['ext'])
-
-        self.logger.info('Adding point-source')
-        self.add_source(model_name, s, free=True)
-        self.fit(update=False)
-
-        o['source_fit'] = self.get_src_model(model_name)
+        if np.isfinite(o['ext']) and o['ext'] > 0:
+            fit_width(o['ext'])
+        else:
+            self.logger.warning('Extension fit failed.  Skipping fit of '
+                                'the best-fit extension model.')
+        o['source_fit'] = self.get_src_model(ext_model_name)
 
-        self.generate_model_map(model_name=model_name,
-                                name=model_name)
+        self.generate_model_map(model_name=ext_model_name,
+                                name=ext_model_name)
 
-        self.delete_source(model_name, save_template=False)
+        self.delete_source(ext_model_name, save_template=False)
 
         # Restore ROI parameters to previous state
         self.scale_parameter(name, normPar, 1E10)
@@ -1592,6 +2355,154 @@ class GTAnalysis(fermipy.config.Configurable):
 
         return o
 
+    def _extension_scan(self, fit_width, model_name, o, save_model_map):
+        """Evaluate the likelihood on the vector of widths and extract
+        the best-fit extension and upper limit from a spline fit to
+        the profile likelihood."""
+
+        self.logger.debug('Width scan vector:\n %s' % o['width'])
+
+        def scan_width(w):
+            self.logger.debug('Fitting test source with width: %10.3f deg'
+                              % w)
+            logLike1 = fit_width(w)
+            maps = None
+            if save_model_map:
+                maps = self._make_model_maps(model_name)
+            return logLike1, maps
+
+        nproc = o['config']['nproc']
+        if nproc > 1:
+            self.logger.info('Running width scan with %i processes.' % nproc)
+
+        results = fork_map(scan_width, o['width'], nproc)
+
+        for i, (logLike1, maps) in enumerate(results):
+            o['dlogLike'][i] = logLike1 - o['logLike_ptsrc']
+            o['logLike'][i] = logLike1
+
+            if maps is not None:
+                self._store_model_maps(model_name + '%02i' % i, maps)
+
+        o['nfev'] = len(o['width'])
+
+        try:
+            o['ext'], o['ext_ul95'], o['ext_err_lo'], o['ext_err_hi'], dlnl0 = \
+                get_upper_limit(o['dlogLike'], o['width'], interpolate=True)
+            o['ts_ext'] = 2 * dlnl0
+            o['ext_err'] = 0.5 * (o['ext_err_lo'] + o['ext_err_hi'])
+        except Exception, message:
+            self.logger.error('Upper limit failed.', exc_info=True)
+
+    def _extension_brent(self, fit_width, model_name, o, save_model_map):
+        """Find the best-fit extension by maximizing the likelihood in
+        log(width) with a bounded Brent optimizer.  The 1-sigma errors
+        and 95% CL upper limit are then found by root finding on the
+        profile likelihood using the already evaluated widths to
+        bracket each crossing."""
+
+        from scipy.optimize import minimize_scalar, brentq
+
+        config = o['config']
+        lnw_min = np.log(config['width_min'])
+        lnw_max = np.log(config['width_max'])
+        lnl = {}
+        maps = {}
+
+        def fn(lnw):
+            if lnw not in lnl:
+                w = np.exp(lnw)
+                self.logger.debug('Fitting test source with width: %10.3f deg'
+                                  % w)
+                lnl[lnw] = fit_width(w)
+                if save_model_map:
+                    maps[lnw] = self._make_model_maps(model_name)
+            return lnl[lnw]
+
+        def crossing(lnw0, lnw1, dlnl, dlnl_tol=0.05):
+            """Find the width between lnw0 and lnw1 at which the
+            likelihood falls by dlnl with respect to its value at
+            lnw0.  The crossing is accepted once the likelihood is
+            within dlnl_tol of the target value."""
+
+            lnlmax = fn(lnw0)
+
+            def g(t):
+                v = fn(t) - lnlmax + dlnl
+                return 0.0 if abs(v) < dlnl_tol else v
+
+            if g(lnw1) > 0:
+                return np.nan
+
+            # Evaluate the likelihood at the crossing predicted by a
+            # parabola through the three widths closest to lnw0
+            x = np.array(sorted(lnl.keys(), key=lambda t: abs(t - lnw0)))
+            if len(x) >= 3:
+                a = -np.polyfit(x[:3], [lnl[t] for t in x[:3]], 2)[0]
+                if a > 0:
+                    t = lnw0 + np.sign(lnw1 - lnw0) * np.sqrt(dlnl / a)
+                    if (t - lnw0) * (lnw1 - t) > 0 and g(t) == 0:
+                        return np.exp(t)
+
+            # Narrow the bracket with previously evaluated widths
+            x = np.array(sorted(lnl.keys()))
+            if lnw1 < lnw0:
+                x = x[::-1]
+            x = x[(x - lnw0) * np.sign(lnw1 - lnw0) >= 0]
+            for xlo, xhi in zip(x[:-1], x[1:]):
+                if g(xlo) >= 0 and g(xhi) <= 0:
+                    lnw0, lnw1 = xlo, xhi
+                    break
+
+            return np.exp(brentq(g, lnw0, lnw1, xtol=0.02))
+
+        try:
+            r = minimize_scalar(lambda t: -fn(t), bounds=(lnw_min, lnw_max),
+                                method='bounded', options={'xatol': 0.05})
+            lnw0 = float(r.x)
+            lnlmax = fn(lnw0)
+            ext = np.exp(lnw0)
+
+            o['ext'] = ext
+
+            # Without a crossing the error extends to the boundary of
+            # the width range
+            w_hi = crossing(lnw0, lnw_max, 0.5)
+            if not np.isfinite(w_hi):
+                w_hi = config['width_max']
+            w_lo = crossing(lnw0, lnw_min, 0.5)
+            if not np.isfinite(w_lo):
+                w_lo = config['width_min']
+
+            o['ext_err_hi'] = w_hi - ext
+            o['ext_err_lo'] = ext - w_lo
+            o['ext_ul95'] = crossing(lnw0, lnw_max, cl_to_dlnl(0.95))
+            o['ext_err'] = 0.5 * (o['ext_err_lo'] + o['ext_err_hi'])
+            o['ts_ext'] = 2 * (lnlmax - o['logLike_ptsrc'])
+
+            if not np.isfinite(o['ext_ul95']):
+                self.logger.warning('Upper limit is outside of the width '
+                                    'range.  Setting it to width_max.')
+                o['ext_ul95'] = config['width_max']
+
+        except Exception, message:
+            self.logger.error('Extension fit failed.', exc_info=True)
+            if lnl:
+                o['ext'] = np.exp(max(lnl.keys(), key=lambda t: lnl[t]))
+
+        lnw = np.array(sorted(lnl.keys()))
+        o['width'] = np.exp(lnw)
+        o['logLike'] = np.array([lnl[t] for t in lnw])
+        o['dlogLike'] = o['logLike'] - o['logLike_ptsrc']
+        o['nfev'] = len(lnw)
+
+        for i, t in enumerate(lnw):
+            if t in maps:
+                self._store_model_maps(model_name + '%02i' % i, maps[t])
+
+        self.logger.info('Extension fit required %i likelihood evaluations.'
+                         % o['nfev'])
+
     def sed(self, name, profile=True, energies=None, **kwargs):
         """Generate an SED for a source.  This function will fit the
         normalization of a given source in each energy bin.
@@ -1621,13 +2532,21 @@ class GTAnalysis(fermipy.config.Configurable):
             spectrum in each bin.  If this is false then a constant
             index set to `bin_index` will be used.  
 
+        nproc : int
+            Number of worker processes.  With nproc > 1 the energy
+            bins are fit in parallel in processes forked from the
+            current analysis state.
+
         Returns
         -------
 
         sed : dict
             Dictionary containing results of the SED analysis.  The same
             dictionary is also saved to the source dictionary under
-            'sed'.
+            'sed'.  When profile=True the likelihood profiles of all
+            bins are also stored as a likelihood cube under 'castro'
+            which can be loaded with
+            `~fermipy.castro.CastroData.create_from_sed`.
             
         """
 
@@ -1710,67 +2629,34 @@ class GTAnalysis(fermipy.config.Configurable):
                            bounds=[1E-10, 1E10])
 
         for i, (emin, emax) in enumerate(zip(energies[:-1], energies[1:])):
-            #            saved_state.restore()
-
-            ecenter = 0.5 * (emin + emax)
-            deltae = 10 ** emax - 10 ** emin
-            self.set_parameter(name, 'Scale', 10 ** ecenter, scale=1.0)
-
             if use_local_index:
                 o['index'][i] = -min(gf_bin_index[i], max_index)
             else:
                 o['index'][i] = -bin_index
 
-            self.set_parameter(name, 'Index', o['index'][i], scale=1.0)
+        bin_state = LikelihoodState(self.like)
 
-            normVal = self.like.normPar(name).getValue()
-            flux_ratio = gf_bin_flux[i] / self.like[name].flux(10 ** emin,
-                                                               10 ** emax)
-            newVal = max(normVal * flux_ratio, 1E-10)
-            self.set_norm(name, newVal)
+        def fit_bin(i):
+            bin_state.restore()
+            return self._fit_sed_bin(name, energies[i], energies[i + 1],
+                                     o['index'][i], gf_bin_flux[i], profile)
 
-            self.like.syncSrcParams(name)
-            self.free_norm(name)
-            self.logger.debug('Fitting %s SED from %.0f MeV to %.0f MeV' %
-                              (name, 10 ** emin, 10 ** emax))
-            self.setEnergyRange(emin, emax)
-            o['fit_quality'][i] = self.fit(update=False)
-
-            prefactor = self.like[self.like.par_index(name, 'Prefactor')]
-
-            flux = self.like[name].flux(10 ** emin, 10 ** emax)
-            flux_err = self.like.fluxError(name, 10 ** emin, 10 ** emax)
-            eflux = self.like[name].energyFlux(10 ** emin, 10 ** emax)
-            eflux_err = self.like.energyFluxError(name, 10 ** emin, 10 ** emax)
-            dfde = prefactor.getTrueValue()
-            dfde_err = dfde * flux_err / flux
-
-            o['flux'][i] = flux
-            o['eflux'][i] = eflux
-            o['dfde'][i] = dfde
-            o['e2dfde'][i] = dfde * 10 ** (2 * ecenter)
-            o['flux_err'][i] = flux_err
-            o['eflux_err'][i] = eflux_err
-            o['dfde_err'][i] = dfde_err
-            o['e2dfde_err'][i] = dfde_err * 10 ** (2 * ecenter)
-
-            cs = self.model_counts_spectrum(name, emin, emax, summed=True)
-            o['Npred'][i] = np.sum(cs)
-            o['ts'][i] = max(self.like.Ts(name, reoptimize=False), 0.0)
-            if profile:
-                lnlp = self.profile_norm(name, emin=emin, emax=emax,
-                                         savestate=False)
-                o['lnlprofile'] += [lnlp]
-                dfde, dfde_ul95, dfde_err_lo, dfde_err_hi, dlnl0 = \
-                    get_upper_limit(
-                    lnlp['dlogLike'], lnlp['dfde'])
-
-                o['dfde_ul95'][i] = dfde_ul95
-                o['e2dfde_ul95'][i] = dfde_ul95 * 10 ** (2 * ecenter)
-                o['dfde_err_hi'][i] = dfde_err_hi
-                o['e2dfde_err_hi'][i] = dfde_err_hi * 10 ** (2 * ecenter)
-                o['dfde_err_lo'][i] = dfde_err_lo
-                o['e2dfde_err_lo'][i] = dfde_err_lo * 10 ** (2 * ecenter)
+        nproc = config['nproc']
+        if nproc > 1:
+            self.logger.info('Fitting %i SED bins with %i processes.'
+                             % (nbins, nproc))
+
+        results = fork_map(fit_bin, range(nbins), nproc)
+
+        for i, r in enumerate(results):
+            for k, v in r.items():
+                if k == 'lnlprofile':
+                    o['lnlprofile'] += [v]
+                else:
+                    o[k][i] = v
+
+        if profile:
+            o['castro'] = make_castro_cube(o)
 
         self.setEnergyRange(self.energies[0], self.energies[-1])
         self.like.setSpectrum(name, old_spectrum)
@@ -1782,6 +2668,67 @@ class GTAnalysis(fermipy.config.Configurable):
         #        src_model['sed'] = copy.deepcopy(o)
         return o
 
+    def _fit_sed_bin(self, name, emin, emax, index, gf_flux, profile=True):
+        """Fit the normalization of a source in a single SED energy
+        bin.  The source spectrum must already be set to a power-law.
+        Returns a dictionary with the results for this bin."""
+
+        ecenter = 0.5 * (emin + emax)
+        self.set_parameter(name, 'Scale', 10 ** ecenter, scale=1.0)
+        self.set_parameter(name, 'Index', index, scale=1.0)
+
+        normVal = self.like.normPar(name).getValue()
+        flux_ratio = gf_flux / self.like[name].flux(10 ** emin,
+                                                    10 ** emax)
+        newVal = max(normVal * flux_ratio, 1E-10)
+        self.set_norm(name, newVal)
+
+        self.like.syncSrcParams(name)
+        self.free_norm(name)
+        self.logger.debug('Fitting %s SED from %.0f MeV to %.0f MeV' %
+                          (name, 10 ** emin, 10 ** emax))
+        self.setEnergyRange(emin, emax)
+
+        o = {}
+        o['fit_quality'] = self.fit(update=False)
+
+        prefactor = self.like[self.like.par_index(name, 'Prefactor')]
+
+        flux = self.like[name].flux(10 ** emin, 10 ** emax)
+        flux_err = self.like.fluxError(name, 10 ** emin, 10 ** emax)
+        eflux = self.like[name].energyFlux(10 ** emin, 10 ** emax)
+        eflux_err = self.like.energyFluxError(name, 10 ** emin, 10 ** emax)
+        dfde = prefactor.getTrueValue()
+        dfde_err = dfde * flux_err / flux
+
+        o['flux'] = flux
+        o['eflux'] = eflux
+        o['dfde'] = dfde
+        o['e2dfde'] = dfde * 10 ** (2 * ecenter)
+        o['flux_err'] = flux_err
+        o['eflux_err'] = eflux_err
+        o['dfde_err'] = dfde_err
+        o['e2dfde_err'] = dfde_err * 10 ** (2 * ecenter)
+
+        cs = self.model_counts_spectrum(name, emin, emax, summed=True)
+        o['Npred'] = np.sum(cs)
+        o['ts'] = max(self.like.Ts(name, reoptimize=False), 0.0)
+        if profile:
+            lnlp = self.profile_norm(name, emin=emin, emax=emax,
+                                     savestate=False)
+            o['lnlprofile'] = lnlp
+            dfde, dfde_ul95, dfde_err_lo, dfde_err_hi, dlnl0 = \
+                get_upper_limit(lnlp['dlogLike'], lnlp['dfde'])
+
+            o['dfde_ul95'] = dfde_ul95
+            o['e2dfde_ul95'] = dfde_ul95 * 10 ** (2 * ecenter)
+            o['dfde_err_hi'] = dfde_err_hi
+            o['e2dfde_err_hi'] = dfde_err_hi * 10 ** (2 * ecenter)
+            o['dfde_err_lo'] = dfde_err_lo
+            o['e2dfde_err_lo'] = dfde_err_lo * 10 ** (2 * ecenter)
+
+        return o
+
     def profile_norm(self, name, emin=None, emax=None, reoptimize=False,
                      xvals=None, npts=50,
                      savestate=True):
@@ -1802,6 +2749,16 @@ class GTAnalysis(fermipy.config.Configurable):
         cs = self.model_counts_spectrum(name, emin, emax, summed=True)
         npred = np.sum(cs)
 
+        if xvals is None and self.config['profile']['adaptive'] and \
+                (self.config['profile']['method'] != 'vector' or reoptimize):
+            o = self._profile_norm_adaptive(name, emin=emin, emax=emax,
+                                            reoptimize=reoptimize,
+                                            savestate=savestate)
+            if o is not None:
+                return o
+            self.logger.warning('Adaptive profile of %s failed.  Using '
+                                'fixed grid of points.' % name)
+
         if xvals is None:
 
             err = par.error()
@@ -1822,36 +2779,66 @@ class GTAnalysis(fermipy.config.Configurable):
 
     def profile(self, name, parName, emin=None, emax=None, reoptimize=False,
                 xvals=None, npts=None, savestate=True):
-        """ Profile the likelihood for the given source and parameter.  
+        """Profile the likelihood for the given source and parameter.
+
+        Parameters
+        ----------
+
+        name : str
+           Source name.
+
+        parName : str
+           Parameter name.  If None the normalization parameter of the
+           source is profiled.
+
+        reoptimize : bool
+           Refit the free parameters of the model at each point of the
+           profile.  The profile is evaluated in two branches that
+           proceed outward from the current value of the parameter
+           such that each fit starts from the solution found at the
+           neighbouring point.  The two branches are run in parallel
+           when profile.nproc > 1.
+
+        xvals : array
+           Parameter values at which the likelihood is evaluated.  If
+           None a grid of npts points is chosen from the current value
+           and error of the parameter.
+
+        Returns
+        -------
+
+        profile : dict
+           Dictionary with the parameter values (xvals) and the
+           likelihood, source normalization (dfde), flux, eflux and
+           Npred at each point.
         """
 
         # Find the source
         name = self.roi.get_source_by_name(name, True).name
 
-        par = self.like.normPar(name)
-        parName = self.like.normPar(name).getName()
+        normPar = self.like.normPar(name).getName()
+        if parName is None:
+            parName = normPar
+
         idx = self.like.par_index(name, parName)
-        scale = float(self.like.model[idx].getScale())
+        norm_idx = self.like.par_index(name, normPar)
+        par = self.like.model[idx]
         bounds = self.like.model[idx].getBounds()
 
         emin = min(self.energies) if emin is None else emin
         emax = max(self.energies) if emax is None else emax
 
-        ecenter = 0.5 * (emin + emax)
-        deltae = 10 ** emax - 10 ** emin
-        npred = np.sum(
-            self.model_counts_spectrum(name, emin, emax, summed=True))
-
         if savestate:
             saved_state = LikelihoodState(self.like)
 
         self.setEnergyRange(emin, emax)
         logLike0 = -self.like()
 
-        if xvals is None:
+        err = par.error()
+        val = par.getValue()
+
+        if xvals is None and parName == normPar:
 
-            err = par.error()
-            val = par.getValue()
             if err <= 0 or val <= 3 * err:
                 xvals = 10 ** np.linspace(-2.0, 2.0, 51)
                 if val < xvals[0]: xvals = np.insert(xvals, val, 0)
@@ -1860,7 +2847,25 @@ class GTAnalysis(fermipy.config.Configurable):
                 xvals = np.concatenate((-1.0 * xvals[1:][::-1], xvals))
                 xvals = val * 10 ** xvals
 
-        self.like[idx].setBounds(xvals[0], xvals[-1])
+        elif xvals is None:
+
+            npts = 25 if npts is None else npts
+            if err <= 0 or not np.isfinite(err):
+                err = max(0.1 * abs(val), 0.1)
+            xvals = val + 3.0 * err * np.linspace(-1.0, 1.0, npts)
+            xvals = xvals[(xvals >= bounds[0]) & (xvals <= bounds[1])]
+
+        xvals = np.array(xvals, ndmin=1)
+
+        if (self.config['profile']['method'] == 'vector' and
+                parName == normPar and not reoptimize and val > 0):
+            o = self._profile_vector(name, idx, emin, emax, xvals, logLike0)
+            if savestate:
+                saved_state.restore()
+            return o
+
+        self.like[idx].setBounds(min(np.min(xvals), bounds[0]),
+                                 max(np.max(xvals), bounds[1]))
 
         o = {'xvals': xvals,
              'Npred': np.zeros(len(xvals)),
@@ -1871,60 +2876,507 @@ class GTAnalysis(fermipy.config.Configurable):
              'logLike': np.zeros(len(xvals))
              }
 
-        for i, x in enumerate(xvals):
+        if reoptimize:
+            pts = self._profile_branches(name, idx, norm_idx, xvals, val,
+                                         emin, emax)
+        else:
+            pts = [self._profile_point(name, idx, x, emin, emax, False,
+                                       norm_idx) for x in xvals]
+
+        for i, p in enumerate(pts):
+            o['dlogLike'][i] = p['logLike'] - logLike0
+            o['logLike'][i] = p['logLike']
+            o['dfde'][i] = p['dfde']
+            o['flux'][i] = p['flux']
+            o['eflux'][i] = p['eflux']
+            o['Npred'][i] += p['Npred']
 
-            self.like[idx] = x
-            self.like.syncSrcParams(name)
+        # Restore model parameters to original values
+        if savestate:
+            saved_state.restore()
+        self.like[idx].setBounds(*bounds)
+
+        return o
 
-            if self.like.logLike.getNumFreeParams() > 1 and reoptimize:
-                # Only reoptimize if not all frozen                
-                self.like.freeze(idx)
-                self.like.optimize(0)
-                self.like.thaw(idx)
+    def _profile_branches(self, name, idx, norm_idx, xvals, x0, emin, emax):
+        """Evaluate a reoptimized profile in two branches starting
+        from the point closest to the current parameter value x0.
+        Points above and below x0 are visited in order of increasing
+        distance so that each fit is initialized with the solution of
+        the previous point.  Returns the list of profile points in the
+        order of xvals."""
 
-            logLike1 = -self.like()
+        isort = np.argsort(xvals)
+        up = [i for i in isort if xvals[i] >= x0]
+        down = [i for i in isort[::-1] if xvals[i] < x0]
 
-            flux = self.like[name].flux(10 ** emin, 10 ** emax)
-            eflux = self.like[name].energyFlux(10 ** emin, 10 ** emax)
-            prefactor = self.like[idx]
+        state = LikelihoodState(self.like)
 
-            o['dlogLike'][i] = logLike1 - logLike0
-            o['logLike'][i] = logLike1
-            o['dfde'][i] = prefactor.getTrueValue()
-            o['flux'][i] = flux
-            o['eflux'][i] = eflux
+        def run_branch(branch):
+            state.restore()
+            return [self._profile_point(name, idx, xvals[i], emin, emax,
+                                        True, norm_idx) for i in branch]
 
-            cs = self.model_counts_spectrum(name, emin, emax, summed=True)
-            o['Npred'][i] += np.sum(cs)
+        branches = [b for b in [up, down] if b]
+        nproc = min(self.config['profile']['nproc'], len(branches))
+        results = fork_map(run_branch, branches, nproc)
+        state.restore()
 
-        #        if len(self.like.model.srcs) == 1 and fluxes[0] == 0:
-        #            # Likelihood is undefined with one source and no flux,
-        # hack it..
-        #            dlogLike[0] = dlogLike[1]
+        pts = [None] * len(xvals)
+        for b, r in zip(branches, results):
+            for i, p in zip(b, r):
+                pts[i] = p
+
+        return pts
+
+    def _profile_point(self, name, idx, x, emin, emax, reoptimize=False,
+                       norm_idx=None):
+        """Set the parameter with index idx to x and evaluate the
+        likelihood and the flux of the source.  The normalization
+        reported in dfde is taken from the parameter with index
+        norm_idx (defaults to idx)."""
+
+        if norm_idx is None:
+            norm_idx = idx
+
+        self.like[idx] = x
+        self.like.syncSrcParams(name)
+
+        if self.like.logLike.getNumFreeParams() > 1 and reoptimize:
+            # Only reoptimize if not all frozen
+            self.like.freeze(idx)
+            self.like.optimize(0)
+            self.like.thaw(idx)
+
+        cs = self.model_counts_spectrum(name, emin, emax, summed=True)
+
+        return {'logLike': -self.like(),
+                'dfde': self.like[norm_idx].getTrueValue(),
+                'flux': self.like[name].flux(10 ** emin, 10 ** emax),
+                'eflux': self.like[name].energyFlux(10 ** emin, 10 ** emax),
+                'Npred': np.sum(cs)}
+
+    def _profile_norm_adaptive(self, name, emin, emax, reoptimize=False,
+                               savestate=True):
+        """Profile the normalization of a source by adaptively
+        choosing the points at which the likelihood is evaluated.  The
+        maximum of the likelihood is first refined with parabolic
+        steps, the upper bound of the profile is then bracketed by
+        stepping outward, and the points at which the likelihood falls
+        by 0.5 (1-sigma) and 1.35 (95% CL upper limit) are located by
+        root finding.  The output has the same format as profile with
+        the evaluated points sorted in normalization.  Returns None if
+        the upper limit cannot be bracketed within the bounds of the
+        normalization."""
+
+        par = self.like.normPar(name)
+        parName = par.getName()
+        idx = self.like.par_index(name, parName)
+        bounds = self.like.model[idx].getBounds()
+        tol = self.config['profile']['tol']
+
+        emin = min(self.energies) if emin is None else emin
+        emax = max(self.energies) if emax is None else emax
 
-        # Restore model parameters to original values
         if savestate:
-            saved_state.restore()
-        self.like[idx].setBounds(*bounds)
+            saved_state = LikelihoodState(self.like)
+
+        self.setEnergyRange(emin, emax)
+        logLike0 = -self.like()
+
+        x0 = par.getValue()
+        err = par.error()
+        npred = np.sum(self.model_counts_spectrum(name, emin, emax,
+                                                  summed=True))
+
+        # Characteristic step size in the normalization
+        if err > 0 and np.isfinite(err):
+            step = err
+        elif npred > 0:
+            step = max(x0, x0 / npred)
+        else:
+            step = max(x0, 1E-10)
+
+        xbound = max(bounds[1], x0 + 1E3 * step)
+        self.like[idx].setBounds(0.0, xbound)
+
+        try:
+            o = self._profile_norm_adaptive_points(name, idx, emin, emax,
+                                                   reoptimize, x0, step,
+                                                   xbound, tol)
+        except ValueError, ex:
+            self.logger.debug('Adaptive profile failed: %s' % str(ex))
+            o = None
+        finally:
+            if savestate:
+                saved_state.restore()
+            self.like[idx].setBounds(*bounds)
+
+        if o is not None:
+            o['dlogLike'] = o['logLike'] - logLike0
+        return o
+
+    def _profile_norm_adaptive_points(self, name, idx, emin, emax,
+                                      reoptimize, x0, step, xbound, tol):
+        """Evaluate the points of an adaptive normalization profile
+        (see _profile_norm_adaptive).  Raises ValueError if the upper
+        limit is not bracketed by xbound."""
+
+        from scipy.optimize import brentq
+
+        pts = {}
+
+        def fn(x):
+            x = min(max(float(x), 0.0), xbound)
+            if not x in pts:
+                pts[x] = self._profile_point(name, idx, x, emin, emax,
+                                             reoptimize)
+            return pts[x]['logLike']
+
+        # Refine the maximum with parabolic steps
+        xmax = x0
+        for i in range(3):
+            h = min(0.5 * step, xmax) if xmax > 0 else 0.5 * step
+            xv = np.array([xmax - h, xmax, xmax + h])
+            fv = np.array([fn(t) for t in xv])
+            a = (fv[2] - 2 * fv[1] + fv[0]) / (2 * h ** 2)
+            b = (fv[2] - fv[0]) / (2 * h)
+            if a < 0:
+                xnew = min(max(xmax - b / (2 * a), 0.0), xmax + 4 * step)
+            else:
+                xnew = xv[np.argmax(fv)]
+
+            if fn(xnew) < fn(xmax) or abs(xnew - xmax) < tol * step:
+                break
+            xmax = xnew
+
+        lnlmax = fn(xmax)
+
+        def g(x, dlnl):
+            v = fn(x) - lnlmax + dlnl
+            return 0.0 if abs(v) < tol else v
+
+        def crossing(xlo, xhi, dlnl):
+            # Narrow the bracket with previously evaluated points
+            x = np.array(sorted(pts.keys()))
+            x = x[(x >= min(xlo, xhi)) & (x <= max(xlo, xhi))]
+            if xhi < xlo:
+                x = x[::-1]
+            for ta, tb in zip(x[:-1], x[1:]):
+                if g(ta, dlnl) >= 0 and g(tb, dlnl) <= 0:
+                    xlo, xhi = ta, tb
+                    break
+            return brentq(g, xlo, xhi, args=(dlnl,), xtol=tol * step)
+
+        # Bracket the upper limit by stepping outward
+        dlnl_ul = cl_to_dlnl(0.95)
+        xhi = min(xmax + step, xbound)
+        for i in range(20):
+            if g(xhi, dlnl_ul) <= 0 or xhi >= xbound:
+                break
+            xhi = min(xmax + (xhi - xmax) * 2.0, xbound)
+
+        if g(xhi, dlnl_ul) > 0:
+            raise ValueError('Upper limit of %s is not bracketed below '
+                             '%g.' % (name, xhi))
+
+        crossing(xmax, xhi, 0.5)
+        crossing(xmax, xhi, dlnl_ul)
+        if xmax > 0 and g(0.0, 0.5) < 0:
+            crossing(xmax, 0.0, 0.5)
+
+        xvals = np.array(sorted(pts.keys()))
+        o = {'xvals': xvals}
+        for k in ['logLike', 'dfde', 'flux', 'eflux', 'Npred']:
+            o[k] = np.array([pts[x][k] for x in xvals])
+
+        return o
+
+    def _profile_vector(self, name, idx, emin, emax, xvals, logLike0):
+        """Compute the likelihood profile of a source normalization
+        with all other parameters fixed.  The counts, background, and
+        source model cubes are extracted once and the Poisson
+        likelihood is evaluated for all values in xvals with a single
+        vectorized calculation.  The flux, energy flux, and Npred of
+        the source are scaled linearly with the normalization."""
+
+        x0 = self.like[idx].getValue()
+        xvals = np.array(xvals, dtype=float)
+
+        counts = []
+        bkg = []
+        model = []
+        for c in self.components:
+            imin = int(valToEdge(c.energies, emin)[0])
+            imax = int(valToEdge(c.energies, emax)[0])
+            if imax <= imin:
+                continue
+
+            cm = c.counts_map().counts[imin:imax]
+            mtot = c.model_counts_map().counts[imin:imax]
+            msrc = c.model_counts_map(name).counts[imin:imax]
+
+            counts += [np.ravel(cm)]
+            bkg += [np.ravel(mtot - msrc)]
+            model += [np.ravel(msrc) / x0]
+
+        lnl = poisson_lnl_norm_scan(np.concatenate(counts),
+                                    np.concatenate(bkg),
+                                    np.concatenate(model),
+                                    np.append(xvals, x0))
+        dlogLike = lnl[:-1] - lnl[-1]
+
+        flux = self.like[name].flux(10 ** emin, 10 ** emax)
+        eflux = self.like[name].energyFlux(10 ** emin, 10 ** emax)
+        dfde = self.like[idx].getTrueValue()
+        npred = np.sum(self.model_counts_spectrum(name, emin, emax,
+                                                  summed=True))
+        r = xvals / x0
+
+        o = {'xvals': xvals,
+             'Npred': npred * r,
+             'dfde': dfde * r,
+             'flux': flux * r,
+             'eflux': eflux * r,
+             'dlogLike': dlogLike,
+             'logLike': logLike0 + dlogLike
+             }
 
         return o
 
     def initOptimizer(self):
         pass
 
-    def create_optObject(self):
+    def create_optObject(self, optimizer=None):
         """ Make MINUIT or NewMinuit type optimizer object """
 
-        optimizer = self.config['optimizer']['optimizer']
+        if optimizer is None:
+            optimizer = self.config['optimizer']['optimizer']
         if optimizer.upper() == 'MINUIT':
             optObject = pyLike.Minuit(self.like.logLike)
-        elif optimizer.upper == 'NEWMINUIT':
+        elif optimizer.upper() == 'NEWMINUIT':
             optObject = pyLike.NewMinuit(self.like.logLike)
         else:
             optFactory = pyLike.OptimizerFactory_instance()
             optObject = optFactory.create(optimizer, self.like.logLike)
         return optObject
 
+    def _create_numpy_like(self):
+        """Create a NumPy likelihood object for the current model.
+        Sources whose only free parameter is the normalization are
+        represented by their model counts cube.  Sources with free
+        shape parameters are represented by their source map and
+        spectral model.  All other sources are summed into a fixed
+        background.  Returns the likelihood object, the indices of the
+        free parameters in the pyLikelihood model, and the range of
+        energy bins of each component, or None if the model cannot be
+        represented."""
+
+        from fermipy.likelihood import BinnedPoissonLikelihood
+        from fermipy.spectrum import create_spectrum
+
+        ebins = []
+        for c in self.components:
+            if self._erange is None:
+                ebins += [(0, c.enumbins)]
+            else:
+                ebins += [(int(valToEdge(c.energies, self._erange[0])[0]),
+                           int(valToEdge(c.energies, self._erange[1])[0]))]
+
+        names = [name for name in self.like.sourceNames()
+                 if self.get_free_source_params(name)]
+
+        # Model counts of the sources with free parameters
+        src_cubes = {}
+        for name in names:
+            src_cubes[name] = [c.model_counts_map(name).counts[imin:imax]
+                               for c, (imin, imax) in
+                               zip(self.components, ebins)]
+
+        counts = []
+        bkg = []
+        energies = []
+        for i, (c, (imin, imax)) in enumerate(zip(self.components, ebins)):
+            counts += [c.counts_map().counts[imin:imax]]
+            bkg += [c.model_counts_map().counts[imin:imax] -
+                    sum([src_cubes[name][i] for name in names])]
+            energies += [c.energies[imin:imax + 1]]
+
+        like = BinnedPoissonLikelihood(counts, energies, bkg,
+                                       self.config['optimizer']['nproc'])
+        par_idx = []
+
+        for name in names:
+
+            free_pars = self.get_free_source_params(name)
+            src = self.roi.get_source_by_name(name, True)
+            normPar = self.like.normPar(name).getName()
+            cubes = src_cubes[name]
+
+            if free_pars == [normPar]:
+                idx = self.like.par_index(name, normPar)
+                par = self.like[idx]
+                if par.getValue() <= 0:
+                    return None
+                like.add_template(name, cubes, par.getValue(),
+                                  par.getScale(), par.getBounds())
+                par_idx += [idx]
+                continue
+
+            if not src['SpectrumType'] in numpy_spectrum_parameters:
+                self.logger.debug('Spectral model %s of %s not supported '
+                                  'by numpy backend.' %
+                                  (src['SpectrumType'], name))
+                return None
+
+            parNames, scaleName = \
+                numpy_spectrum_parameters[src['SpectrumType']]
+            if [p for p in free_pars if not p in parNames]:
+                return None
+
+            idxs = [self.like.par_index(name, p) for p in parNames]
+            params = [self.like[idx].getTrueValue() for idx in idxs]
+            escale = self.like[self.like.par_index(name,
+                                                   scaleName)].getTrueValue()
+
+            srcmaps = []
+            for c, (imin, imax) in zip(self.components, ebins):
+                m = c.get_srcmap(name)
+                if m is None:
+                    return None
+                srcmaps += [m[imin:imax + 1]]
+
+            free = [p in free_pars for p in parNames]
+            like.add_source(name, create_spectrum(src['SpectrumType'],
+                                                  params, escale),
+                            srcmaps, free,
+                            [self.like[idx].getScale() for idx in idxs],
+                            [self.like[idx].getBounds() for idx in idxs])
+            like.calibrate(name, [np.sum(cube, axis=(1, 2))
+                                  for cube in cubes])
+            par_idx += [idx for idx, f in zip(idxs, free) if f]
+
+        return like, par_idx, ebins
+
+    def _check_numpy_like(self, like, par_idx, ebins, tol=1E-2):
+        """Check the NumPy likelihood against pyLikelihood with the
+        same parameters.  The model counts cubes of each component are
+        compared pixel by pixel at the current parameters and the
+        change in log-likelihood for a small shift of all free
+        parameters is compared with that of pyLikelihood.  The
+        parameters of the pyLikelihood model are changed by this
+        method and must be restored by the caller.  Returns True if
+        both agree within tol."""
+
+        for i, (c, (imin, imax)) in enumerate(zip(self.components, ebins)):
+            m0 = c.model_counts_map().counts[imin:imax]
+            m1 = like.model_counts(i)
+            d = np.max(np.abs(m1 - m0)) / max(np.max(m0), 1E-10)
+            self.logger.debug('numpy backend component %i: max model '
+                              'counts difference %.3g relative to peak'
+                              % (i, d))
+            if d > tol:
+                return False
+
+        x0 = like.get_params()
+        lo, hi = like.get_bounds().T
+        x1 = np.clip(x0 + np.where(x0 != 0, 0.01 * np.abs(x0), 0.01), lo, hi)
+
+        lnl0 = like.lnl(x0)
+        lnl1 = like.lnl(x1)
+        like.set_params(x0)
+
+        logLike0 = -self.like()
+        for idx, x in zip(par_idx, x1):
+            self.like[idx] = x
+        self.like.syncSrcParams()
+        logLike1 = -self.like()
+
+        dlnl = (lnl1 - lnl0) - (logLike1 - logLike0)
+        self.logger.debug('numpy backend delta-logLike: %f '
+                          'pyLikelihood delta-logLike: %f' %
+                          (lnl1 - lnl0, logLike1 - logLike0))
+        return abs(dlnl) <= max(tol, tol * abs(logLike1 - logLike0))
+
+    def _fit_numpy(self, covar, stages):
+        """Fit the free parameters of the model with the NumPy
+        likelihood backend.  The best-fit parameters are written back
+        to the pyLikelihood model with a single sync.  Returns the
+        fit quality or None if the model is not supported by the
+        backend.  The backend is checked against pyLikelihood before
+        and after the fit.  If they do not agree the parameters are
+        restored and None is returned such that the fit falls back to
+        pyLikelihood."""
+
+        t0 = time.time()
+        o = self._create_numpy_like()
+        if o is None:
+            self.logger.info('Model not supported by numpy backend.  '
+                             'Falling back to pyLikelihood.')
+            return None
+
+        like, par_idx, ebins = o
+        saved_state = LikelihoodState(self.like)
+        check = self._check_numpy_like(like, par_idx, ebins)
+        saved_state.restore()
+        if not check:
+            self.logger.warning('Model counts or likelihood of numpy '
+                                'backend differ from pyLikelihood.  '
+                                'Falling back to pyLikelihood.')
+            return None
+
+        logLike0 = -self.like()
+        lnl0 = like.lnl()
+
+        r = like.fit(covar=covar)
+
+        for idx, x in zip(par_idx, r['x']):
+            self.like[idx] = x
+        if r['covar'] is not None:
+            err = np.sqrt(np.abs(np.diag(r['covar'])))
+            for idx, e in zip(par_idx, err):
+                self.like[idx].setError(e)
+            isort = np.argsort(par_idx)
+            self.like.covariance = r['covar'][isort][:, isort].tolist()
+        self.like.syncSrcParams()
+
+        # Compare the change in likelihood with pyLikelihood
+        logLike1 = -self.like()
+        dlnl = (logLike1 - logLike0) - (r['lnl'] - lnl0)
+        self.logger.debug('numpy backend delta-logLike: %f '
+                          'pyLikelihood delta-logLike: %f' %
+                          (r['lnl'] - lnl0, logLike1 - logLike0))
+        if abs(dlnl) > max(0.1, 1E-3 * abs(logLike1 - logLike0)):
+            saved_state.restore()
+            self.logger.warning('Likelihood change from numpy backend '
+                                'differs from pyLikelihood by %f.  '
+                                'Falling back to pyLikelihood.' % dlnl)
+            return None
+
+        quality = 3 if r['success'] else 0
+        stages += [{'optimizer': 'numpy',
+                    'tol': None,
+                    'niter': 1,
+                    'quality': quality,
+                    'nfev': r['nfev'],
+                    'ncall': None,
+                    'time': time.time() - t0,
+                    'logLike': logLike1}]
+
+        return quality
+
+    @staticmethod
+    def _get_nfev(optObject):
+        """Return the number of likelihood evaluations of the last
+        minimization if the optimizer provides it, otherwise None.
+        The evaluations made by the pyLikelihood optimizers are done
+        in C++ and cannot be counted from Python."""
+
+        try:
+            return int(optObject.getNumEvals())
+        except Exception:
+            return None
+
     def _run_fit(self, **kwargs):
 
         try:
@@ -1969,6 +3421,33 @@ class GTAnalysis(fermipy.config.Configurable):
            than this parameter then all model parameters will be
            restored to their values prior to the fit.
 
+        ts_method : str
+           Set the method used to update the TS of free sources
+           (likelihood or approx).
+
+        cascade : list
+           List of optimizer stages (see optimizer.cascade).  Each
+           stage is a dictionary with the optimizer name and
+           tolerance.  The stages are run in sequence with each stage
+           starting from the result of the previous one.  Only the
+           last stage computes the covariance matrix and is retried
+           when the fit quality is poor.
+
+        backend : str
+           Set the likelihood backend (pylike or numpy).  With numpy
+           the fit is performed with fermipy.likelihood.
+           BinnedPoissonLikelihood when all free parameters are
+           spectral parameters of supported models.  Otherwise the
+           fit falls back to pyLikelihood.
+
+        The results of the last optimizer.fit_cache_size fits are
+        cached and keyed by the values, bounds and free state of the
+        model parameters, the energy range and the fit options.  When
+        fit is called with a model state matching a cached fit the
+        parameters are set to the cached best-fit values without
+        rerunning the optimizer.  The cache is cleared whenever a
+        source is added, removed, or modified.
+
         """
 
         if not self.like.logLike.getNumFreeParams():
@@ -1983,20 +3462,99 @@ class GTAnalysis(fermipy.config.Configurable):
         min_fit_quality = kwargs.get('min_fit_quality',
                                      self.config['optimizer'][
                                          'min_fit_quality'])
+        ts_method = kwargs.get('ts_method',
+                               self.config['optimizer']['ts_method'])
+        cache_size = self.config['optimizer']['fit_cache_size']
+        cascade = kwargs.get('cascade', self.config['optimizer']['cascade'])
+        if not cascade:
+            cascade = [{}]
+        backend = kwargs.get('backend', self.config['optimizer']['backend'])
+
+        # Apply any changes to the set of fixed sources once before
+        # the fit
+        self._update_fixed_model()
+
+        fit_key = None
+        if cache_size > 0:
+            fit_key = self._fit_cache_key(covar, tol, retries,
+                                          min_fit_quality, cascade,
+                                          backend)
+
+        if fit_key in self._fit_cache:
+            self._fit_cache_stats['hits'] += 1
+            self.logger.info('Using cached fit result (hits: %i misses: %i)'
+                             % (self._fit_cache_stats['hits'],
+                                self._fit_cache_stats['misses']))
+            r = self._fit_cache[fit_key]
+            self._restore_fit(r)
+            if update and self._fit_results_key != r['key']:
+                self._update_fit_results(r['quality'], r['logLike'],
+                                         ts_method if covar else
+                                         'likelihood')
+                self._fit_results_key = r['key']
+            return r['quality']
+        elif fit_key is not None:
+            self._fit_cache_stats['misses'] += 1
+            self.logger.debug('Fit cache miss (hits: %i misses: %i)'
+                              % (self._fit_cache_stats['hits'],
+                                 self._fit_cache_stats['misses']))
 
         saved_state = LikelihoodState(self.like)
-        kw = dict(optObject=self.create_optObject(),
-                  covar=covar, verbosity=verbosity, tol=tol)
-        #                  optimizer='DRMNFB')
-
-        quality = 0
-        niter = 0
-        max_niter = retries
-        while niter < max_niter:
-            self.logger.debug("Fit iteration: %i" % niter)
-            niter += 1
-            quality = self._run_fit(**kw)
-            if quality > 2: break
+
+        stages = []
+        quality = None
+        if backend == 'numpy':
+            quality = self._fit_numpy(covar, stages)
+
+        if quality is None:
+            for i, stage in enumerate(cascade):
+
+                final = i == len(cascade) - 1
+                optimizer = stage.get('optimizer',
+                                      self.config['optimizer']['optimizer'])
+                kw = dict(optObject=self.create_optObject(optimizer),
+                          covar=covar if final else False,
+                          verbosity=verbosity, tol=stage.get('tol', tol))
+
+                t0 = time.time()
+                ncall0 = self.like.ncall
+                quality = 0
+                niter = 0
+                max_niter = retries if final else 1
+                while niter < max_niter:
+                    self.logger.debug("Fit iteration: %i" % niter)
+                    niter += 1
+                    quality = self._run_fit(**kw)
+                    if quality > 2: break
+
+                stages += [{'optimizer': optimizer,
+                            'tol': kw['tol'],
+                            'niter': niter,
+                            'quality': quality,
+                            'nfev': self._get_nfev(kw['optObject']),
+                            'ncall': self.like.ncall - ncall0,
+                            'time': time.time() - t0,
+                            'logLike': -self.like()}]
+
+                if len(cascade) > 1:
+                    self.logger.info('Fit stage %i %-10s tol: %8.2g '
+                                     'quality: %i nfev: %s time: %8.2f s '
+                                     'logLike: %12.3f' %
+                                     (i, optimizer, kw['tol'], quality,
+                                      stages[-1]['nfev'],
+                                      stages[-1]['time'],
+                                      stages[-1]['logLike']))
+
+                # Later stages only refine the fit and compute the
+                # covariance matrix
+                if not final and not covar and quality > 2:
+                    self.logger.debug('Fit converged in stage %i.  '
+                                      'Skipping remaining stages.' % i)
+                    break
+
+        self._roi_model['roi']['fit_stages'] = stages
+        self._roi_model['roi']['fixed_model_rebuilds'] = \
+            self._fixed_model_rebuilds
 
         #        except Exception, message:
         #            print self.like.optObject.getQuality()
@@ -2013,34 +3571,125 @@ class GTAnalysis(fermipy.config.Configurable):
             saved_state.restore()
             return quality
 
-        if update:
-            for name in self.like.sourceNames():
-                freePars = self.get_free_source_params(name)
-                if len(freePars) == 0: continue
-
-                sd = self.get_src_model(name)
-                src = self.roi.get_source_by_name(name, True)
-                src.update_data(sd)
+        post_key = None
+        if fit_key is not None:
+            post_key = self._fit_cache_key(covar, tol, retries,
+                                           min_fit_quality, cascade,
+                                           backend)
+            r = self._save_fit(post_key, quality, logLike)
+            self._fit_cache[fit_key] = r
+            self._fit_cache[post_key] = r
+            while len(self._fit_cache) > cache_size:
+                self._fit_cache.popitem(last=False)
 
-            self._roi_model['roi']['logLike'] = logLike
-            self._roi_model['roi']['fit_quality'] = quality
-
-            for i, c in enumerate(self.components):
-                self._roi_model['roi']['components'][i]['logLike'] = -c.like()
-
-            # Update roi model counts
-            self._update_roi()
+        if update:
+            self._update_fit_results(quality, logLike,
+                                     ts_method if covar else 'likelihood')
+            self._fit_results_key = post_key
 
         self.logger.debug("Fit returned successfully.")
         self.logger.debug(
             "Fit Quality: %i LogLike: %12.3f" % (quality, logLike))
         return quality
 
+    def _update_fit_results(self, quality, logLike, ts_method):
+        """Update the ROI model and the results of all free sources
+        after a fit."""
+
+        ts = self.ts_all(method=ts_method)
+        for name in self.like.sourceNames():
+            freePars = self.get_free_source_params(name)
+            if len(freePars) == 0: continue
+
+            src = self.roi.get_source_by_name(name, True)
+            self._update_src_data(src, ts=ts.get(name, None))
+
+        self._roi_model['roi']['logLike'] = logLike
+        self._roi_model['roi']['fit_quality'] = quality
+
+        for i, c in enumerate(self.components):
+            self._roi_model['roi']['components'][i]['logLike'] = -c.like()
+
+        # Update roi model counts
+        self._update_roi()
+
+    def _fit_cache_key(self, *args):
+        """Compute a key for the fit cache from the current state of
+        the model parameters, the energy range, and the fit options
+        in args.  Changes of the model that do not change the
+        parameters (e.g. energy dispersion flags) must clear the cache
+        with _clear_fit_cache."""
+
+        pars = self.like.params()
+        h = hashlib.sha1()
+        h.update(np.array([p.getValue() for p in pars]).tostring())
+        h.update(np.array([p.getScale() for p in pars]).tostring())
+        h.update(np.array([p.getBounds() for p in pars]).tostring())
+        h.update(np.array([p.isFree() for p in pars]).tostring())
+        h.update(str((tuple(self.like.sourceNames()), self._erange,
+                      args)))
+        return h.hexdigest()
+
+    def _save_fit(self, key, quality, logLike):
+        """Save the current parameter values and errors for the fit
+        cache."""
+
+        pars = self.like.params()
+        return {'key': key,
+                'quality': quality,
+                'logLike': logLike,
+                'state': LikelihoodState(self.like),
+                'errors': [p.error() for p in pars],
+                'covariance': copy.deepcopy(getattr(self.like, 'covariance',
+                                                    None))}
+
+    def _restore_fit(self, r):
+        """Restore the parameter values and errors of a cached fit."""
+
+        r['state'].restore()
+        for p, err in zip(self.like.params(), r['errors']):
+            p.setError(err)
+        if r['covariance'] is not None:
+            self.like.covariance = copy.deepcopy(r['covariance'])
+
+    def _clear_fit_cache(self):
+        self._fit_cache.clear()
+        self._fit_results_key = None
+
+    def _stop_workers(self):
+        if self._like is not None:
+            self._like.stop_workers()
+
+    def _update_fixed_model(self):
+        """Rebuild the fixed source model of each component for which
+        the set of fixed sources or the parameters of a fixed source
+        have changed.  Returns the number of components for which the
+        fixed model was rebuilt."""
+
+        nrebuild = 0
+        for i, c in enumerate(self.components):
+            if c.update_fixed_model():
+                nrebuild += 1
+            self._roi_model['roi']['components'][i][
+                'fixed_model_rebuilds'] = c.fixed_model_rebuilds
+
+        if nrebuild:
+            self._fixed_model_rebuilds += 1
+            self.logger.debug('Rebuilt fixed model of %i components '
+                              '(rebuilds: %i)' % (nrebuild,
+                                                  self._fixed_model_rebuilds))
+
+        return nrebuild
+
     def load_xml(self, xmlfile):
         """Load model definition from XML."""
 
+        self._flush_lazy_sources()
+
         for c in self.components:
             c.load_xml(xmlfile)
+        self._clear_fit_cache()
+        self._stop_workers()
 
     def write_xml(self, xmlfile, save_model_map=True):
         """Save current model definition as XML file.
@@ -2063,22 +3712,65 @@ class GTAnalysis(fermipy.config.Configurable):
             c.write_xml(xmlfile)
 
         if not save_model_map: return []
-        return self.generate_model_map(model_name)
+        maps = self._make_model_maps()
+        self._model_maps.write(self._store_model_maps(model_name, maps))
+        return maps
 
     def generate_model_map(self, model_name, name=None):
+        """Generate model counts maps for the ROI (or a single source
+        if name is not None).  The maps are added to the in-memory map
+        store and are written to disk when write_roi is called.
+
+        Parameters
+        ----------
+
+        model_name : str
+            Name of the model.  The maps are stored under
+            mcube_<model_name> (coadded map) and
+            mcube_<model_name><file_suffix> (component maps).
+
+        name : str
+            Source name.
+
+        Returns
+        -------
+
+        maps : list
+            List of Map objects with the coadded map followed by the
+            map of each component.
+        """
+
+        maps = self._make_model_maps(name)
+        self._store_model_maps(model_name, maps)
+        return maps
+
+    def _make_model_maps(self, name=None):
+        """Compute the model counts maps of the ROI (or of a single
+        source if name is not None) without writing them to disk.
+        Returns a list containing the coadded map followed by the maps
+        of each component."""
 
         maps = []
         for i, c in enumerate(self._components):
-            maps += [c.generate_model_map(model_name, name)]
-
-        outfile = os.path.join(self.config['fileio']['workdir'],
-                               'mcube_%s.fits' % (model_name))
+            maps += [c.model_counts_map(name)]
 
         shape = (self.enumbins, self.npix, self.npix)
         model_counts = utils.make_coadd_map(maps, self._wcs, shape)
-        utils.write_fits_image(model_counts.counts, model_counts.wcs, outfile)
         return [model_counts] + maps
 
+    def _store_model_maps(self, model_name, maps):
+        """Add model maps to the in-memory map store.  Returns the
+        names of the stored maps."""
+
+        names = ['mcube_%s' % model_name]
+        names += ['mcube_%s%s' % (model_name, c.config['file_suffix'])
+                  for c in self._components]
+
+        for k, cmap in zip(names, maps):
+            self._model_maps.put(k, cmap)
+
+        return names
+
     def print_roi(self):
         print(str(self.roi))
 
@@ -2133,8 +3825,13 @@ class GTAnalysis(fermipy.config.Configurable):
             if not os.path.isabs(outfile):
                 outfile = os.path.join(self._savedir, outfile)
 
+        self._eval_lazy_sources()
+
         mcube_maps = self.write_xml(prefix, save_model_map=save_model_map)
 
+        if self.config['fileio']['savefits']:
+            self._model_maps.write()
+
         if make_residuals:
             maps = self.residmap(prefix, make_plots=False)
         #        else:
@@ -2214,7 +3911,7 @@ class GTAnalysis(fermipy.config.Configurable):
 
         p = ExtensionPlotter(src, self.roi, '',
                              self.config['fileio']['workdir'],
-                             erange=erange)
+                             erange=erange, mapstore=self._model_maps)
 
         fig = plt.figure()
         p.plot(0)
@@ -2241,7 +3938,7 @@ class GTAnalysis(fermipy.config.Configurable):
 
             p = ExtensionPlotter(src, self.roi, suffix,
                                  self.config['fileio']['workdir'],
-                                 erange=erange)
+                                 erange=erange, mapstore=self._model_maps)
 
             fig = plt.figure()
             p.plot(0)
@@ -2426,9 +4123,43 @@ class GTAnalysis(fermipy.config.Configurable):
         make_counts_spectrum_plot(self._roi_model, self.roi, self.energies,
                                   imfile)
 
-    def tsmap(self):
+    def tsmap(self, prefix='', **kwargs):
         """Loop over ROI, place a test source at each position, and
-        evaluated the TS for that source."""
+        evaluated the TS for that source.
+
+        Parameters
+        ----------
+
+        prefix : str
+            String that will be prefixed to the output file names.
+
+        index : float or list
+            Spectral index of the power-law test source.  If a list
+            with more than one index is given this method will
+            generate a TS cube with dimensions (nindex,npix,npix) in a
+            single pass.  The background model, counts and PSF kernel
+            are shared by all indices and only the energy weighting
+            of the test source kernel is changed.  The return value
+            is then a dictionary containing the TS cube and a map of
+            the best-fit index.
+
+        exclude : str or list of str
+            Source or sources that will be removed from the
+            background model when generating a TS cube.
+
+        """
+
+        index = np.array(kwargs.get('index', self.config['tsmap']['index']),
+                         ndmin=1, dtype=float)
+
+        if len(index) > 1:
+            tsg = TSCubeGenerator(self.config['tsmap'], self,
+                                  fileio=self.config['fileio'],
+                                  logging=self.config['logging'])
+            o = tsg.run(prefix, **kwargs)
+            self._roi_model['roi']['tscube'] = {'file': o['file'],
+                                                'index': o['index']}
+            return o
 
         logLike0 = -self.like()
         self.logger.info('LogLike: %f' % logLike0)
@@ -2463,7 +4194,7 @@ class GTAnalysis(fermipy.config.Configurable):
             'ra': radec[0][0],
             'dec': radec[1][0],
             'SpectrumType': 'PowerLaw',
-            'Index': 2.0,
+            'Index': float(index[0]),
             'Scale': 1000,
             'Prefactor': {'value': 0.0, 'scale': 1e-13},
             'SpatialModel': 'PSFSource',
@@ -2471,16 +4202,12 @@ class GTAnalysis(fermipy.config.Configurable):
 
         #        src = self.roi.get_source_by_name('tsmap_testsource',True)
 
-        for i, (ra, dec) in enumerate(zip(radec[0], radec[1])):
-            testsource_dict['ra'] = ra
-            testsource_dict['dec'] = dec
-            #                        src.set_position([ra,dec])
-            self.add_source('tsmap_testsource', testsource_dict, free=True,
-                            init_source=False)
+        self.add_source('tsmap_testsource', testsource_dict, free=True,
+                        init_source=False)
 
-            #            for c in self.components:
-            #                c.update_srcmap_file([src],True)
+        for i, (ra, dec) in enumerate(zip(radec[0], radec[1])):
 
+            self.move_source('tsmap_testsource', [ra, dec])
             self.set_parameter('tsmap_testsource', 'Prefactor', 0.0)
             self.fit(update=False)
 
@@ -2489,15 +4216,16 @@ class GTAnalysis(fermipy.config.Configurable):
 
             data.flat[i] = ts
 
-            #            print i, ra, dec, ts
-            #            print self.like()
-            #            print self.components[0].like.model['tsmap_testsource']
-
-            self.delete_source('tsmap_testsource')
+        self.delete_source('tsmap_testsource')
 
         saved_state.restore()
 
-        outfile = os.path.join(self.config['fileio']['workdir'], 'tsmap.fits')
+        if prefix:
+            outfile = '%s_tsmap.fits' % prefix
+        else:
+            outfile = 'tsmap.fits'
+
+        outfile = os.path.join(self.config['fileio']['workdir'], outfile)
         utils.write_fits_image(data, w, outfile)
 
     def _bowtie(self, fd, energies=None):
@@ -2546,9 +4274,28 @@ class GTAnalysis(fermipy.config.Configurable):
 
         return copy.deepcopy(self._roi_model)
 
-    def get_src_model(self, name, paramsonly=False):
+    def get_src_model(self, name, paramsonly=False, lazy=False, ts=None):
         """Compose a dictionary for the given source with the current
-        best-fit parameters."""
+        best-fit parameters.
+
+        Parameters
+        ----------
+
+        name : str
+            Source name.
+
+        paramsonly : bool
+            Skip the computation of TS, flux errors and upper limits.
+
+        lazy : bool
+            Skip the computation of the likelihood profile and the
+            upper limits derived from it.  The fields that are skipped
+            are listed in lazy_src_keys.
+
+        ts : float
+            TS of the source.  If None the TS is computed with
+            Ts2.
+        """
 
         self.logger.debug('Generating source dict for ' + name)
 
@@ -2624,6 +4371,9 @@ class GTAnalysis(fermipy.config.Configurable):
         if not self.get_free_source_params(name) or paramsonly:
             return src_dict
 
+        if ts is None:
+            ts = self.like.Ts2(name, reoptimize=False)
+
         try:
             src_dict['flux'][1] = self.like.fluxError(name,
                                                       10 ** self.energies[0],
@@ -2649,32 +4399,8 @@ class GTAnalysis(fermipy.config.Configurable):
         #            self.logger.error('Failed to update source parameters.',
         #  exc_info=True)
 
-        lnlp = self.profile_norm(name, savestate=True)
-
-        src_dict['lnlprofile'] = lnlp
-
-        flux, flux_ul95, flux_err_lo, flux_err_hi, dlnl0 = get_upper_limit(
-            lnlp['dlogLike'],
-            lnlp['flux'])
-        eflux, eflux_ul95, eflux_err_lo, eflux_err_hi, dlnl0 = get_upper_limit(
-            lnlp['dlogLike'],
-            lnlp['eflux'])
-
-        src_dict['flux_ul95'] = flux_ul95
-        src_dict['flux100_ul95'] = src_dict['flux100'][0] * (
-        flux_ul95 / src_dict['flux'][0])
-        src_dict['flux1000_ul95'] = src_dict['flux1000'][0] * (
-        flux_ul95 / src_dict['flux'][0])
-        src_dict['flux10000_ul95'] = src_dict['flux10000'][0] * (
-        flux_ul95 / src_dict['flux'][0])
-
-        src_dict['eflux_ul95'] = eflux_ul95
-        src_dict['eflux100_ul95'] = src_dict['eflux100'][0] * (
-        eflux_ul95 / src_dict['eflux'][0])
-        src_dict['eflux1000_ul95'] = src_dict['eflux1000'][0] * (
-        eflux_ul95 / src_dict['eflux'][0])
-        src_dict['eflux10000_ul95'] = src_dict['eflux10000'][0] * (
-        eflux_ul95 / src_dict['eflux'][0])
+        if not lazy:
+            self._update_src_profile(name, src_dict)
 
         # Extract covariance matrix
         fd = None
@@ -2714,10 +4440,41 @@ class GTAnalysis(fermipy.config.Configurable):
                 pyLike.dArg(10 ** e0))
             src_dict['dfde'][1] = fd.error(10 ** e0)
 
-        src_dict['ts'] = self.like.Ts2(name, reoptimize=False)
+        src_dict['ts'] = ts
 
         return src_dict
 
+    def _update_src_profile(self, name, src_dict):
+        """Compute the likelihood profile of the normalization of a
+        source and the upper limits derived from it."""
+
+        lnlp = self.profile_norm(name, savestate=True)
+
+        src_dict['lnlprofile'] = lnlp
+
+        flux, flux_ul95, flux_err_lo, flux_err_hi, dlnl0 = get_upper_limit(
+            lnlp['dlogLike'],
+            lnlp['flux'])
+        eflux, eflux_ul95, eflux_err_lo, eflux_err_hi, dlnl0 = get_upper_limit(
+            lnlp['dlogLike'],
+            lnlp['eflux'])
+
+        src_dict['flux_ul95'] = flux_ul95
+        src_dict['flux100_ul95'] = src_dict['flux100'][0] * (
+        flux_ul95 / src_dict['flux'][0])
+        src_dict['flux1000_ul95'] = src_dict['flux1000'][0] * (
+        flux_ul95 / src_dict['flux'][0])
+        src_dict['flux10000_ul95'] = src_dict['flux10000'][0] * (
+        flux_ul95 / src_dict['flux'][0])
+
+        src_dict['eflux_ul95'] = eflux_ul95
+        src_dict['eflux100_ul95'] = src_dict['eflux100'][0] * (
+        eflux_ul95 / src_dict['eflux'][0])
+        src_dict['eflux1000_ul95'] = src_dict['eflux1000'][0] * (
+        eflux_ul95 / src_dict['eflux'][0])
+        src_dict['eflux10000_ul95'] = src_dict['eflux10000'][0] * (
+        eflux_ul95 / src_dict['eflux'][0])
+
 
 class GTBinnedAnalysis(fermipy.config.Configurable):
     defaults = dict(selection=defaults.selection,
@@ -2770,6 +4527,25 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         self._srcmdl_file = join(workdir,
                                  'srcmdl%s.xml' % self.config['file_suffix'])
 
+        self._srcmap_checked = set()
+
+        # Keys of the data products in the working directory and
+        # shared cache of data products
+        self._manifest = ProductManifest(
+            join(workdir, 'products%s.yaml' % self.config['file_suffix']))
+        self._products = None
+        if self.config['fileio']['product_cache'] is not None:
+            self._products = ProductCache(
+                self.config['fileio']['product_cache'],
+                self.config['fileio']['product_cache_size'],
+                link=self.config['fileio']['product_cache_link'],
+                logger=self.logger)
+
+        # Names of the sources in the fixed model and number of times
+        # the fixed model has been rebuilt
+        self._fixed_sources = None
+        self._fixed_model_rebuilds = 0
+
         if self.config['binning']['enumbins'] is not None:
             self._enumbins = int(self.config['binning']['enumbins'])
         else:
@@ -2972,6 +4748,133 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
                 self.like.logLike.eraseSourceMap(s.name)
         self._roi.delete_sources(srcs)
 
+    # Tolerances of the comparison between the source map of
+    # move_source and the pyLikelihood source map: maximum fractional
+    # difference of the counts and maximum offset of the centroid in
+    # pixels in any energy plane
+    srcmap_check_tol = 0.05
+    srcmap_check_centroid_tol = 0.1
+
+    def move_source(self, name, skydir):
+        """Move a source to a new position by replacing its direction
+        and in-memory source map.
+
+        The source map of a moved source (including point sources) is
+        computed with utils.make_srcmap instead of gtsrcmaps.  This
+        uses the PSF and exposure at the ROI center and therefore
+        differs from the gtsrcmaps map by the spatial variation of
+        the exposure and PSF across the ROI.  On the first move of
+        each source both maps are compared at the original position
+        of the source."""
+
+        src = self.roi.get_source_by_name(name, True)
+
+        if self.like is not None:
+            self._check_srcmap(src)
+
+        src.set_position(skydir)
+
+        if self.like is None:
+            return
+
+        self._update_source_map(src)
+
+        if src['SpatialType'] == 'SkyDirFunction':
+            pylike_src = pyLike.PointSource_cast(
+                self.like.logLike.getSource(src.name))
+            pylike_src.setDir(src.skydir.ra.deg, src.skydir.dec.deg, False,
+                              False)
+
+    def set_spatial_model(self, name, spatial_model, spatial_width=None):
+        """Change the spatial model or width of a source by replacing
+        its in-memory source map.  The new spatial model must have the
+        same spatial type as the current one (e.g. GaussianSource and
+        DiskSource may be interchanged)."""
+
+        src = self.roi.get_source_by_name(name, True)
+        spatial_type = src['SpatialType']
+        src.set_spatial_model(spatial_model, spatial_width)
+
+        if src['SpatialType'] != spatial_type:
+            raise Exception('Cannot change spatial type of %s from %s to %s.'
+                            % (src.name, spatial_type, src['SpatialType']))
+
+        if self.like is None:
+            return
+
+        self._update_source_map(src)
+
+    def _update_source_map(self, src):
+        k = self._make_shifted_srcmap(src)
+        self.like.logLike.setSourceMapImage(src.name, np.ravel(k))
+
+    def _check_srcmap(self, src):
+        """Compare the source map computed by _make_shifted_srcmap
+        with the pyLikelihood source map of a source at its current
+        position.  The fractional difference of the counts, the offset
+        of the centroid, and the maximum pixel difference in each
+        energy plane are logged and a warning is issued if the counts
+        or the centroid differ by more than srcmap_check_tol and
+        srcmap_check_centroid_tol.  Each source is only checked
+        once."""
+
+        if src.name in self._srcmap_checked:
+            return
+        self._srcmap_checked.add(src.name)
+
+        m0 = self.get_srcmap(src.name)
+        if m0 is None:
+            return
+
+        m1 = self._make_shifted_srcmap(src)
+        if m1.shape != m0.shape:
+            return
+
+        s0 = np.sum(m0, axis=(1, 2))
+        s1 = np.sum(m1, axis=(1, 2))
+        msk = s0 > 0
+        if not np.any(msk):
+            return
+
+        def centroid(m):
+            y, x = np.indices(m.shape[1:])
+            norm = np.sum(m, axis=(1, 2))
+            return np.array([np.sum(m * x, axis=(1, 2)) / norm,
+                             np.sum(m * y, axis=(1, 2)) / norm])
+
+        fdiff = np.max(np.abs(s1[msk] / s0[msk] - 1.0))
+        cdiff = np.max(np.sqrt(np.sum((centroid(m1[msk]) -
+                                       centroid(m0[msk])) ** 2, axis=0)))
+        pdiff = np.max(np.abs(m1[msk] - m0[msk]) /
+                       np.max(m0[msk], axis=(1, 2))[:, np.newaxis, np.newaxis])
+        self.logger.debug('Source map of %s: max fractional difference '
+                          'in counts %.4f, max centroid offset %.4f pix, '
+                          'max pixel difference %.4f relative to peak' %
+                          (src.name, fdiff, cdiff, pdiff))
+
+        if fdiff > self.srcmap_check_tol or \
+                cdiff > self.srcmap_check_centroid_tol:
+            self.logger.warning('Source map of %s computed by move_source '
+                                'differs from the gtsrcmaps map by up to '
+                                '%.1f%% in counts and %.3f pixels in '
+                                'centroid.' % (src.name, 100. * fdiff, cdiff))
+
+    def _make_shifted_srcmap(self, src):
+        """Generate the source map for a source at an arbitrary
+        position with utils.make_srcmap."""
+
+        spatial_model = src['SpatialModel']
+        if spatial_model in ['PointSource', 'Gaussian']:
+            spatial_model = 'PSFSource'
+
+        xpix, ypix = utils.skydir_to_pix(src.skydir, self._skywcs)
+        xpix0, ypix0 = utils.skydir_to_pix(self.roi.skydir, self._skywcs)
+        return utils.make_srcmap(src.skydir, self._psf, spatial_model,
+                                 src['SpatialWidth'], npix=self.npix,
+                                 xpix=xpix - xpix0, ypix=ypix - ypix0,
+                                 cdelt=self.config['binning']['binsz'],
+                                 rebin=4)
+
     def set_edisp_flag(self, name, flag=True):
         src = self.roi.get_source_by_name(name, True)
         name = src.name
@@ -2993,6 +4896,51 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         z = np.array(z).reshape(self.enumbins, self.npix, self.npix)
         return Map(z, copy.deepcopy(self.wcs))
 
+    @property
+    def fixed_model_rebuilds(self):
+        """Number of times the fixed source model has been rebuilt."""
+        return self._fixed_model_rebuilds
+
+    def get_fixed_sources(self):
+        """Return the names of the sources with no free
+        parameters."""
+
+        return frozenset([name for name in self.like.sourceNames()
+                          if len(self.like.freePars(name)) == 0])
+
+    def update_fixed_model(self, force=False):
+        """Rebuild the model of the fixed sources if the set of fixed
+        sources has changed since the last rebuild or pyLikelihood
+        reports that the fixed model is out of date.  Freeing or fixing
+        parameters only marks the fixed model as stale so several
+        changes can be applied with a single rebuild.
+
+        Parameters
+        ----------
+
+        force : bool
+            Rebuild the fixed model unconditionally.
+
+        Returns
+        -------
+
+        rebuilt : bool
+            True if the fixed model was rebuilt.
+        """
+
+        fixed = self.get_fixed_sources()
+        if (not force and fixed == self._fixed_sources and
+                self.like.logLike.fixedModelUpdated()):
+            return False
+
+        self.like.logLike.buildFixedModelWts(True)
+        self._fixed_sources = fixed
+        self._fixed_model_rebuilds += 1
+        self.logger.debug('Rebuilt fixed model with %i sources '
+                          '(rebuilds: %i)' % (len(fixed),
+                                              self._fixed_model_rebuilds))
+        return True
+
     def model_counts_map(self, name=None, exclude=None):
         """Return the model counts map for a single source, a list of
         sources, or for the sum of all sources in the ROI.
@@ -3030,9 +4978,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             srcs = self.roi.get_source_by_name(t)
             for s in srcs: excluded_srcnames += [s.name]
 
-        self.like.logLike.buildFixedModelWts()
-        if not self.like.logLike.fixedModelUpdated():
-            self.like.logLike.buildFixedModelWts(True)
+        self.update_fixed_model()
 
         src_names = []
         if (name is None or name == 'all') and not excluded_srcnames:
@@ -3080,7 +5026,62 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         if xmlfile is not None:
             srcmdl_file = self.get_model_path(xmlfile)
 
+        # The PSF model is created concurrently with the steps that
+        # do not depend on it
+        pipeline = self.create_pipeline(xmlfile, psf=True)
+        pipeline.run(self.config['gtlike']['setup_nthreads'])
+
+        # Create templates for extended sources
+        self.update_srcmap_file(None, True)
+
+        self._create_likelihood(srcmdl_file)
+
+        self.logger.info(
+            'Finished setup for Analysis Component: %s' % self.name)
+
+    def run_preprocessing(self, xmlfile=None):
+        """Generate the data products of this component with the
+        ScienceTools (gtselect, gtmktime, gtltcube, gtbin, gtexpcube2,
+        gtsrcmaps).  Steps for which the output file is up to date
+        are skipped.  This method only writes files to the working
+        directory and can be run in a separate process before setup."""
+
+        pipeline = self.create_pipeline(xmlfile)
+        pipeline.run(self.config['gtlike']['setup_nthreads'])
+
+    def create_pipeline(self, xmlfile=None, psf=False):
+        """Create the pipeline of setup steps of this component.  Each
+        step declares the files that it reads and generates and steps
+        that do not depend on each other (e.g. gtbin and gtexpcube2)
+        can be run concurrently.  The two gtexpcube2 steps are run
+        serially since they share a parameter file.
+
+        Parameters
+        ----------
+
+        xmlfile : str
+            Override the XML model file.
+
+        psf : bool
+            Add a step that loads the livetime cube and creates the
+            PSF model of this component.
+
+        Returns
+        -------
+
+        pipeline : `~fermipy.pipeline.Pipeline`
+        """
+
+        srcmdl_file = self._srcmdl_file
+        if xmlfile is not None:
+            srcmdl_file = self.get_model_path(xmlfile)
+
+        # Reload the manifest which may have been updated by another
+        # process
+        self._manifest.load()
+
         roi_center = self.roi.skydir
+        pipeline = Pipeline(self.logger)
 
         # Run gtselect and gtmktime
         kw_gtselect = dict(infile=self.config['data']['evfile'],
@@ -3103,21 +5104,35 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
                            roicut=self.config['selection']['roicut'],
                            filter=self.config['selection']['filter'])
 
-        if not os.path.isfile(self._ft1_file):
+        run_mktime = (self.config['selection']['roicut'] == 'yes' or
+                      self.config['selection']['filter'] is not None)
+
+        def run_gtselect():
             run_gtapp('gtselect', self.logger, kw_gtselect)
-            if self.config['selection']['roicut'] == 'yes' or \
-                            self.config['selection']['filter'] is not None:
+            if run_mktime:
                 run_gtapp('gtmktime', self.logger, kw_gtmktime)
                 os.system(
                     'mv %s %s' % (self._ft1_filtered_file, self._ft1_file))
-        else:
-            self.logger.debug('Skipping gtselect')
+
+        # The gtmktime parameters are only part of the product key
+        # when gtmktime is run
+        kw_select = copy.copy(kw_gtselect)
+        if run_mktime:
+            for k in ['scfile', 'roicut', 'filter']:
+                kw_select['gtmktime_' + k] = kw_gtmktime[k]
+
+        pipeline.add_step('gtselect',
+                          lambda: self._run_step('gtselect', kw_select,
+                                                 self._ft1_file,
+                                                 fn=run_gtselect),
+                          inputs=[self.config['data']['evfile']],
+                          outputs=[self._ft1_file])
 
         # Run gtltcube
-        kw = dict(evfile=self._ft1_file,
-                  scfile=self.config['data']['scfile'],
-                  outfile=self._ltcube,
-                  zmax=self.config['selection']['zmax'])
+        kw_gtltcube = dict(evfile=self._ft1_file,
+                           scfile=self.config['data']['scfile'],
+                           outfile=self._ltcube,
+                           zmax=self.config['selection']['zmax'])
 
         if self.config['data']['ltcube'] is not None:
 
@@ -3129,10 +5144,167 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             if not os.path.isfile(self._ltcube):
                 raise Exception('Invalid livetime cube: %s' % self._ltcube)
 
-        elif not os.path.isfile(self._ltcube):
-            run_gtapp('gtltcube', self.logger, kw)
         else:
-            self.logger.debug('Skipping gtltcube')
+            # The livetime cube only depends on the GTIs of the event
+            # file
+            def run_gtltcube():
+                fp = {'evfile': gti_fingerprint(self._ft1_file)}
+                self._run_step('gtltcube', kw_gtltcube, self._ltcube,
+                               fingerprints=fp)
+
+            pipeline.add_step('gtltcube', run_gtltcube,
+                              inputs=[self._ft1_file],
+                              outputs=[self._ltcube])
+
+        # Run gtbin
+        kw_gtbin = dict(algorithm='ccube',
+                        nxpix=self.npix, nypix=self.npix,
+                        binsz=self.config['binning']['binsz'],
+                        evfile=self._ft1_file,
+                        outfile=self._ccube_file,
+                        scfile=self.config['data']['scfile'],
+                        xref=self._xref,
+                        yref=self._yref,
+                        axisrot=0,
+                        proj=self.config['binning']['proj'],
+                        ebinalg='LOG',
+                        emin=self.config['selection']['emin'],
+                        emax=self.config['selection']['emax'],
+                        enumbins=self._enumbins,
+                        coordsys=self.config['binning']['coordsys'],
+                        chatter=self.config['logging']['chatter'])
+
+        if self.config['binning']['binner'] == 'numpy':
+            kw_gtbin['binner'] = 'numpy'
+            run_gtbin = lambda: self._run_step('gtbin', kw_gtbin,
+                                               self._ccube_file,
+                                               fn=self._bin_counts_cube)
+        elif self.config['binning']['binner'] == 'gtbin':
+            run_gtbin = lambda: self._run_step('gtbin', kw_gtbin,
+                                               self._ccube_file)
+        else:
+            raise Exception('Unrecognized binner: %s' %
+                            self.config['binning']['binner'])
+
+        pipeline.add_step('gtbin', run_gtbin,
+                          inputs=[self._ft1_file],
+                          outputs=[self._ccube_file])
+
+        evtype = self.config['selection']['evtype']
+
+        if self.config['gtlike']['irfs'] == 'CALDB':
+            cmap = self._ccube_file
+        else:
+            cmap = 'none'
+
+        # Run gtexpcube2
+        kw_bexpmap = dict(infile=self._ltcube, cmap=cmap,
+                          ebinalg='LOG',
+                          emin=self.config['selection']['emin'],
+                          emax=self.config['selection']['emax'],
+                          enumbins=self._enumbins,
+                          outfile=self._bexpmap_file, proj='CAR',
+                          nxpix=360, nypix=180, binsz=1,
+                          xref=0.0, yref=0.0,
+                          evtype=evtype,
+                          irfs=self.config['gtlike']['irfs'],
+                          coordsys=self.config['binning']['coordsys'],
+                          chatter=self.config['logging']['chatter'])
+
+        pipeline.add_step('gtexpcube2',
+                          lambda: self._run_step('gtexpcube2', kw_bexpmap,
+                                                 self._bexpmap_file),
+                          inputs=[self._ltcube, cmap],
+                          outputs=[self._bexpmap_file],
+                          group='gtexpcube2')
+
+        kw_bexpmap_roi = dict(infile=self._ltcube, cmap='none',
+                              ebinalg='LOG',
+                              emin=self.config['selection']['emin'],
+                              emax=self.config['selection']['emax'],
+                              enumbins=self._enumbins,
+                              outfile=self._bexpmap_roi_file, proj='CAR',
+                              nxpix=self.npix, nypix=self.npix,
+                              binsz=self.config['binning']['binsz'],
+                              xref=self._xref, yref=self._yref,
+                              evtype=self.config['selection']['evtype'],
+                              irfs=self.config['gtlike']['irfs'],
+                              coordsys=self.config['binning']['coordsys'],
+                              chatter=self.config['logging']['chatter'])
+
+        pipeline.add_step('gtexpcube2_roi',
+                          lambda: self._run_step('gtexpcube2',
+                                                 kw_bexpmap_roi,
+                                                 self._bexpmap_roi_file),
+                          inputs=[self._ltcube],
+                          outputs=[self._bexpmap_roi_file],
+                          group='gtexpcube2')
+
+        def write_srcmdl():
+
+            # Make spatial templates for extended sources
+            for s in self.roi.sources:
+                if s.diffuse: continue
+                if not s.extended: continue
+                self.make_template(s, self.config['file_suffix'])
+
+            # Write ROI XML
+            if not os.path.isfile(srcmdl_file):
+                self.roi.write_xml(srcmdl_file)
+
+        pipeline.add_step('srcmdl', write_srcmdl, outputs=[srcmdl_file])
+
+        # Run gtsrcmaps
+        kw_gtsrcmaps = dict(scfile=self.config['data']['scfile'],
+                            expcube=self._ltcube,
+                            cmap=self._ccube_file,
+                            srcmdl=srcmdl_file,
+                            bexpmap=self._bexpmap_file,
+                            outfile=self._srcmap_file,
+                            irfs=self.config['gtlike']['irfs'],
+                            evtype=evtype,
+                            rfactor=self.config['gtlike']['rfactor'],
+                            #                   resample=self.config['resample'],
+                            minbinsz=self.config['gtlike']['minbinsz'],
+                            chatter=self.config['logging']['chatter'],
+                            emapbnds='no')
+
+        def run_gtsrcmaps():
+            if self.config['gtlike']['srcmap'] and self.config['gtlike'][
+                'bexpmap']:
+                if not os.path.isfile(self._srcmap_file):
+                    self.make_scaled_srcmap()
+                else:
+                    self.logger.debug('Skipping gtsrcmaps')
+            else:
+                # Source maps are updated in place and are therefore
+                # copied from the cache
+                self._run_step('gtsrcmaps', kw_gtsrcmaps, self._srcmap_file,
+                               link=False)
+
+        pipeline.add_step('gtsrcmaps', run_gtsrcmaps,
+                          inputs=[self._ltcube, self._ccube_file,
+                                  srcmdl_file, self._bexpmap_file],
+                          outputs=[self._srcmap_file])
+
+        if psf:
+            pipeline.add_step('psf', self._create_psf,
+                              inputs=[self._ltcube])
+
+        return pipeline
+
+    def _bin_counts_cube(self):
+        """Generate the counts cube from the selected FT1 file with
+        fermipy.binning instead of gtbin."""
+
+        self.logger.info('Binning counts cube')
+
+        evfiles = get_event_files(self._ft1_file)
+        cube = CountsCube(self._skywcs, self.npix, self.energies)
+        bin_events(evfiles, [cube])
+        write_ccube(self._ccube_file, cube, evfiles)
+
+    def _create_psf(self):
 
         self.logger.debug('Loading LT Cube %s' % self._ltcube)
         self._ltc = irfs.LTCube.create(self._ltcube)
@@ -3143,110 +5315,73 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
                                   self.config['selection']['evtype'],
                                   self.energies)
 
-        # Run gtbin
-        kw = dict(algorithm='ccube',
-                  nxpix=self.npix, nypix=self.npix,
-                  binsz=self.config['binning']['binsz'],
-                  evfile=self._ft1_file,
-                  outfile=self._ccube_file,
-                  scfile=self.config['data']['scfile'],
-                  xref=self._xref,
-                  yref=self._yref,
-                  axisrot=0,
-                  proj=self.config['binning']['proj'],
-                  ebinalg='LOG',
-                  emin=self.config['selection']['emin'],
-                  emax=self.config['selection']['emax'],
-                  enumbins=self._enumbins,
-                  coordsys=self.config['binning']['coordsys'],
-                  chatter=self.config['logging']['chatter'])
+    def _run_step(self, appname, kw, outfile, fn=None, link=None,
+                  fingerprints=None):
+        """Generate a data product with a ScienceTools application.
+        The product is identified by a key computed from the
+        application parameters and the fingerprints of its input
+        files.  Input files generated by previous steps are
+        fingerprinted by their key.  The step is skipped if outfile
+        exists and was generated with the same key.  Otherwise the
+        product is retrieved from the product cache (if enabled) or
+        generated by calling fn.
 
-        if not os.path.isfile(self._ccube_file):
-            run_gtapp('gtbin', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtbin')
+        Parameters
+        ----------
 
-        evtype = self.config['selection']['evtype']
+        appname : str
+            Name of the application.
 
-        if self.config['gtlike']['irfs'] == 'CALDB':
-            cmap = self._ccube_file
-        else:
-            cmap = 'none'
+        kw : dict
+            Application parameters.
 
-        # Run gtexpcube2
-        kw = dict(infile=self._ltcube, cmap=cmap,
-                  ebinalg='LOG',
-                  emin=self.config['selection']['emin'],
-                  emax=self.config['selection']['emax'],
-                  enumbins=self._enumbins,
-                  outfile=self._bexpmap_file, proj='CAR',
-                  nxpix=360, nypix=180, binsz=1,
-                  xref=0.0, yref=0.0,
-                  evtype=evtype,
-                  irfs=self.config['gtlike']['irfs'],
-                  coordsys=self.config['binning']['coordsys'],
-                  chatter=self.config['logging']['chatter'])
+        outfile : str
+            Path to the output file.
 
-        if not os.path.isfile(self._bexpmap_file):
-            run_gtapp('gtexpcube2', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtexpcube')
-
-        kw = dict(infile=self._ltcube, cmap='none',
-                  ebinalg='LOG',
-                  emin=self.config['selection']['emin'],
-                  emax=self.config['selection']['emax'],
-                  enumbins=self._enumbins,
-                  outfile=self._bexpmap_roi_file, proj='CAR',
-                  nxpix=self.npix, nypix=self.npix,
-                  binsz=self.config['binning']['binsz'],
-                  xref=self._xref, yref=self._yref,
-                  evtype=self.config['selection']['evtype'],
-                  irfs=self.config['gtlike']['irfs'],
-                  coordsys=self.config['binning']['coordsys'],
-                  chatter=self.config['logging']['chatter'])
+        fn : function
+            Function that generates outfile.  If None the application
+            is run with kw.
 
-        if not os.path.isfile(self._bexpmap_roi_file):
-            run_gtapp('gtexpcube2', self.logger, kw)
-        else:
-            self.logger.debug('Skipping local gtexpcube')
+        link : bool
+            Link the cached product into the working directory (see
+            ProductCache.fetch).
 
-        # Make spatial templates for extended sources
-        for s in self.roi.sources:
-            if s.diffuse: continue
-            if not s.extended: continue
-            self.make_template(s, self.config['file_suffix'])
+        fingerprints : dict
+            Fingerprints overriding those of the input files.
+        """
 
-        # Write ROI XML
-        if not os.path.isfile(srcmdl_file):
-            self.roi.write_xml(srcmdl_file)
+        if fn is None:
+            fn = lambda: run_gtapp(appname, self.logger, kw)
+
+        fp = self._manifest.fingerprints()
+        if fingerprints is not None:
+            fp.update(fingerprints)
+        key = ProductCache.key(appname, kw, fp)
+        outkey = self._manifest.get(outfile)
+
+        # Products generated before the manifest was introduced are
+        # assumed to be valid
+        if os.path.isfile(outfile) and outkey in [None, key]:
+            self.logger.debug('Skipping %s' % appname)
+            if outkey is None:
+                self._manifest.set(outfile, key)
+            return
+        elif os.path.lexists(outfile):
+            self.logger.info('%s is out of date' %
+                             os.path.basename(outfile))
+            os.remove(outfile)
 
-        # Run gtsrcmaps
-        kw = dict(scfile=self.config['data']['scfile'],
-                  expcube=self._ltcube,
-                  cmap=self._ccube_file,
-                  srcmdl=srcmdl_file,
-                  bexpmap=self._bexpmap_file,
-                  outfile=self._srcmap_file,
-                  irfs=self.config['gtlike']['irfs'],
-                  evtype=evtype,
-                  rfactor=self.config['gtlike']['rfactor'],
-                  #                   resample=self.config['resample'],
-                  minbinsz=self.config['gtlike']['minbinsz'],
-                  chatter=self.config['logging']['chatter'],
-                  emapbnds='no')
+        if self._products is None or not self._products.fetch(key, outfile,
+                                                               link):
+            fn()
+            if self._products is not None and os.path.isfile(outfile):
+                self._products.store(key, outfile)
 
-        if not os.path.isfile(self._srcmap_file):
-            if self.config['gtlike']['srcmap'] and self.config['gtlike'][
-                'bexpmap']:
-                self.make_scaled_srcmap()
-            else:
-                run_gtapp('gtsrcmaps', self.logger, kw)
-        else:
-            self.logger.debug('Skipping gtsrcmaps')
+        self._manifest.set(outfile, key)
 
-        # Create templates for extended sources
-        self.update_srcmap_file(None, True)
+    def _create_likelihood(self, srcmdl_file):
+        """Create the likelihood object of this component from the
+        data products generated by run_preprocessing."""
 
         # Create BinnedObs
         self.logger.debug('Creating BinnedObs')
@@ -3281,11 +5416,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
             self.logger.debug('Disabling energy dispersion for %s' % s)
             self.set_edisp_flag(s, False)
 
-        if not self.like.logLike.fixedModelUpdated():
-            self.like.logLike.buildFixedModelWts(True)
-
-        self.logger.info(
-            'Finished setup for Analysis Component: %s' % self.name)
+        self.update_fixed_model()
 
     def make_scaled_srcmap(self):
         """Make an exposure cube with the same binning as the counts map."""
@@ -3319,21 +5450,25 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         """Generate a counts model map from the in-memory source map
         data structures."""
 
+        self.logger.info('Generating model map for component %s.' % self.name)
+
+        cmap = self.model_counts_map(name)
+        self.write_model_map(model_name, cmap)
+        return cmap
+
+    def write_model_map(self, model_name, cmap):
+        """Write a model counts map to the FITS file associated with
+        the given model name."""
+
         if model_name is None:
             suffix = self.config['file_suffix']
         else:
             suffix = '_%s%s' % (model_name, self.config['file_suffix'])
 
-        self.logger.info('Generating model map for component %s.' % self.name)
-
         outfile = os.path.join(self.config['fileio']['workdir'],
                                'mcube%s.fits' % (suffix))
-        h = pyfits.open(self._ccube_file)
-        cmap = self.model_counts_map(name)
         utils.write_fits_image(cmap.counts, cmap.wcs, outfile)
 
-        return cmap
-
     def make_template(self, src, suffix):
 
         if not 'SpatialModel' in src:
@@ -3364,6 +5499,27 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
                 '\n Valid models: PointSource, GaussianSource, DiskSource, '
                 'PSFSource ')
 
+    def get_srcmap(self, name):
+        """Return the source map of a source that is currently used
+        by the likelihood.  This includes any changes made to the
+        source map since the source map file was written (e.g. by
+        move_source).  Returns an array with dimension
+        (enumbins+1,npix,npix) or None if the source map is not
+        available."""
+
+        try:
+            data = np.array(self.like.logLike.sourceMap(str(name)).model(),
+                            dtype=float)
+        except Exception, ex:
+            self.logger.debug('Failed to get source map of %s: %s' %
+                              (name, str(ex)))
+            return None
+
+        shape = (self.enumbins + 1, self.npix, self.npix)
+        if data.size != np.prod(shape):
+            return None
+        return data.reshape(shape)
+
     def update_srcmap_file(self, sources=None, overwrite=False):
         """Check the contents of the source map file and generate
         source maps for any components that are not present."""
@@ -3470,8 +5626,7 @@ class GTBinnedAnalysis(fermipy.config.Configurable):
         self.logger.info('Loading %s' % xmlfile)
         self.like.logLike.reReadXml(xmlfile)
 
-        if not self.like.logLike.fixedModelUpdated():
-            self.like.logLike.buildFixedModelWts(True)
+        self.update_fixed_model()
 
     def write_xml(self, xmlfile):
         """Write the XML model for this analysis component."""
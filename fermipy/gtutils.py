@@ -1,6 +1,8 @@
 # pylikelihood
 
+import os
 import glob
+import multiprocessing
 import numpy as np
 import healpy as hp
 
@@ -22,6 +24,7 @@ import BinnedAnalysis
 import UnbinnedAnalysis 
 import SummedLikelihood
 
+from fermipy.parallel import WorkerPool
 from fermipy.utils import edge_to_center
 from fermipy.utils import edge_to_width
 
@@ -45,6 +48,153 @@ def bitmask_to_bits(mask):
     
 class SummedLikelihood(SummedLikelihood.SummedLikelihood):
 
+    _pool = None
+    _nproc = 1
+    _owner_pid = None
+    _pending_srcmaps = None
+    _ncall = 0
+
+    @property
+    def ncall(self):
+        """Number of evaluations of the likelihood made through this
+        object.  Evaluations made internally by the pyLikelihood
+        optimizers are not included."""
+        return self._ncall
+
+    def set_nproc(self, nproc):
+        """Set the number of worker processes used to evaluate the
+        likelihood of the components.  The workers are forked on the
+        next likelihood evaluation and each holds a copy of a subset
+        of the components.  On each evaluation the parameter values,
+        the free flags of the parameters, and any source maps changed
+        with update_source_map are sent to the workers.  The workers
+        must be restarted with stop_workers() whenever sources are
+        added or deleted or the energy range or parameter scales are
+        changed.
+
+        Only calls to this object (e.g. likelihood scans and TS
+        evaluations) are distributed over the workers.  Fits with
+        MINUIT, NewMinuit or any other pyLikelihood optimizer evaluate
+        the C++ composite likelihood in the calling process and see no
+        speedup.  Workers are only started by the process that called
+        set_nproc.  Evaluations in any other process (e.g. a process
+        forked by fork_map) are serial."""
+
+        self.stop_workers()
+        self._nproc = nproc
+        self._owner_pid = os.getpid()
+
+    @property
+    def workers_allowed(self):
+        """True if worker processes can be started by the calling
+        process."""
+        return (self._nproc > 1 and len(self.components) > 1 and
+                os.getpid() == self._owner_pid and
+                not multiprocessing.current_process().daemon)
+
+    def update_source_map(self, name):
+        """Send the current source map of a source to the workers on
+        the next evaluation.  This must be called after the source map
+        of a source has been replaced in the components (e.g. by
+        moving the source)."""
+
+        if self._pool is None:
+            return
+        if self._pending_srcmaps is None:
+            self._pending_srcmaps = set()
+        self._pending_srcmaps.add(name)
+
+    def _get_source_maps(self):
+
+        srcmaps = []
+        for name in sorted(self._pending_srcmaps or []):
+            for j, comp in enumerate(self.components):
+                v = np.array(comp.logLike.sourceMap(name).model())
+                try:
+                    d = pyLike.PointSource_cast(
+                        comp.logLike.getSource(name)).getDir()
+                    radec = (d.ra(), d.dec())
+                except Exception:
+                    radec = None
+                srcmaps += [(j, name, v, radec)]
+        self._pending_srcmaps = None
+        return srcmaps
+
+    def start_workers(self):
+
+        self.stop_workers()
+        if not self.workers_allowed:
+            return
+
+        nproc = min(self._nproc, len(self.components))
+        groups = np.array_split(np.arange(len(self.components)), nproc)
+
+        # Free flags of the parameters in the forked copy of the
+        # components
+        free0 = [[p.isFree() for p in self.components[j].params()]
+                 for j in range(len(self.components))]
+
+        def evaluate(i, msg):
+            pars, free, srcmaps = msg
+            v = pyLike.DoubleVector(pars)
+
+            for j, name, m, radec in srcmaps:
+                if not j in groups[i]:
+                    continue
+                logLike = self.components[j].logLike
+                logLike.setSourceMapImage(name, m)
+                if radec is not None:
+                    pyLike.PointSource_cast(logLike.getSource(name)).setDir(
+                        radec[0], radec[1], False, False)
+
+            logLike = 0.0
+            for j in groups[i]:
+                comp = self.components[j]
+                rebuild = False
+                if free != free0[j]:
+                    for p, f in zip(comp.params(), free):
+                        p.setFree(f)
+                    free0[j] = list(free)
+                    rebuild = True
+                comp.logLike.setParamValues(v)
+                if rebuild or not comp.logLike.fixedModelUpdated():
+                    comp.logLike.buildFixedModelWts(True)
+                logLike += comp()
+            return logLike
+
+        self._pool = WorkerPool(evaluate, nproc)
+        self._pending_srcmaps = None
+
+    def stop_workers(self):
+
+        if self._pool is None:
+            return
+
+        # A forked process inherits a reference to the workers of its
+        # parent which must not be closed or replaced
+        if self._pool.owner:
+            self._pool.close()
+            self._pool = None
+            self._pending_srcmaps = None
+
+    def __call__(self):
+
+        if not self.workers_allowed:
+            return self._call_serial()
+        elif self._pool is None:
+            self.start_workers()
+
+        pars = pyLike.DoubleVector()
+        self.components[0].logLike.getParamValues(pars)
+        free = [p.isFree() for p in self.components[0].params()]
+        msg = (list(pars), free, self._get_source_maps())
+        self._ncall += 1
+        return sum(self._pool.evaluate(msg))
+
+    def _call_serial(self):
+        self._ncall += 1
+        return super(SummedLikelihood, self).__call__()
+
     def Ts2(self, srcName, reoptimize=False, approx=True,
            tol=None, MaxIterations=10, verbosity=0):
 
@@ -54,14 +204,14 @@ class SummedLikelihood(SummedLikelihood.SummedLikelihood):
         self.syncSrcParams()
         freeParams = pyLike.DoubleVector()
         self.components[0].logLike.getFreeParamValues(freeParams)
-        logLike1 = -self()
+        logLike1 = -self._call_serial()
         for comp in self.components:            
             comp.scaleSource(srcName,1E-10)
             comp._ts_src = comp.logLike.getSource(srcName)
             free_flag = comp._ts_src.spectrum().normPar().isFree()
             #comp._ts_src.spectrum().normPar().setFree(False)
             
-        logLike0 = -self()
+        logLike0 = -self._call_serial()
         if tol is None:
             tol = self.tol
         if reoptimize:
@@ -86,7 +236,7 @@ class SummedLikelihood(SummedLikelihood.SummedLikelihood):
                 except ZeroDivisionError:
                     pass
         self.syncSrcParams()
-        logLike0 = max(-self(), logLike0)
+        logLike0 = max(-self._call_serial(), logLike0)
         Ts_value = 2*(logLike1 - logLike0)
         for comp in self.components:
             comp.scaleSource(srcName,1E10)
@@ -100,6 +250,64 @@ class SummedLikelihood(SummedLikelihood.SummedLikelihood):
 
         return Ts_value
 
+    def Ts_all(self, srcNames, approx=True):
+        """Compute the TS of each source in srcNames without
+        reoptimizing the model.  This is equivalent to calling Ts2
+        with reoptimize=False for each source but the free parameter
+        vector is saved only once and the source models of the
+        components are rebuilt only once after all sources have been
+        processed.
+
+        Returns
+        -------
+
+        ts : array
+            TS value of each source in srcNames.
+        """
+
+        source_attributes = self.components[0].getExtraSourceAttributes()
+        self.syncSrcParams()
+
+        freeParams = pyLike.DoubleVector()
+        self.components[0].logLike.getFreeParamValues(freeParams)
+        pars = np.array(freeParams)
+        freeParams = pyLike.DoubleVector(pars.tolist())
+
+        # Source scales are not propagated to worker processes so the
+        # likelihood is evaluated serially
+        logLike1 = -self._call_serial()
+        ts = np.zeros(len(srcNames))
+
+        for i, srcName in enumerate(srcNames):
+
+            for comp in self.components:
+                comp.scaleSource(srcName, 1E-10)
+                comp._ts_src = comp.logLike.getSource(srcName)
+
+            logLike0 = -self._call_serial()
+            if approx:
+                try:
+                    self._renorm()
+                except ZeroDivisionError:
+                    pass
+                self.syncSrcParams()
+                logLike0 = max(-self._call_serial(), logLike0)
+
+            ts[i] = 2 * (logLike1 - logLike0)
+
+            for comp in self.components:
+                comp.scaleSource(srcName, 1E10)
+                comp.logLike.setFreeParamValues(freeParams)
+
+        for comp in self.components:
+            comp.model = SourceModel(comp.logLike)
+            for src in source_attributes:
+                comp.model[src].__dict__.update(source_attributes[src])
+        self.model = self.components[0].model
+        self.syncSrcParams()
+
+        return ts
+
     def _renorm(self, factor=None):
         
         if factor is None:
@@ -0,0 +1,475 @@
+import numpy as np
+
+
+def poisson_lnl_norm_scan(counts, bkg, model, norms, chunk_size=10000):
+    """Evaluate the Poisson log-likelihood for a model of the form
+    bkg + norm*model on a grid of normalization values.  The
+    evaluation is vectorized over the normalization grid and is
+    restricted to the bins in which model is non-zero.  Bins are
+    processed in chunks of chunk_size to bound the memory footprint.
+
+    The returned log-likelihood omits terms that do not depend on the
+    normalization and is therefore only meaningful as a difference
+    between two grid points.
+
+    Parameters
+    ----------
+
+    counts : array
+        Observed counts.
+
+    bkg : array
+        Background model counts with the same shape as counts.
+
+    model : array
+        Model counts of the source for unit normalization.
+
+    norms : array
+        Vector of normalization values.
+
+    Returns
+    -------
+
+    lnl : array
+        Log-likelihood for each element of norms.
+    """
+
+    norms = np.array(norms, ndmin=1, dtype=float)
+    counts = np.ravel(counts)
+    bkg = np.ravel(bkg)
+    model = np.ravel(model)
+
+    msk = (model > 0) & (counts > 0)
+    c = counts[msk]
+    b = bkg[msk]
+    m = model[msk]
+
+    lnl = -norms * np.sum(model)
+
+    for i in range(0, len(c), chunk_size):
+        s = slice(i, i + chunk_size)
+        mu = b[s][np.newaxis, :] + norms[:, np.newaxis] * m[s][np.newaxis, :]
+        mu = np.where(mu > 0, mu, 1E-300)
+        lnl += np.sum(c[s][np.newaxis, :] * np.log(mu), axis=1)
+
+    return lnl
+
+
+def poisson_lnl(counts, mu):
+    """Evaluate the Poisson log-likelihood of counts given the model
+    mu omitting the terms that do not depend on the model."""
+
+    msk = counts > 0
+    return np.sum(counts[msk] * np.log(np.maximum(mu[msk], 1E-300))) - \
+        np.sum(mu)
+
+
+def fit_norms(counts, bkg, models, norms, bounds=None, max_iter=100,
+              tol=1E-6, chunk_size=10000):
+    """Find the normalizations that maximize the Poisson likelihood
+    of counts given the model bkg + sum_k norms[k]*models[k].  All
+    normalizations are fit simultaneously with a projected Newton
+    iteration.  Parameters at a bound with a gradient pointing
+    outside of the allowed range are held fixed during each step.
+    When a Newton step does not improve the likelihood an EM
+    (multiplicative) update is applied instead.  Only pixels where at
+    least one of the models is non-zero are used and the Hessian is
+    accumulated in chunks of pixels to limit the size of temporary
+    arrays.
+
+    Parameters
+    ----------
+
+    counts : array
+        Observed counts.
+
+    bkg : array
+        Model counts of the fixed components with the same shape as
+        counts.
+
+    models : array
+        2D array with dimension (K,N) containing the model counts of
+        each of the K sources for unit normalization.
+
+    norms : array
+        Initial values of the K normalizations.
+
+    bounds : array
+        2D array with dimension (K,2) with the lower and upper bound
+        of each normalization.  If None normalizations are only
+        constrained to be non-negative.
+
+    Returns
+    -------
+
+    norms : array
+        Best-fit normalizations.
+
+    lnl : float
+        Log-likelihood at the best-fit omitting the terms that do not
+        depend on the normalizations (including the pixels where all
+        models are zero).
+
+    niter : int
+        Number of iterations.
+    """
+
+    m = np.array(models, dtype=float, ndmin=2).reshape((len(norms), -1))
+    msk = np.any(m != 0, axis=0)
+    m = m[:, msk]
+    c = np.ravel(counts)[msk].astype(float)
+    b = np.ravel(bkg)[msk].astype(float)
+    msum = np.sum(m, axis=1)
+
+    if bounds is None:
+        bounds = np.zeros((len(norms), 2))
+        bounds[:, 1] = np.inf
+    bounds = np.array(bounds, dtype=float)
+    lo, hi = bounds[:, 0], bounds[:, 1]
+
+    x = np.clip(np.array(norms, dtype=float), lo, hi)
+    mu = b + np.dot(x, m)
+    lnl = poisson_lnl(c, mu)
+
+    for niter in range(1, max_iter + 1):
+
+        mu = np.maximum(mu, 1E-300)
+        g = np.dot(m, c / mu - 1.0)
+        w = c / mu ** 2
+        h = np.zeros((len(x), len(x)))
+        for j in range(0, len(c), chunk_size):
+            mj = m[:, j:j + chunk_size]
+            h += np.dot(mj * w[j:j + chunk_size], mj.T)
+
+        free = ~(((x <= lo) & (g < 0)) | ((x >= hi) & (g > 0)))
+        free &= msum > 0
+
+        if not np.any(free):
+            break
+
+        dx = np.zeros(len(x))
+        hf = h[free][:, free]
+        hf = hf + 1E-10 * np.diag(np.diag(hf) + 1E-30)
+        try:
+            dx[free] = np.linalg.solve(hf, g[free])
+        except np.linalg.LinAlgError:
+            dx[free] = 0.0
+
+        # Backtracking line search on the Newton step
+        t = 1.0
+        xnew = x
+        lnl_new = -np.inf
+        for i in range(10):
+            xt = np.clip(x + t * dx, lo, hi)
+            lnl_t = poisson_lnl(c, b + np.dot(xt, m))
+            if lnl_t >= lnl:
+                xnew, lnl_new = xt, lnl_t
+                break
+            t *= 0.5
+
+        # Fall back to an EM update
+        if lnl_new < lnl:
+            r = np.ones(len(x))
+            r[free] = np.dot(m[free], c / mu) / msum[free]
+            xnew = np.clip(x * r, lo, hi)
+            lnl_new = poisson_lnl(c, b + np.dot(xnew, m))
+            if lnl_new < lnl:
+                break
+
+        dlnl = lnl_new - lnl
+        dxmax = np.max(np.abs(xnew - x) / np.maximum(np.abs(x), 1E-10))
+        x, lnl = xnew, lnl_new
+        mu = b + np.dot(x, m)
+
+        if dlnl < tol and dxmax < 1E-4:
+            break
+
+    return x, lnl, niter
+
+
+class BinnedPoissonLikelihood(object):
+    """Binned Poisson likelihood of a model composed of a fixed
+    background and a set of sources with free parameters.  The model
+    counts of each source are computed from its source map and
+    spectral model without pyLikelihood such that the likelihood and
+    its gradient with respect to the spectral parameters can be
+    evaluated with NumPy.
+
+    The data of each analysis component are given as a counts cube
+    with dimension (nebin,ny,nx), the edges of its energy bins in
+    log10(E/MeV), and the model counts cube of the fixed part of the
+    model.  Sources are added with add_source (source map and
+    spectral model) or add_template (model counts cube which scales
+    linearly with the normalization).  Parameters are expressed in
+    scaled units (true value divided by the parameter scale) in the
+    same way as in pyLikelihood.  With nthreads > 1 the components
+    are evaluated concurrently in a pool of threads."""
+
+    def __init__(self, counts, energies, bkg, nthreads=1):
+        self._counts = [np.array(c, dtype=float) for c in counts]
+        self._bkg = [np.array(b, dtype=float) for b in bkg]
+        self._egy = [10 ** np.array(e, dtype=float) for e in energies]
+        self._wlo = []
+        self._whi = []
+        for egy in self._egy:
+            w = 0.5 * np.log(egy[1:] / egy[:-1])
+            self._wlo += [w * egy[:-1]]
+            self._whi += [w * egy[1:]]
+        self._sources = []
+        self._nthreads = nthreads
+
+    @property
+    def sources(self):
+        return self._sources
+
+    @property
+    def nfree(self):
+        return sum([np.sum(s['free']) for s in self._sources])
+
+    def add_source(self, name, spectrum, srcmaps, free, scales=None,
+                   bounds=None):
+        """Add a source defined by a source map and a spectral model.
+
+        Parameters
+        ----------
+
+        spectrum : `~fermipy.spectrum.SpectralFunction`
+            Spectral model of the source.
+
+        srcmaps : list
+            Source map of the source for each component with
+            dimension (nebin+1,ny,nx).  Each plane is the model
+            counts per unit dN/dE at the corresponding energy bin
+            edge.
+
+        free : array
+            Boolean mask of the free spectral parameters.
+
+        scales : array
+            Scale of each parameter.
+
+        bounds : array
+            Lower and upper bound of each parameter in scaled units.
+        """
+
+        npar = len(spectrum.params)
+        src = {'name': name, 'spectrum': spectrum,
+               'srcmaps': [np.array(m, dtype=float) for m in srcmaps],
+               'corr': [np.ones(len(w)) for w in self._wlo]}
+        self._add(src, npar, free, scales, bounds)
+
+    def add_template(self, name, cubes, norm, scale=1.0, bounds=None):
+        """Add a source with a fixed spectral shape defined by its
+        model counts cube in each component for the normalization
+        norm (in scaled units)."""
+
+        src = {'name': name, 'norm0': norm,
+               'cubes': [np.array(c, dtype=float) for c in cubes]}
+        self._add(src, 1, [True], [scale],
+                  None if bounds is None else [bounds])
+        src['params'][0] = norm * scale
+
+    def _add(self, src, npar, free, scales, bounds):
+
+        if scales is None:
+            scales = np.ones(npar)
+        if bounds is None:
+            bounds = [[-np.inf, np.inf]] * npar
+
+        src['free'] = np.array(free, dtype=bool)
+        src['scales'] = np.array(scales, dtype=float)
+        src['bounds'] = np.array(bounds, dtype=float)
+        if 'spectrum' in src:
+            src['params'] = np.array(src['spectrum'].params, dtype=float)
+        else:
+            src['params'] = np.zeros(npar)
+        self._sources += [src]
+
+    def calibrate(self, name, npred):
+        """Rescale the model counts of a source in each energy bin to
+        match the counts spectra in npred (one per component).  This
+        absorbs differences between the energy quadrature used here
+        and in the ScienceTools."""
+
+        src = self._find(name)
+        if not 'srcmaps' in src:
+            return
+
+        for i in range(len(self._counts)):
+            cs = np.sum(self._source_counts(src, i), axis=(1, 2))
+            src['corr'][i] = np.where(cs > 0, np.array(npred[i]) /
+                                      np.where(cs > 0, cs, 1.0), 1.0)
+
+    def _find(self, name):
+        for s in self._sources:
+            if s['name'] == name:
+                return s
+        raise KeyError('Source not found: %s' % name)
+
+    def get_params(self):
+        """Return the vector of free parameters in scaled units."""
+        return np.concatenate([s['params'][s['free']] / s['scales'][s['free']]
+                               for s in self._sources])
+
+    def get_bounds(self):
+        return np.concatenate([s['bounds'][s['free']]
+                               for s in self._sources])
+
+    def set_params(self, x):
+        """Set the free parameters from a vector in scaled units."""
+
+        i = 0
+        for s in self._sources:
+            n = np.sum(s['free'])
+            s['params'][s['free']] = np.array(x[i:i + n]) * \
+                s['scales'][s['free']]
+            i += n
+            if 'spectrum' in s:
+                s['spectrum'] = s['spectrum'].__class__(s['params'],
+                                                        s['spectrum'].scale)
+
+    def _source_counts(self, src, i):
+
+        if 'cubes' in src:
+            return src['cubes'][i] * (src['params'][0] /
+                                      (src['norm0'] * src['scales'][0]))
+
+        egy = self._egy[i]
+        m = src['srcmaps'][i]
+        f = src['spectrum'].dfde(egy)
+        wlo = self._wlo[i] * f[:-1] * src['corr'][i]
+        whi = self._whi[i] * f[1:] * src['corr'][i]
+        return (wlo[:, np.newaxis, np.newaxis] * m[:-1] +
+                whi[:, np.newaxis, np.newaxis] * m[1:])
+
+    def model_counts(self, i):
+        """Return the total model counts cube of component i."""
+
+        mu = np.array(self._bkg[i])
+        for s in self._sources:
+            mu += self._source_counts(s, i)
+        return mu
+
+    def _map_components(self, fn):
+        """Evaluate fn for the index of each component."""
+
+        ncomp = len(self._counts)
+        if self._nthreads <= 1 or ncomp <= 1:
+            return [fn(i) for i in range(ncomp)]
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(self._nthreads, ncomp))
+        try:
+            return pool.map(fn, range(ncomp))
+        finally:
+            pool.close()
+
+    def lnl(self, x=None):
+        """Evaluate the log-likelihood omitting terms that do not
+        depend on the model."""
+
+        if x is not None:
+            self.set_params(x)
+
+        return sum(self._map_components(
+            lambda i: poisson_lnl(np.ravel(self._counts[i]),
+                                  np.ravel(self.model_counts(i)))))
+
+    def lnl_grad(self, x=None):
+        """Evaluate the log-likelihood and its gradient with respect
+        to the free parameters in scaled units."""
+
+        if x is not None:
+            self.set_params(x)
+
+        results = self._map_components(self._lnl_grad_component)
+        lnl = sum([r[0] for r in results])
+        grad = np.sum([r[1] for r in results], axis=0)
+        return lnl, grad
+
+    def _lnl_grad_component(self, i):
+
+        c = self._counts[i]
+        mu = self.model_counts(i)
+        lnl = poisson_lnl(np.ravel(c), np.ravel(mu))
+        r = c / np.maximum(mu, 1E-300) - 1.0
+        grad = [np.zeros(np.sum(s['free'])) for s in self._sources]
+
+        for j, s in enumerate(self._sources):
+
+            if not np.any(s['free']):
+                continue
+
+            if 'cubes' in s:
+                grad[j] += np.sum(r * s['cubes'][i]) / s['norm0']
+                continue
+
+            m = s['srcmaps'][i]
+            rlo = np.sum(r * m[:-1], axis=(1, 2))
+            rhi = np.sum(r * m[1:], axis=(1, 2))
+            df = s['spectrum'].dfde_deriv(self._egy[i])[s['free']]
+            g = np.sum(df[:, :-1] * (self._wlo[i] * s['corr'][i] * rlo) +
+                       df[:, 1:] * (self._whi[i] * s['corr'][i] * rhi),
+                       axis=1)
+            grad[j] += g * s['scales'][s['free']]
+
+        return lnl, np.concatenate(grad)
+
+    def hessian(self, x, eps=1E-5):
+        """Evaluate the Hessian of the log-likelihood by finite
+        differences of the analytic gradient."""
+
+        x = np.array(x, dtype=float)
+        n = len(x)
+        h = np.zeros((n, n))
+        for i in range(n):
+            dx = eps * max(abs(x[i]), 1E-3)
+            xp, xm = np.array(x), np.array(x)
+            xp[i] += dx
+            xm[i] -= dx
+            h[i] = (self.lnl_grad(xp)[1] - self.lnl_grad(xm)[1]) / (2 * dx)
+        self.set_params(x)
+        return 0.5 * (h + h.T)
+
+    def fit(self, x0=None, tol=1E-8, covar=True):
+        """Maximize the likelihood with respect to the free
+        parameters using L-BFGS-B with analytic gradients.
+
+        Returns
+        -------
+
+        fit : dict
+            Dictionary with the best-fit parameters (x), the
+            log-likelihood (lnl), the covariance matrix (covar), the
+            number of likelihood evaluations (nfev), and a flag
+            indicating whether the minimizer converged (success).
+        """
+
+        from scipy.optimize import minimize
+
+        if x0 is None:
+            x0 = self.get_params()
+
+        bounds = [(None if not np.isfinite(lo) else lo,
+                   None if not np.isfinite(hi) else hi)
+                  for lo, hi in self.get_bounds()]
+
+        def fn(x):
+            lnl, grad = self.lnl_grad(x)
+            return -lnl, -grad
+
+        r = minimize(fn, x0, jac=True, method='L-BFGS-B', bounds=bounds,
+                     options={'ftol': tol, 'gtol': 1E-8, 'maxiter': 1000})
+
+        o = {'x': r.x, 'lnl': -r.fun, 'nfev': r.nfev,
+             'success': r.success, 'covar': None}
+
+        if covar:
+            h = self.hessian(r.x)
+            try:
+                o['covar'] = np.linalg.inv(-h)
+            except np.linalg.LinAlgError:
+                pass
+
+        self.set_params(r.x)
+        return o
@@ -0,0 +1,155 @@
+import os
+import copy
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import astropy.io.fits as pyfits
+import astropy.wcs as pywcs
+
+import fermipy.utils as utils
+from fermipy.utils import Map
+
+
+def read_map(fitsfile):
+    """Read a counts map from the primary HDU of a FITS file."""
+
+    hdulist = pyfits.open(fitsfile)
+    header = pyfits.Header.fromstring(hdulist[0].header.tostring())
+    data = copy.deepcopy(hdulist[0].data)
+    hdulist.close()
+    return Map(data, pywcs.WCS(header))
+
+
+class MapStore(object):
+    """In-memory store for model counts maps.  Maps are indexed by
+    name and associated with the FITS file to which they will be
+    written by write().  When the total size of the maps in memory
+    exceeds max_size (in MB) the oldest maps are spilled to their
+    FITS files and are reloaded from disk when they are next
+    accessed.  If savefits is False maps are instead spilled to a
+    temporary directory that is deleted by close()."""
+
+    def __init__(self, workdir, max_size=None, logger=None, savefits=True):
+        self._workdir = workdir
+        self._max_size = max_size
+        self._logger = logger
+        self._savefits = savefits
+        self._maps = OrderedDict()
+        self._files = {}
+        self._written = set()
+        self._spilled = {}
+        self._spilldir = None
+
+    def __del__(self):
+        self.close()
+
+    @property
+    def size(self):
+        """Total size in MB of the maps held in memory."""
+        return sum([m.counts.nbytes for m in self._maps.values()]) / 1E6
+
+    def filename(self, name):
+        return os.path.join(self._workdir, '%s.fits' % name)
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def keys(self):
+        return self._files.keys()
+
+    def put(self, name, cmap):
+        """Add a map to the store.  Any existing map with the same
+        name is replaced."""
+
+        self._maps.pop(name, None)
+        self._maps[name] = cmap
+        self._files[name] = self.filename(name)
+        self._written.discard(name)
+        self._remove_spilled(name)
+        self._spill()
+
+    def get(self, name):
+        """Return the map with the given name, reloading it from disk
+        if it was spilled."""
+
+        if name in self._maps:
+            return self._maps[name]
+        elif name in self._spilled:
+            cmap = read_map(self._spilled[name])
+        elif name in self._files and os.path.isfile(self._files[name]):
+            cmap = read_map(self._files[name])
+        else:
+            raise KeyError('Map not found: %s' % name)
+
+        self._maps[name] = cmap
+        self._spill(keep=name)
+        return cmap
+
+    def write(self, names=None):
+        """Write maps in the store to FITS files.  Maps that are
+        already on disk are skipped."""
+
+        if names is None:
+            names = self._files.keys()
+
+        for name in names:
+            if name in self._written:
+                continue
+            self._write(name, self.get(name))
+            self._remove_spilled(name)
+
+    def clear(self):
+        self._maps.clear()
+        self._files.clear()
+        self._written.clear()
+        self.close()
+
+    def close(self):
+        """Delete the temporary directory of maps spilled when
+        savefits is False."""
+
+        if self._spilldir is not None:
+            shutil.rmtree(self._spilldir, ignore_errors=True)
+        self._spilldir = None
+        self._spilled = {}
+
+    def _write(self, name, cmap):
+        if self._logger is not None:
+            self._logger.debug('Writing %s' % self._files[name])
+        utils.write_fits_image(cmap.counts, cmap.wcs, self._files[name])
+        self._written.add(name)
+
+    def _spill(self, keep=None):
+
+        if self._max_size is None:
+            return
+
+        while self.size > self._max_size and len(self._maps) > 1:
+            name = next(iter(self._maps))
+            if name == keep:
+                break
+            cmap = self._maps.pop(name)
+            if name in self._written or name in self._spilled:
+                continue
+            elif self._savefits:
+                self._write(name, cmap)
+            else:
+                self._spill_temp(name, cmap)
+
+    def _spill_temp(self, name, cmap):
+
+        if self._spilldir is None:
+            self._spilldir = tempfile.mkdtemp(prefix='mapstore_')
+
+        path = os.path.join(self._spilldir, '%s.fits' % name)
+        if self._logger is not None:
+            self._logger.debug('Spilling %s to %s' % (name, path))
+        utils.write_fits_image(cmap.counts, cmap.wcs, path)
+        self._spilled[name] = path
+
+    def _remove_spilled(self, name):
+
+        path = self._spilled.pop(name, None)
+        if path is not None and os.path.isfile(path):
+            os.remove(path)
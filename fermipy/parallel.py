@@ -0,0 +1,143 @@
+import os
+import multiprocessing
+
+# Function evaluated by the worker processes of fork_map.  This is
+# stored as a module attribute such that it is inherited by forked
+# workers and does not need to be pickled.
+_task = None
+
+
+def _run_task(arg):
+    return _task(arg)
+
+
+def fork_map(fn, args, nproc=1):
+    """Evaluate a function for each element of a sequence of
+    arguments using a pool of forked worker processes.  Each worker
+    is forked from the calling process and therefore inherits a copy
+    of its state (e.g. an analysis object with its likelihood).  Every
+    worker evaluates a single task such that the result of each task
+    does not depend on which tasks were previously run by the same
+    process.  The arguments and return values of fn must be
+    picklable.
+
+    Parameters
+    ----------
+
+    fn : function
+        Function to be evaluated.
+
+    args : list
+        Sequence of arguments.
+
+    nproc : int
+        Number of worker processes.  If nproc is 1 the function is
+        evaluated serially in the calling process.
+
+    Returns
+    -------
+
+    results : list
+        List of return values in the same order as args.
+    """
+
+    args = list(args)
+    if nproc is None or nproc <= 1 or len(args) <= 1:
+        return [fn(t) for t in args]
+
+    global _task
+    _task = fn
+
+    pool = multiprocessing.Pool(min(nproc, len(args)), maxtasksperchild=1)
+    try:
+        results = pool.map(_run_task, args, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+        _task = None
+
+    return results
+
+
+def _worker_loop(fn, index, conn):
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        try:
+            conn.send((True, fn(index, msg)))
+        except Exception, ex:
+            conn.send((False, ex))
+    conn.close()
+
+
+class WorkerPool(object):
+    """Pool of persistent forked worker processes.  Each worker is
+    forked from the calling process and keeps its copy of the state
+    of that process between calls.  evaluate() sends the same message
+    to every worker and each worker i returns fn(i,msg).  The pool
+    can only be used from the process that created it.  Calls from
+    any other process (e.g. a process forked by fork_map) raise an
+    exception."""
+
+    def __init__(self, fn, nproc):
+        self._pid = os.getpid()
+        self._procs = []
+        self._conns = []
+        for i in range(nproc):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            p = multiprocessing.Process(target=_worker_loop,
+                                        args=(fn, i, child_conn))
+            p.daemon = True
+            p.start()
+            child_conn.close()
+            self._procs += [p]
+            self._conns += [parent_conn]
+
+    @property
+    def nproc(self):
+        return len(self._procs)
+
+    @property
+    def owner(self):
+        """True if the pool was created by the calling process."""
+        return os.getpid() == self._pid
+
+    def evaluate(self, msg):
+        """Send msg to all workers and return the list of results."""
+
+        if not self.owner:
+            raise Exception('Worker pool used from a forked process.')
+
+        for conn in self._conns:
+            conn.send(msg)
+
+        # All replies are read before raising an exception such that
+        # no reply is left in the pipes for the next call
+        results = []
+        error = None
+        for conn in self._conns:
+            status, r = conn.recv()
+            if not status and error is None:
+                error = r
+            results += [r]
+
+        if error is not None:
+            raise error
+        return results
+
+    def close(self):
+
+        if not self.owner:
+            return
+
+        for conn in self._conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except (IOError, EOFError):
+                pass
+        for p in self._procs:
+            p.join()
+        self._procs = []
+        self._conns = []
@@ -0,0 +1,213 @@
+import sys
+import time
+import threading
+import Queue
+from collections import OrderedDict
+
+
+class Step(object):
+    """A step of a pipeline.  A step is a function with a list of
+    input files that it reads and a list of output files that it
+    generates.  The dependencies of a step are the steps that generate
+    its inputs."""
+
+    def __init__(self, name, fn, inputs=None, outputs=None, group=None):
+        self._name = name
+        self._fn = fn
+        self._inputs = [] if inputs is None else list(inputs)
+        self._outputs = [] if outputs is None else list(outputs)
+        self._group = group
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def inputs(self):
+        return self._inputs
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    @property
+    def group(self):
+        """Steps with the same group are never run concurrently
+        (e.g. runs of the same application sharing a parameter
+        file)."""
+        return self._group
+
+    def __call__(self):
+        return self._fn()
+
+
+class Pipeline(object):
+    """Dependency graph of pipeline steps executed by a local
+    scheduler.  Steps are run as soon as all of their dependencies
+    have completed such that independent steps can run concurrently
+    in separate threads.  Deciding whether a step is stale and needs
+    to be rerun is left to the function of each step."""
+
+    def __init__(self, logger=None):
+        self._steps = OrderedDict()
+        self._logger = logger
+        self._times = {}
+
+    @property
+    def steps(self):
+        return self._steps.values()
+
+    @property
+    def times(self):
+        """Dictionary with the run time in seconds of each step."""
+        return self._times
+
+    def add_step(self, name, fn, inputs=None, outputs=None, group=None):
+        """Add a step to the pipeline.
+
+        Parameters
+        ----------
+
+        name : str
+            Name of the step.
+
+        fn : function
+            Function that runs the step.  It is called without
+            arguments.
+
+        inputs : list
+            Files read by the step.  Files that are not an output of
+            another step are treated as external inputs.
+
+        outputs : list
+            Files generated by the step.
+
+        group : str
+            Steps with the same group are run serially.
+        """
+
+        if name in self._steps:
+            raise Exception('Duplicate pipeline step: %s' % name)
+
+        for s in self._steps.values():
+            for f in outputs or []:
+                if f in s.outputs:
+                    raise Exception('Output %s of step %s is already '
+                                    'generated by step %s' %
+                                    (f, name, s.name))
+
+        self._steps[name] = Step(name, fn, inputs, outputs, group)
+
+    def dependencies(self, name):
+        """Return the set of names of the steps on which a step
+        directly depends."""
+
+        step = self._steps[name]
+        deps = set()
+        for s in self._steps.values():
+            if s.name == name:
+                continue
+            if set(s.outputs) & set(step.inputs):
+                deps.add(s.name)
+        return deps
+
+    def toposort(self):
+        """Return the list of step names in an order consistent with
+        their dependencies."""
+
+        deps = dict([(k, self.dependencies(k)) for k in self._steps])
+        order = []
+        done = set()
+        while len(order) < len(self._steps):
+            ready = [k for k in self._steps
+                     if k not in done and deps[k] <= done]
+            if not ready:
+                raise Exception('Cyclic dependency between pipeline steps: '
+                                '%s' % sorted(set(self._steps) - done))
+            order += ready
+            done.update(ready)
+        return order
+
+    def run(self, nthreads=1):
+        """Run all steps of the pipeline.
+
+        Parameters
+        ----------
+
+        nthreads : int
+            Maximum number of steps that are run concurrently.  With
+            nthreads=1 the steps are run serially in the calling
+            thread.
+        """
+
+        order = self.toposort()
+        self._times = {}
+
+        if nthreads is None or nthreads <= 1:
+            for name in order:
+                self._run_step(self._steps[name])
+            return
+
+        deps = dict([(k, self.dependencies(k)) for k in self._steps])
+        queue = Queue.Queue()
+        done = set()
+        running = set()
+        error = None
+
+        while len(done) < len(order):
+
+            # Start all steps whose dependencies are complete
+            for name in order:
+
+                if error is not None or len(running) >= nthreads:
+                    break
+
+                step = self._steps[name]
+                if name in done or name in running:
+                    continue
+                if not deps[name] <= done:
+                    continue
+                if step.group is not None and step.group in \
+                        [self._steps[k].group for k in running]:
+                    continue
+
+                running.add(name)
+                t = threading.Thread(target=self._run_task,
+                                     args=(step, queue))
+                t.daemon = True
+                t.start()
+
+            if not running:
+                break
+
+            name, exc_info = queue.get()
+            running.remove(name)
+            if exc_info is not None:
+                # Wait for running steps before raising
+                if error is None:
+                    error = exc_info
+                continue
+            done.add(name)
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+
+    def _run_task(self, step, queue):
+        try:
+            self._run_step(step)
+            queue.put((step.name, None))
+        except Exception:
+            queue.put((step.name, sys.exc_info()))
+
+    def _run_step(self, step):
+
+        if self._logger is not None:
+            self._logger.debug('Running step %s' % step.name)
+
+        t0 = time.time()
+        step()
+        self._times[step.name] = time.time() - t0
+
+        if self._logger is not None:
+            self._logger.debug('Finished step %s in %.2f s' %
+                               (step.name, self._times[step.name]))
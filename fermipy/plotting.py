@@ -649,28 +649,42 @@ class SEDPlotter(object):
 
 class ExtensionPlotter(object):
 
-    def __init__(self,src,roi,suffix,workdir,erange=None):
+    def __init__(self,src,roi,suffix,workdir,erange=None,mapstore=None):
 
         self._src = copy.deepcopy(src)
 
         name = src['name'].lower().replace(' ','_')
 
-        self._file0 = os.path.join(workdir,'mcube_%s_noext%s.fits'%(name,suffix))
-        self._file1 = os.path.join(workdir,'mcube_%s_ext_bkg%s.fits'%(name,suffix))
-        self._file2 = os.path.join(workdir,'ccube%s.fits'%suffix)
+        self._file0 = 'mcube_%s_noext%s'%(name,suffix)
+        self._file1 = 'mcube_%s_ext_bkg%s'%(name,suffix)
+        self._file2 = 'ccube%s'%suffix
         
         self._files = []
         self._width = src['extension']['width']
         for i,w in enumerate(src['extension']['width']):        
-            self._files += [os.path.join(workdir,'mcube_%s_ext%02i%s.fits'%(name,i,suffix))]
+            self._files += ['mcube_%s_ext%02i%s'%(name,i,suffix)]
         self._roi = roi
         self._erange = erange
-        
+        self._workdir = workdir
+        self._mapstore = mapstore
+
+    def create_plotter(self,name):
+        """Create an ROIPlotter for the map with the given name.  Maps
+        are taken from the map store if available and are otherwise
+        read from FITS files in the working directory."""
+
+        if self._mapstore is not None and name in self._mapstore:
+            return ROIPlotter(self._mapstore.get(name),self._roi,
+                              erange=self._erange)
+
+        fitsfile = os.path.join(self._workdir,'%s.fits'%name)
+        return ROIPlotter.create_from_fits(fitsfile,self._roi,
+                                           erange=self._erange)
         
     def plot(self,iaxis):
 
-        p0 = ROIPlotter.create_from_fits(self._file2,self._roi,erange=self._erange)
-        p1 = ROIPlotter.create_from_fits(self._file1,self._roi,erange=self._erange)
+        p0 = self.create_plotter(self._file2)
+        p1 = self.create_plotter(self._file1)
         p0.plot_projection(iaxis,color='k',label='Data',marker='s',
                            linestyle='None')
         p1.plot_projection(iaxis,color='b',noerror=True,label='Background')
@@ -687,8 +701,8 @@ class ExtensionPlotter(object):
             cf = float(i)/float(len(fw)-1.0)
             cf = 0.2+cf*0.8
             
-            p = ROIPlotter.create_from_fits(f,self._roi,erange=self._erange)
-            p._data += p1.data            
+            p = self.create_plotter(f)
+            p._data = p._data + p1.data            
             p.plot_projection(iaxis,color=matplotlib.cm.Reds(cf),
                               noerror=True,label='%.4f$^\circ$'%w)
             
@@ -0,0 +1,293 @@
+import os
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import yaml
+import numpy as np
+import astropy.io.fits as pyfits
+
+# Files smaller than this size (in bytes) are fingerprinted by their
+# content.  Larger files are fingerprinted by their path, size and
+# modification time.
+content_hash_max_size = 16 * 1024 ** 2
+
+
+def file_fingerprint(path):
+    """Compute a fingerprint string for an input file."""
+
+    path = os.path.realpath(path)
+    st = os.stat(path)
+
+    if st.st_size > content_hash_max_size:
+        return 'stat:%s:%i:%i' % (path, st.st_size, int(st.st_mtime))
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 ** 2), b''):
+            h.update(chunk)
+    return 'sha1:' + h.hexdigest()
+
+
+def gti_fingerprint(path):
+    """Compute a fingerprint of the good time intervals of an FT1
+    file.  Products that only depend on the GTIs of the event file
+    (e.g. the livetime cube) have the same fingerprint for any event
+    selection with the same time intervals."""
+
+    hdulist = pyfits.open(path, memmap=True)
+    try:
+        gti = hdulist['GTI'].data
+        h = hashlib.sha1()
+        h.update(np.array(gti.field('START'), dtype=float).tostring())
+        h.update(np.array(gti.field('STOP'), dtype=float).tostring())
+    finally:
+        hdulist.close()
+    return 'gti:' + h.hexdigest()
+
+
+class ProductCache(object):
+    """Content-addressed cache of ScienceTools data products that can
+    be shared between analyses.  Each product is stored under a key
+    computed from the name of the tool, its parameters and the
+    fingerprints of its input files.  Products are linked or copied
+    into the working directory of an analysis when a matching entry
+    exists.  When the total size of the cache exceeds max_size (in MB)
+    the least recently used entries are evicted.  Entries that have
+    been linked into a working directory are never evicted since
+    other analyses may still use them.  If link is None products are
+    linked only when the size of the cache is unbounded."""
+
+    # Name of the file marking an entry that has been linked
+    linked_marker = '.linked'
+
+    def __init__(self, cachedir, max_size=None, link=None, logger=None):
+        self._cachedir = os.path.abspath(os.path.expandvars(cachedir))
+        self._max_size = max_size
+        self._link = max_size is None if link is None else link
+        self._logger = logger
+
+        if not os.path.isdir(self._cachedir):
+            os.makedirs(self._cachedir)
+
+    @property
+    def cachedir(self):
+        return self._cachedir
+
+    @property
+    def size(self):
+        """Total size in MB of the products in the cache."""
+        return sum([t[2] for t in self._entries()]) / 1E6
+
+    @staticmethod
+    def key(appname, kw, fingerprints=None, skip_keys=None):
+        """Compute the cache key of a product.
+
+        Parameters
+        ----------
+
+        appname : str
+            Name of the tool.
+
+        kw : dict
+            Tool parameters.  Parameters in skip_keys (by default
+            outfile and chatter) are ignored.  Parameters that point
+            to an existing file are replaced by the fingerprint of
+            the file.
+
+        fingerprints : dict
+            Dictionary of fingerprints for input files keyed by path
+            or by parameter name.  These override the default
+            fingerprint of a file (e.g. with the key of the product
+            that generated it).
+        """
+
+        if fingerprints is None:
+            fingerprints = {}
+        if skip_keys is None:
+            skip_keys = ['outfile', 'chatter']
+
+        items = []
+        for k, v in sorted(kw.items()):
+
+            if k in skip_keys or v is None:
+                continue
+
+            if k in fingerprints:
+                v = fingerprints[k]
+            elif isinstance(v, str) and v in fingerprints:
+                v = fingerprints[v]
+            elif isinstance(v, str) and os.path.isfile(v):
+                v = file_fingerprint(v)
+            items += [(k, str(v))]
+
+        h = hashlib.sha1()
+        h.update(str((appname, items)))
+        return h.hexdigest()
+
+    def path(self, key, filename):
+        return os.path.join(self._cachedir, key[:2], key,
+                            os.path.basename(filename))
+
+    def __contains__(self, key):
+        return os.path.isdir(os.path.join(self._cachedir, key[:2], key))
+
+    def fetch(self, key, outfile, link=None):
+        """Link or copy the product with the given key to outfile.
+        Returns True if the product was found in the cache.
+
+        Parameters
+        ----------
+
+        link : bool
+            Create a symbolic link to the cached file instead of a
+            copy.  Products that are modified in place after they are
+            generated should be copied.  If None the default of the
+            cache is used.
+        """
+
+        if link is None:
+            link = self._link
+
+        cachefile = self.path(key, outfile)
+        if not os.path.isfile(cachefile):
+            return False
+
+        # Update the access time used for LRU eviction
+        os.utime(os.path.dirname(cachefile), None)
+
+        if os.path.lexists(outfile):
+            os.remove(outfile)
+
+        if link:
+            open(os.path.join(os.path.dirname(cachefile),
+                              self.linked_marker), 'a').close()
+            os.symlink(cachefile, outfile)
+        else:
+            shutil.copy(cachefile, outfile)
+
+        if self._logger is not None:
+            self._logger.info('Using cached %s: %s' %
+                              (os.path.basename(outfile), cachefile))
+        return True
+
+    def store(self, key, outfile):
+        """Add a product to the cache.  The product is first copied to
+        a temporary directory and then moved into place so that
+        concurrent analyses never see a partially written entry."""
+
+        if key in self:
+            return
+
+        entrydir = os.path.dirname(self.path(key, outfile))
+        parentdir = os.path.dirname(entrydir)
+        if not os.path.isdir(parentdir):
+            os.makedirs(parentdir)
+
+        tmpdir = tempfile.mkdtemp(prefix='tmp_', dir=parentdir)
+        try:
+            shutil.copy(outfile, os.path.join(tmpdir,
+                                              os.path.basename(outfile)))
+            os.rename(tmpdir, entrydir)
+        except OSError:
+            # Entry was created by another process
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            return
+
+        if self._logger is not None:
+            self._logger.debug('Added %s to product cache' %
+                               os.path.basename(outfile))
+
+        self._evict(keep=key)
+
+    def _entries(self):
+        """Return a list of (mtime,path,size,linked) of the entries in
+        the cache."""
+
+        entries = []
+        for d0 in os.listdir(self._cachedir):
+            p0 = os.path.join(self._cachedir, d0)
+            if not os.path.isdir(p0):
+                continue
+            for d1 in os.listdir(p0):
+                p1 = os.path.join(p0, d1)
+                if d1.startswith('tmp_') or not os.path.isdir(p1):
+                    continue
+                files = os.listdir(p1)
+                size = sum([os.path.getsize(os.path.join(p1, f))
+                            for f in files])
+                entries += [(os.path.getmtime(p1), p1, size,
+                             self.linked_marker in files)]
+        return entries
+
+    def _evict(self, keep=None):
+
+        if self._max_size is None:
+            return
+
+        entries = sorted(self._entries())
+        size = sum([t[2] for t in entries]) / 1E6
+
+        for mtime, path, nbytes, linked in entries:
+            if size <= self._max_size:
+                break
+            if os.path.basename(path) == keep or linked:
+                continue
+
+            if self._logger is not None:
+                self._logger.debug('Evicting %s from product cache' % path)
+            shutil.rmtree(path, ignore_errors=True)
+            size -= nbytes / 1E6
+
+
+class ProductManifest(object):
+    """Record of the keys of the data products in a working
+    directory.  This is used to decide whether an existing product is
+    consistent with the current configuration and to fingerprint
+    products by their provenance when they are used as inputs of
+    subsequent steps.  Updates are serialized with a lock such that
+    the manifest can be shared by steps running in separate
+    threads."""
+
+    def __init__(self, filename):
+        self._filename = filename
+        self._keys = {}
+        self._lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        with self._lock:
+            if os.path.isfile(self._filename):
+                with open(self._filename, 'r') as f:
+                    self._keys = yaml.load(f) or {}
+            else:
+                self._keys = {}
+
+    def save(self):
+        with self._lock:
+            with open(self._filename, 'w') as f:
+                yaml.dump(self._keys, f, default_flow_style=False)
+
+    def get(self, path):
+        with self._lock:
+            return self._keys.get(os.path.basename(path), None)
+
+    def set(self, path, key):
+        with self._lock:
+            self._keys[os.path.basename(path)] = key
+            self.save()
+
+    def remove(self, path):
+        with self._lock:
+            if self._keys.pop(os.path.basename(path), None) is not None:
+                self.save()
+
+    def fingerprints(self):
+        """Return a dictionary of provenance fingerprints keyed by
+        the path of each product."""
+
+        workdir = os.path.dirname(self._filename)
+        with self._lock:
+            return dict([(os.path.join(workdir, k), 'key:' + v)
+                         for k, v in self._keys.items()])
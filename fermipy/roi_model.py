@@ -176,6 +176,11 @@ def create_model_name(src):
 
 class Model(object):
     """Base class for source objects."""
+
+    # Keys of the source dictionary whose values are computed on
+    # demand by calling _lazy_fn (see set_lazy)
+    _lazy_keys = frozenset()
+    _lazy_fn = None
     
     def __init__(self,name,data=None,
                  spectral_pars=None,
@@ -216,11 +221,22 @@ class Model(object):
         
         
     def __contains__(self,key):
-        return key in self._data
+        # Deferred fields are not computed by membership tests
+        return key in self._data or key in self._lazy_keys
 
     def __getitem__(self,key):
+        if key in self._lazy_keys:
+            self.eval_lazy()
         return self._data[key]
 
+    def __getstate__(self):
+        # Pending lazy fields are not propagated to copies of the
+        # source
+        d = self.__dict__.copy()
+        d.pop('_lazy_keys',None)
+        d.pop('_lazy_fn',None)
+        return d
+
     def __setitem__(self,key,value):
         self._data[key]=value
 
@@ -266,6 +282,35 @@ class Model(object):
     def update_data(self,d):
         self._data = merge_dict(self._data,d,add_new_keys=True)
 
+    @property
+    def lazy(self):
+        """Return True if the source has fields that have not yet
+        been computed."""
+        return self._lazy_fn is not None
+
+    def set_lazy(self,keys=None,fn=None):
+        """Defer the computation of the source fields in keys until
+        they are first accessed.  fn is a function with no arguments
+        that returns a dictionary with the values of the deferred
+        fields.  Calling this method without arguments discards any
+        pending fields."""
+
+        if fn is None:
+            self._lazy_keys = frozenset()
+            self._lazy_fn = None
+        else:
+            self._lazy_keys = frozenset(keys)
+            self._lazy_fn = fn
+
+    def eval_lazy(self):
+        """Compute any pending fields of the source."""
+
+        fn = self._lazy_fn
+        if fn is None:
+            return
+        self.set_lazy()
+        self.update_data(fn())
+
     def update(self,m):
 
         if 'SpectrumType' in m and self['SpectrumType'] != m['SpectrumType']:
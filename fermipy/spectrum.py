@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class SpectralFunction(object):
+    """Base class for spectral models that can be evaluated without
+    the ScienceTools.  Parameter definitions follow the conventions of
+    the corresponding pyLikelihood functions with the exception that
+    the reference energy (Scale/Eb) is held fixed and passed
+    separately from the other parameters.  Energies are in MeV.
+
+    This class is abstract.  Subclasses define the static methods
+    _eval_dfde(x,params,scale) and _eval_dfde_deriv(x,params,scale)
+    that evaluate the differential flux and its derivatives with
+    respect to each parameter."""
+
+    param_names = []
+    defaults = []
+
+    # Indices of parameters that are fit in log10 space
+    log_params = []
+
+    def __init__(self, params=None, scale=1000.):
+        if not hasattr(self, '_eval_dfde') or \
+                not hasattr(self, '_eval_dfde_deriv'):
+            raise TypeError('Spectral function %s does not define '
+                            '_eval_dfde and _eval_dfde_deriv.' %
+                            self.__class__.__name__)
+
+        if params is None:
+            params = self.defaults
+        self._params = np.array(params, dtype=float)
+        self._scale = scale
+
+    @property
+    def params(self):
+        return self._params
+
+    @property
+    def scale(self):
+        return self._scale
+
+    def dfde(self, x):
+        """Evaluate the differential flux at energy x."""
+        return self._eval_dfde(np.array(x, dtype=float), self._params,
+                               self._scale)
+
+    def dfde_deriv(self, x):
+        """Evaluate the derivatives of the differential flux with
+        respect to each parameter at energy x.  Returns an array
+        with dimension (nparams,len(x))."""
+        x = np.array(x, dtype=float, ndmin=1)
+        return self._eval_dfde_deriv(x, self._params, self._scale)
+
+    def e2dfde(self, x):
+        x = np.array(x, dtype=float)
+        return x ** 2 * self.dfde(x)
+
+    def flux(self, emin, emax, npt=50):
+        """Evaluate the integral flux between emin and emax."""
+        x = np.logspace(np.log10(emin), np.log10(emax), npt)
+        return np.trapz(self.dfde(x) * x, np.log(x))
+
+    def eflux(self, emin, emax, npt=50):
+        """Evaluate the integral energy flux between emin and emax."""
+        x = np.logspace(np.log10(emin), np.log10(emax), npt)
+        return np.trapz(self.dfde(x) * x ** 2, np.log(x))
+
+
+class PowerLaw(SpectralFunction):
+    """dN/dE = Prefactor * (E/Scale)^Index"""
+
+    param_names = ['Prefactor', 'Index']
+    defaults = [1E-12, -2.0]
+    log_params = [0]
+
+    @staticmethod
+    def _eval_dfde(x, params, scale):
+        return params[0] * (x / scale) ** params[1]
+
+    @staticmethod
+    def _eval_dfde_deriv(x, params, scale):
+        f1 = (x / scale) ** params[1]
+        return np.array([f1, params[0] * f1 * np.log(x / scale)])
+
+
+class LogParabola(SpectralFunction):
+    """dN/dE = norm * (E/Eb)^-(alpha + beta*ln(E/Eb))"""
+
+    param_names = ['norm', 'alpha', 'beta']
+    defaults = [1E-12, 2.0, 0.0]
+    log_params = [0]
+
+    @staticmethod
+    def _eval_dfde(x, params, scale):
+        lx = np.log(x / scale)
+        return params[0] * np.exp(-(params[1] + params[2] * lx) * lx)
+
+    @staticmethod
+    def _eval_dfde_deriv(x, params, scale):
+        lx = np.log(x / scale)
+        f1 = np.exp(-(params[1] + params[2] * lx) * lx)
+        f = params[0] * f1
+        return np.array([f1, -f * lx, -f * lx ** 2])
+
+
+class PLSuperExpCutoff(SpectralFunction):
+    """dN/dE = Prefactor * (E/Scale)^Index1 * exp(-(E/Cutoff)^Index2)"""
+
+    param_names = ['Prefactor', 'Index1', 'Cutoff', 'Index2']
+    defaults = [1E-12, -2.0, 1E4, 1.0]
+    log_params = [0, 2]
+
+    @staticmethod
+    def _eval_dfde(x, params, scale):
+        return (params[0] * (x / scale) ** params[1] *
+                np.exp(-(x / params[2]) ** params[3]))
+
+    @staticmethod
+    def _eval_dfde_deriv(x, params, scale):
+        xc = (x / params[2]) ** params[3]
+        f1 = (x / scale) ** params[1] * np.exp(-xc)
+        f = params[0] * f1
+        return np.array([f1,
+                         f * np.log(x / scale),
+                         f * xc * params[3] / params[2],
+                         -f * xc * np.log(x / params[2])])
+
+
+def create_spectrum(spectrum_type, params=None, scale=1000.):
+    """Create a spectral function object from the name of its
+    pyLikelihood spectrum type."""
+
+    spectra = {'PowerLaw': PowerLaw,
+               'LogParabola': LogParabola,
+               'PLSuperExpCutoff': PLSuperExpCutoff}
+
+    if not spectrum_type in spectra:
+        raise Exception('Unrecognized spectrum type: %s' % spectrum_type)
+
+    return spectra[spectrum_type](params, scale)
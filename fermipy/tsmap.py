@@ -0,0 +1,300 @@
+import os
+import numpy as np
+import astropy.io.fits as pyfits
+
+import fermipy.config
+import fermipy.defaults as defaults
+import fermipy.utils as utils
+from fermipy.utils import Map
+from fermipy.logger import Logger
+from fermipy.logger import logLevel as ll
+
+
+def powerlaw_weights(energies, index, scale=1000.):
+    """Compute the weights that map the planes of a source map
+    (defined at the energy bin edges) onto the counts in each energy
+    bin for a power-law spectrum with unit prefactor.  The integral
+    over each bin is evaluated with the trapezoidal rule in log(E).
+
+    Parameters
+    ----------
+
+    energies : array
+        Energy bin edges in log10(E/MeV).
+
+    index : float
+        Spectral index of the power-law (positive for falling
+        spectra).
+
+    Returns
+    -------
+
+    wlo, whi : array
+        Weights of the lower and upper edge of each bin.
+    """
+
+    egy = 10**np.array(energies)
+    dlne = np.log(egy[1:]/egy[:-1])
+    w = egy*(egy/scale)**(-index)
+    return 0.5*dlne*w[:-1], 0.5*dlne*w[1:]
+
+
+def fit_amplitude(counts, background, model, max_iter=20, tol=1E-4):
+    """Find the amplitudes that maximize the Poisson likelihood of
+    counts given the model background + amplitude*model.  The fit is
+    vectorized over the first dimension of model such that each row
+    is fit independently.  Amplitudes are constrained to be
+    non-negative.
+
+    Parameters
+    ----------
+
+    counts : array
+        Flattened vector of observed counts.
+
+    background : array
+        Flattened vector of background model counts.
+
+    model : array
+        2D array of test source model counts with dimension (M,N)
+        where M is the number of test models and N is the size of the
+        counts vector.
+
+    Returns
+    -------
+
+    amplitude : array
+        Best-fit amplitude for each test model.
+
+    ts : array
+        Test statistic for each test model.
+    """
+
+    c = counts[np.newaxis, :]
+    b = background[np.newaxis, :]
+    m = model
+
+    # Gradient of the log-likelihood at zero amplitude.  Models with a
+    # negative gradient have their maximum at the boundary.
+    bpos = np.where(b > 0, b, 1E-30)
+    g0 = np.sum(m*(c/bpos - 1.0), axis=1)
+    amp = np.zeros(m.shape[0])
+    msk = g0 > 0
+
+    msum = np.sum(m, axis=1)
+    excess = np.sum(counts - background)
+    amp[msk] = np.maximum(excess/msum[msk], 1E-3)
+
+    for i in range(max_iter):
+
+        if not np.any(msk):
+            break
+
+        mu = b + amp[:, np.newaxis]*m
+        mu = np.where(mu > 0, mu, 1E-30)
+        g = np.sum(m*(c/mu - 1.0), axis=1)
+        h = np.sum(m**2*c/mu**2, axis=1)
+
+        step = np.zeros(amp.shape)
+        hmsk = msk & (h > 0)
+        step[hmsk] = g[hmsk]/h[hmsk]
+
+        # Keep the amplitude positive by damping steps that would
+        # cross zero
+        amp_new = amp + step
+        amp_new = np.where(amp_new < 0.1*amp, 0.1*amp, amp_new)
+        converged = np.abs(amp_new - amp) < tol*np.maximum(amp, 1E-3)
+        amp[msk] = amp_new[msk]
+        msk &= ~converged
+
+    mu = b + amp[:, np.newaxis]*m
+    cm = np.where(c > 0, c, 0.0)
+    ratio = np.where(mu > 0, mu/bpos, 1.0)
+    ts = 2.0*np.sum(cm*np.log(ratio) - amp[:, np.newaxis]*m, axis=1)
+    ts[amp <= 0] = 0.0
+
+    return amp, np.maximum(ts, 0.0)
+
+
+def extract_cutout(data, kernel, ix, iy):
+    """Extract the region of a cube (nebin,ny,nx) overlapping with a
+    kernel of shape (nebin,nk,nk) centered on pixel (ix,iy).  Returns
+    the data cutout and the matching slice of the kernel."""
+
+    nk = kernel.shape[-1]
+    nr = (nk - 1)//2
+    ny, nx = data.shape[1:]
+
+    x0, x1 = max(ix - nr, 0), min(ix + nr + 1, nx)
+    y0, y1 = max(iy - nr, 0), min(iy + nr + 1, ny)
+
+    sd = (slice(None), slice(y0, y1), slice(x0, x1))
+    sk = (slice(None), slice(y0 - iy + nr, y1 - iy + nr),
+          slice(x0 - ix + nr, x1 - ix + nr))
+
+    return data[sd], kernel[sk]
+
+
+class TSCubeGenerator(fermipy.config.Configurable):
+    """This class generates a cube of TS values versus position and
+    spectral index of a point-source test source.  The counts,
+    background model and PSF kernel of each analysis component are
+    extracted once and shared between all test indices.  Changing
+    the spectral index of the test source only changes the weights
+    applied to the energy planes of the kernel.  For each position
+    and index the test source amplitude is fit with a Newton
+    iteration on the Poisson likelihood keeping the background model
+    fixed."""
+
+    defaults = dict(defaults.tsmap.items(),
+                    fileio=defaults.fileio,
+                    logging=defaults.logging)
+
+    def __init__(self, config, gta, **kwargs):
+        fermipy.config.Configurable.__init__(self, config, **kwargs)
+        self._gta = gta
+        self.logger = Logger.get(self.__class__.__name__,
+                                 self.config['fileio']['logfile'],
+                                 ll(self.config['logging']['verbosity']))
+
+    def make_kernel(self, c):
+        """Create the PSF kernel for an analysis component.  The
+        kernel has one plane for each energy bin edge and is
+        normalized to unit integral in each plane."""
+
+        radius = self.config['max_kernel_radius']
+        nr = int(np.ceil(radius/c.binsz))
+        nr = min(nr, c.npix)
+        k = utils.make_psf_kernel(c._psf, 2*nr + 1, c.binsz, 0.0, 0.0)
+        k *= np.radians(c.binsz)**2
+        return k
+
+    def run(self, prefix, **kwargs):
+
+        index = kwargs.get('index', self.config['index'])
+        index = np.array(index, ndmin=1, dtype=float)
+        exclude = kwargs.get('exclude', None)
+
+        gta = self._gta
+        skywcs = gta._skywcs
+        npix = gta.npix
+        nidx = len(index)
+
+        self.logger.info('Generating TS cube for %i spectral indices' % nidx)
+
+        # Extract the data and kernels for each component.  These are
+        # shared by all spectral indices.
+        cdata = []
+        for c in gta.components:
+
+            counts = c.counts_map().counts.astype(float)
+            bkg = c.model_counts_map(exclude=exclude).counts.astype(float)
+            kernel = self.make_kernel(c)
+            exp = c._psf.exp
+
+            wlo = np.zeros((nidx, c.enumbins))
+            whi = np.zeros((nidx, c.enumbins))
+            for j, idx in enumerate(index):
+                wlo[j], whi[j] = powerlaw_weights(c.energies, idx)
+
+            wlo *= exp[np.newaxis, :-1]
+            whi *= exp[np.newaxis, 1:]
+            cdata += [{'counts': counts, 'bkg': bkg, 'kernel': kernel,
+                       'wlo': wlo, 'whi': whi}]
+
+        ts = np.zeros((nidx, npix, npix))
+        amplitude = np.zeros((nidx, npix, npix))
+        npred = np.zeros((nidx, npix, npix))
+
+        xpix = np.arange(npix)[np.newaxis, :]*np.ones((npix, npix))
+        ypix = np.arange(npix)[:, np.newaxis]*np.ones((npix, npix))
+        skydir = utils.pix_to_skydir(np.ravel(xpix), np.ravel(ypix), skywcs)
+
+        for c, cd in zip(gta.components, cdata):
+            ix, iy = utils.skydir_to_pix(skydir, c._skywcs)
+            cd['ix'] = np.round(ix).astype(int)
+            cd['iy'] = np.round(iy).astype(int)
+
+        for i in range(npix*npix):
+
+            cs = []
+            bs = []
+            ms = []
+
+            for cd in cdata:
+                ix, iy = cd['ix'][i], cd['iy'][i]
+                ny, nx = cd['counts'].shape[1:]
+                if ix < 0 or iy < 0 or ix >= nx or iy >= ny:
+                    continue
+
+                cc, kc = extract_cutout(cd['counts'], cd['kernel'], ix, iy)
+                bc, kc = extract_cutout(cd['bkg'], cd['kernel'], ix, iy)
+
+                # Reweight the kernel planes for each spectral index
+                mc = (cd['wlo'][:, :, np.newaxis, np.newaxis]*
+                      kc[np.newaxis, :-1, ...] +
+                      cd['whi'][:, :, np.newaxis, np.newaxis]*
+                      kc[np.newaxis, 1:, ...])
+
+                cs += [np.ravel(cc)]
+                bs += [np.ravel(bc)]
+                ms += [mc.reshape((nidx, -1))]
+
+            if not cs:
+                continue
+
+            cs = np.concatenate(cs)
+            bs = np.concatenate(bs)
+            ms = np.concatenate(ms, axis=1)
+            msum = np.sum(ms, axis=1)
+            msum[msum <= 0] = 1.0
+
+            amp, tsv = fit_amplitude(cs, bs, ms/msum[:, np.newaxis])
+
+            ts[:, i//npix, i % npix] = tsv
+            npred[:, i//npix, i % npix] = amp
+            amplitude[:, i//npix, i % npix] = amp/msum
+
+        imax = np.argmax(ts, axis=0)
+        ts_max = np.max(ts, axis=0)
+        best_index = index[imax]
+
+        if prefix:
+            name = '%s_tscube_index' % prefix
+        else:
+            name = 'tscube_index'
+
+        outfile = os.path.join(self.config['fileio']['workdir'],
+                               '%s.fits' % name)
+
+        self.logger.info('Writing %s' % outfile)
+        self.write_fits(outfile, index, ts, amplitude, ts_max, best_index,
+                        skywcs)
+
+        o = {'name': name,
+             'file': os.path.basename(outfile),
+             'wcs': skywcs,
+             'index': index,
+             'ts': ts,
+             'amplitude': amplitude,
+             'npred': npred,
+             'ts_max': Map(ts_max, skywcs),
+             'best_index': Map(best_index, skywcs)}
+
+        return o
+
+    @staticmethod
+    def write_fits(outfile, index, ts, amplitude, ts_max, best_index, wcs):
+
+        header = wcs.to_header()
+        hdu_ts = pyfits.PrimaryHDU(ts, header=header)
+        hdu_amp = pyfits.ImageHDU(amplitude, header=header, name='AMPLITUDE')
+        hdu_tsmax = pyfits.ImageHDU(ts_max, header=header, name='TS_MAX')
+        hdu_index = pyfits.ImageHDU(best_index, header=header,
+                                    name='BEST_INDEX')
+        col = pyfits.Column(name='INDEX', format='D', array=index)
+        hdu_tab = pyfits.BinTableHDU.from_columns([col], name='INDICES')
+
+        hdulist = pyfits.HDUList([hdu_ts, hdu_amp, hdu_tsmax, hdu_index,
+                                  hdu_tab])
+        hdulist.writeto(outfile, clobber=True)
@@ -601,11 +601,17 @@ def rebin_map(k,nebin,npix,rebin):
 
 
 def make_srcmap(skydir,psf,spatial_model,sigma,npix=500,xpix=0.0,ypix=0.0,cdelt=0.01,rebin=1):
-    """Compute the source map for a given spatial model."""
+    """Compute the source map for a given spatial model.  xpix and
+    ypix are the offsets of the source from the center of the map in
+    pixels of size cdelt (i.e. before oversampling by rebin)."""
     
     energies = psf.energies
     nebin = len(energies)
 
+    # Offsets on the oversampled grid
+    xpix = xpix*rebin
+    ypix = ypix*rebin
+
     if spatial_model == 'GaussianSource':
         k = make_cgauss_kernel(psf,sigma,npix*rebin,cdelt/rebin,xpix,ypix)
     elif spatial_model == 'DiskSource':